@@ -0,0 +1,443 @@
+"""
+계획서 생성 HTTP API 서버
+
+학교 정보 시스템 같은 다른 시스템이 Streamlit 화면 없이 계획서를 요청할 수 있도록
+generation_core 엔진을 FastAPI로 노출합니다. Streamlit에 의존하지 않으며 세션별 다시 실행도 없습니다.
+- POST /steps/{step}: 1~4단계 내용 생성
+- POST /express: 1~4단계 빠른 초안 생성
+- POST /plans: 전체 계획서 생성 작업 시작 (작업 ID 반환)
+  GET /plans/{id}: 작업 상태와 계획서, GET /plans/{id}/events: 진행 이벤트(SSE), GET /plans/{id}/xlsx: Excel
+- POST /lessons/stream: 차시별 계획을 묶음이 끝날 때마다 SSE로 전달
+- POST /export/xlsx: 계획서 데이터를 Excel로 변환
+모든 호출은 Streamlit 앱과 같은 엔진 이벤트 루프, 모델 클라이언트, 스케줄러, 비용 예산을 사용하고,
+벡터 인덱스도 같은 디스크 인덱스를 메모리 매핑으로 엽니다.
+모든 요청(/health 제외)은 X-API-Key 헤더로 인증하며, 키에 연결된 클라이언트 이름이
+스케줄러의 공정 순서와 세션 예산 단위가 됩니다. 클라이언트마다 동시에 실행하는 /plans 작업 수도 제한합니다.
+작업 ID는 계획서 ID이기도 하므로 완성된 계획서를 Streamlit 앱(?plan=<id>)에서 이어서 검토할 수 있습니다.
+진행 중인 작업 목록은 프로세스 메모리에 있으므로, 작업 상태와 이벤트는 작업을 만든 프로세스에서 조회합니다.
+
+사용 예:
+    OPENAI_API_KEY=... SEOHS_API_KEYS=school-info:<키> python api_server.py --port 8000 --rpm 300
+"""
+import os
+import hmac
+import json
+import time
+import asyncio
+import argparse
+import threading
+from urllib.parse import quote
+
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from langchain_openai import OpenAIEmbeddings
+
+import llm_scheduler
+from plan_export import export_filename, render_xlsx
+from plan_model import json_default
+from plan_storage import load_plan, new_plan_id, save_plan
+from vector_index import current_index_version, open_shared_vector_store
+from ingestion import list_document_paths, load_documents
+from usage_budget import BudgetExceededError
+from generation_core import (
+    agenerate_express, agenerate_lessons, agenerate_step, apply_step_content, run_async
+)
+
+###############################################################################
+# 0. 설정
+###############################################################################
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+JOB_HISTORY = 200  # 메모리에 남겨 둘 작업 수 (끝난 작업부터 정리)
+MAX_JOBS_PER_CLIENT = int(os.environ.get("SEOHS_API_MAX_JOBS", "2"))  # 클라이언트별 동시 실행 작업 수
+MAX_TOTAL_HOURS = 68  # 요청 하나가 생성할 수 있는 최대 차시 (Streamlit 앱의 입력 상한과 같음)
+MAX_CHUNK_SIZE = 20   # 차시 묶음 하나의 최대 차시 수
+
+
+def parse_api_keys(value):
+    """'클라이언트:키,클라이언트:키' 형식의 설정을 {키: 클라이언트} dict로 변환"""
+    keys = {}
+    for item in value.split(","):
+        client_id, _, key = item.strip().partition(":")
+        if client_id and key:
+            keys[key] = client_id
+    return keys
+
+
+# 설정된 키가 없으면 모든 요청을 거부
+API_KEYS = parse_api_keys(os.environ.get("SEOHS_API_KEYS", ""))
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+app = FastAPI(title="학교자율시간 계획서 생성 API")
+
+###############################################################################
+# 1. 공유 벡터 스토어
+###############################################################################
+_vector_store = None
+_vector_store_version = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """
+    현재 인덱스 버전의 벡터 스토어 (프로세스에서 하나를 공유).
+    문서가 추가되어 인덱스 버전이 바뀌면 다음 요청에서 새 버전을 엽니다. 문서가 없으면 None
+    """
+    global _vector_store, _vector_store_version
+    version = current_index_version()
+    with _vector_store_lock:
+        if _vector_store is None or version != _vector_store_version:
+            file_paths = list_document_paths()
+            if file_paths:
+                embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+                _vector_store, _ = open_shared_vector_store(embeddings, file_paths, load_documents)
+                _vector_store_version = current_index_version()
+        return _vector_store
+
+
+async def shared_vector_store():
+    return await asyncio.to_thread(get_vector_store)
+
+###############################################################################
+# 2. 요청 형식과 공통 처리
+###############################################################################
+class PlanRequest(BaseModel):
+    """계획서 데이터 (1단계 입력 항목과 이미 생성한 단계의 결과)"""
+    data: dict
+
+
+class ExpressRequest(PlanRequest):
+    example: dict | None = None  # 참고할 이전 계획서 (있으면 검색 대신 예시로 사용)
+
+
+class LessonRequest(PlanRequest):
+    total_hours: int | None = Field(None, ge=1, le=MAX_TOTAL_HOURS)  # 기본값은 data의 total_hours
+    chunk_size: int = Field(10, ge=1, le=MAX_CHUNK_SIZE)
+
+
+def lesson_hours(request):
+    """요청의 총 차시 (없으면 계획서 데이터의 값, 그것도 없으면 30). 범위를 벗어나면 422"""
+    total_hours = request.total_hours or request.data.get('total_hours', 30)
+    if isinstance(total_hours, bool) or not isinstance(total_hours, int) or not 1 <= total_hours <= MAX_TOTAL_HOURS:
+        raise HTTPException(status_code=422, detail=f"총 차시는 1~{MAX_TOTAL_HOURS} 사이의 정수여야 합니다.")
+    return total_hours
+
+
+def client_session(x_api_key: str | None = Header(None)):
+    """
+    X-API-Key를 확인하고 요청한 시스템의 공정 순서·예산 단위 세션 ID를 반환합니다. (FastAPI 의존성)
+    클라이언트 이름은 요청 헤더가 아니라 서버에 설정된 키에서 정해집니다.
+    """
+    if x_api_key:
+        for key, client_id in API_KEYS.items():
+            if hmac.compare_digest(key.encode("utf-8"), x_api_key.encode("utf-8")):
+                return f"api:{client_id}"
+    raise HTTPException(status_code=401, detail="유효한 API 키가 필요합니다.")
+
+
+async def generate(coro_fn, *args, **kwargs):
+    """엔진 코루틴을 실행하고 실패를 HTTP 오류로 바꿈"""
+    try:
+        return await run_async(coro_fn, *args, **kwargs)
+    except BudgetExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        # json.JSONDecodeError 포함: 상위 모델로 다시 생성해도 응답 구조가 맞지 않음
+        raise HTTPException(status_code=502, detail=f"모델 응답을 처리하지 못했습니다: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"내용 생성 중 오류가 발생했습니다: {e}")
+
+
+def sse_message(event):
+    """이벤트 dict를 SSE 메시지로 변환 (event 이름은 이벤트 종류)"""
+    payload = json.dumps(event, ensure_ascii=False, default=json_default)
+    return f"event: {event['type']}\ndata: {payload}\n\n"
+
+
+def xlsx_response(data, fallback):
+    filename = quote(f"{export_filename(data, fallback)}.xlsx")
+    return Response(
+        content=render_xlsx(data),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"}
+    )
+
+###############################################################################
+# 3. 단계 생성
+###############################################################################
+@app.get("/health")
+async def health():
+    return {"status": "ok", "index_version": current_index_version()}
+
+
+@app.post("/steps/{step}")
+async def generate_step(step: int, request: PlanRequest, session_id: str = Depends(client_session)):
+    """
+    1~4단계 내용을 생성합니다.
+
+    Returns:
+        dict: {"step", "content", "data"(생성 결과를 반영한 계획서 데이터)}
+    """
+    if step not in (1, 2, 3, 4):
+        raise HTTPException(status_code=404, detail=f"{step}단계는 생성할 수 없습니다.")
+    llm_scheduler.session_id_var.set(session_id)
+
+    content = await generate(agenerate_step, step, request.data, await shared_vector_store())
+    apply_step_content(step, request.data, content)
+    return {"step": step, "content": content, "data": request.data}
+
+
+@app.post("/express")
+async def generate_express(request: ExpressRequest, session_id: str = Depends(client_session)):
+    """1~4단계 빠른 초안을 한 번의 호출로 생성합니다. {"contents": {단계: 내용}, "data"}"""
+    llm_scheduler.session_id_var.set(session_id)
+
+    contents = await generate(agenerate_express, request.data, await shared_vector_store(), request.example)
+    for step, content in contents.items():
+        apply_step_content(step, request.data, content)
+    return {"contents": contents, "data": request.data}
+
+###############################################################################
+# 4. 전체 계획서 생성 작업
+###############################################################################
+class PlanJob:
+    """전체 계획서(1~4단계와 차시별 계획) 생성 작업의 상태와 진행 이벤트"""
+
+    def __init__(self, data, session_id, chunk_size=10):
+        self.id = new_plan_id()
+        self.data = dict(data)
+        self.session_id = session_id
+        self.chunk_size = chunk_size
+        self.status = "queued"  # queued, running, done, failed
+        self.error = None
+        self.events = []
+        self.queue_position = None  # 최근 waiting 이벤트의 대기 순서 (이벤트 기록에는 남기지 않음)
+        self.created_at = time.time()
+        self.finished_at = None
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def emit(self, event):
+        """
+        이벤트를 기록하고 기다리는 구독자를 깨움.
+        waiting 이벤트는 대기하는 동안 계속 오므로 기록하지 않고 최근 대기 순서만 바꿉니다.
+        """
+        if event["type"] == "waiting":
+            self.queue_position = event["position"]
+        else:
+            self.queue_position = None
+            self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_event(self, seen, position):
+        """seen개 이후의 이벤트가 생기거나 대기 순서가 position에서 바뀔 때까지 기다림"""
+        changed = self._changed
+        if len(self.events) <= seen and self.queue_position == position:
+            await changed.wait()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "queue_position": self.queue_position,
+            "data": self.data
+        }
+
+
+_jobs = {}
+
+
+def _running_jobs(session_id):
+    """클라이언트의 아직 끝나지 않은 작업 수"""
+    return sum(1 for job in _jobs.values() if job.session_id == session_id and not job.finished)
+
+
+def _client_job(plan_id, session_id):
+    """
+    이 프로세스의 작업 중 요청한 클라이언트가 만든 작업. 작업 목록에 없으면 None
+    다른 클라이언트의 작업이면 저장된 계획서로 넘어가지 않도록 404
+    """
+    job = _jobs.get(plan_id)
+    if job and job.session_id != session_id:
+        raise HTTPException(status_code=404, detail="계획서를 찾을 수 없습니다.")
+    return job
+
+
+def _remember(job):
+    """작업을 등록하고, 기록이 많으면 끝난 작업부터 정리"""
+    _jobs[job.id] = job
+    for job_id in [job_id for job_id, old in _jobs.items() if old.finished][:max(0, len(_jobs) - JOB_HISTORY)]:
+        del _jobs[job_id]
+
+
+async def run_plan_job(job):
+    """1~4단계를 차례로 생성한 뒤 차시별 계획을 생성하고, 단계마다 계획서 저장소에 저장"""
+    llm_scheduler.session_id_var.set(job.session_id)
+    llm_scheduler.priority_var.set(llm_scheduler.PRIORITY_BULK)
+    job.status = "running"
+    try:
+        vector_store = await shared_vector_store()
+        for step in range(1, 5):
+            job.emit({"type": "step_started", "step": step})
+            content = await run_async(agenerate_step, step, job.data, vector_store, on_event=job.emit)
+            apply_step_content(step, job.data, content)
+            await asyncio.to_thread(save_plan, job.id, step + 1, job.data, owner=job.session_id)
+            job.emit({"type": "step_done", "step": step, "content": content})
+
+        total_hours = job.data.get('total_hours', 30)
+        job.data['lesson_plans'] = await run_async(
+            agenerate_lessons, total_hours, job.data, job.chunk_size, on_event=job.emit
+        )
+        await asyncio.to_thread(save_plan, job.id, 6, job.data, owner=job.session_id)
+        job.status = "done"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+        job.emit({"type": "job_" + job.status, "error": job.error})
+
+
+@app.post("/plans", status_code=202)
+async def create_plan(request: LessonRequest, session_id: str = Depends(client_session)):
+    """전체 계획서 생성 작업을 시작하고 작업 ID를 반환합니다. 클라이언트의 실행 중 작업이 많으면 429"""
+    if _running_jobs(session_id) >= MAX_JOBS_PER_CLIENT:
+        raise HTTPException(
+            status_code=429,
+            detail=f"동시에 실행할 수 있는 작업은 {MAX_JOBS_PER_CLIENT}개입니다. 진행 중인 작업이 끝난 뒤 다시 요청하세요."
+        )
+    total_hours = lesson_hours(request)
+    job = PlanJob(request.data, session_id, request.chunk_size)
+    job.data['total_hours'] = total_hours
+    _remember(job)
+    job._task = asyncio.create_task(run_plan_job(job))
+    return {"id": job.id, "status": job.status}
+
+
+@app.get("/plans/{plan_id}")
+async def get_plan(plan_id: str, session_id: str = Depends(client_session)):
+    """작업 상태와 계획서. 이 프로세스의 작업 목록에 없으면 이 클라이언트가 만든 저장된 계획서를 반환"""
+    job = _client_job(plan_id, session_id)
+    if job:
+        return job.summary()
+
+    step, data = await asyncio.to_thread(load_plan, plan_id, owner=session_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="계획서를 찾을 수 없습니다.")
+    return {"id": plan_id, "status": "saved", "step": step, "data": data}
+
+
+@app.get("/plans/{plan_id}/events")
+async def plan_events(plan_id: str, session_id: str = Depends(client_session)):
+    """
+    작업의 진행 이벤트를 처음부터 SSE로 전달하고, 작업이 끝나면 스트림을 닫습니다.
+    대기 순서(waiting)는 기록하지 않으므로 바뀔 때마다 최근 값만 전달합니다.
+    """
+    job = _client_job(plan_id, session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="진행 중인 작업을 찾을 수 없습니다.")
+
+    async def stream():
+        seen = 0
+        position = None
+        while True:
+            while seen < len(job.events):
+                yield sse_message(job.events[seen])
+                seen += 1
+            if job.finished:
+                return
+            if job.queue_position != position:
+                position = job.queue_position
+                if position:
+                    yield sse_message({"type": "waiting", "position": position})
+            await job.wait_for_event(seen, position)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/plans/{plan_id}/xlsx")
+async def plan_xlsx(plan_id: str, session_id: str = Depends(client_session)):
+    """완성된 계획서를 Excel 파일로 내려받음"""
+    job = _client_job(plan_id, session_id)
+    if job and not job.finished:
+        raise HTTPException(status_code=409, detail="계획서를 생성하는 중입니다.")
+    if job:
+        data = job.data
+    else:
+        _, data = await asyncio.to_thread(load_plan, plan_id, owner=session_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="계획서를 찾을 수 없습니다.")
+    return await asyncio.to_thread(xlsx_response, data, plan_id)
+
+###############################################################################
+# 5. 차시별 계획 스트리밍
+###############################################################################
+@app.post("/lessons/stream")
+async def stream_lessons(request: LessonRequest, session_id: str = Depends(client_session)):
+    """
+    차시별 계획을 묶음 단위로 생성하며 진행 이벤트를 SSE로 전달합니다.
+    묶음이 끝날 때마다 chunk_done 이벤트에 해당 차시들이 담기고, 마지막에 done 또는 error 이벤트를 보냅니다.
+    연결이 끊기면 남은 생성을 취소합니다.
+    """
+    total_hours = lesson_hours(request)
+
+    async def stream():
+        llm_scheduler.session_id_var.set(session_id)
+        llm_scheduler.priority_var.set(llm_scheduler.PRIORITY_BULK)
+        events = asyncio.Queue()
+        task = asyncio.ensure_future(
+            run_async(agenerate_lessons, total_hours, request.data, request.chunk_size, on_event=events.put_nowait)
+        )
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield sse_message(event)
+            if task.cancelled():
+                yield sse_message({"type": "error", "message": "생성이 취소되었습니다."})
+            elif task.exception():
+                yield sse_message({"type": "error", "message": str(task.exception())})
+            else:
+                yield sse_message({"type": "done", "lesson_plans": task.result()})
+        finally:
+            task.cancel()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+###############################################################################
+# 6. Excel 내보내기
+###############################################################################
+@app.post("/export/xlsx", dependencies=[Depends(client_session)])
+async def export_xlsx(request: PlanRequest):
+    """계획서 데이터를 Streamlit 앱의 내려받기와 같은 Excel 파일로 변환"""
+    return await asyncio.to_thread(xlsx_response, request.data, "plan")
+
+###############################################################################
+# 7. 명령줄 실행
+###############################################################################
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="계획서 생성 HTTP API 서버를 실행합니다.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--rpm", type=int, default=None, help="프로세스 전체 분당 API 요청 수")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="동시에 보낼 API 요청 수")
+    args = parser.parse_args()
+
+    settings = {"requests_per_minute": args.rpm, "max_concurrency": args.llm_concurrency}
+    settings = {key: value for key, value in settings.items() if value}
+    if settings:
+        llm_scheduler.configure(**settings)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
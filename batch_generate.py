@@ -0,0 +1,215 @@
+"""
+계획서 일괄 생성 스크립트
+
+1단계 입력 항목(학교급, 학년, 교과, 활동명, 요구사항, 차시, 학기)을 담은 CSV/JSON 명세를 읽어
+Streamlit 앱과 같은 generation_core 엔진으로 1~4단계와 차시별 계획 생성을 계획서마다 실행하고,
+결과를 JSON과 Excel로 저장합니다.
+
+- 여러 계획서를 동시에 처리하되 동시 처리 수(--concurrency)를 제한합니다.
+- 모든 API 호출은 llm_scheduler의 프로세스 전역 스케줄러를 거쳐 분당 요청 수(--rpm) 제한을 받습니다.
+- 단계와 차시 묶음마다 진행 상태를 저장하므로, 중단 후 같은 명령으로 다시 실행하면 이어서 진행합니다.
+
+사용 예:
+    OPENAI_API_KEY=... python batch_generate.py specs.csv ./batch_out --concurrency 4 --rpm 60
+
+출력 구조:
+    batch_out/work/<id>.json   진행 상태 (완료 단계, 완료 차시 묶음, 계획서 데이터)
+    batch_out/plans/<id>.json  완성된 계획서 (plan_export.py로 일괄 내보내기 가능)
+    batch_out/xlsx/<id>.xlsx   plan_export.render_xlsx로 만든 Excel 파일
+"""
+import os
+import re
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_openai import OpenAIEmbeddings
+
+import llm_scheduler
+from plan_export import render_xlsx
+from vector_index import open_shared_vector_store
+from ingestion import list_document_paths, load_documents
+from generation_core import agenerate_lesson_chunk, agenerate_step, apply_step_content, chunk_error_message, run_sync
+
+###############################################################################
+# 0. 설정
+###############################################################################
+REQUIRED_FIELDS = ["activity_name", "requirements", "grades", "subjects", "semester"]
+LIST_FIELDS = ["grades", "subjects", "semester"]
+CHUNK_SIZE = 10
+
+###############################################################################
+# 1. 명세 읽기
+###############################################################################
+def _split_list(value):
+    """'3학년, 4학년' 또는 '3학년|4학년' 같은 값을 리스트로 변환"""
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in re.split(r"[,;|]", value or "") if v.strip()]
+
+
+def load_specs(spec_path):
+    """
+    CSV 또는 JSON(객체 배열) 명세를 읽어 (id, 계획서 입력 dict) 리스트로 반환합니다.
+    id 열이 없으면 행 번호를 사용합니다.
+    """
+    if spec_path.lower().endswith(".json"):
+        with open(spec_path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(spec_path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    specs = []
+    for row_number, row in enumerate(rows, start=1):
+        data = {
+            'school_type': row.get('school_type') or "초등학교",
+            'grades': _split_list(row.get('grades')),
+            'subjects': _split_list(row.get('subjects')),
+            'activity_name': (row.get('activity_name') or "").strip(),
+            'requirements': (row.get('requirements') or "").strip(),
+            'total_hours': int(row.get('total_hours') or 34),
+            'weekly_hours': int(row.get('weekly_hours') or 1),
+            'semester': _split_list(row.get('semester')) or ["1학기"],
+        }
+        spec_id = re.sub(r"[^\w-]+", "_", str(row.get('id') or f"{row_number:04d}"))
+        specs.append((spec_id, data))
+    return specs
+
+###############################################################################
+# 2. 계획서 하나 생성 (단계별 저장 및 재개)
+###############################################################################
+def _write_json(path, payload):
+    """임시 파일에 쓴 뒤 교체하여 중단되더라도 파일이 깨지지 않도록 저장"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def run_plan(spec_id, spec, out_dir, vector_store):
+    """
+    명세 하나로 계획서를 생성합니다. 이미 끝난 단계와 차시 묶음은 건너뜁니다.
+
+    Returns:
+        str: "done", "skipped" 중 하나 (실패 시 예외 발생)
+    """
+    plan_path = os.path.join(out_dir, "plans", f"{spec_id}.json")
+    if os.path.exists(plan_path):
+        return "skipped"
+
+    # 계획서마다 별도 세션으로 공정 순서를 받고, 모든 호출은 일괄 우선순위로 실행
+    llm_scheduler.session_id_var.set(f"batch:{spec_id}")
+    llm_scheduler.priority_var.set(llm_scheduler.PRIORITY_BULK)
+
+    missing = [field for field in REQUIRED_FIELDS if not spec.get(field)]
+    if missing:
+        raise ValueError(f"필수 항목 누락: {', '.join(missing)}")
+
+    work_path = os.path.join(out_dir, "work", f"{spec_id}.json")
+    if os.path.exists(work_path):
+        with open(work_path, encoding="utf-8") as f:
+            state = json.load(f)
+    else:
+        state = {"data": dict(spec), "completed_steps": [], "completed_chunks": []}
+    data = state["data"]
+
+    # 1~4단계: Streamlit 앱과 같은 생성 엔진 호출 (실패하면 다음 실행에서 다시 시도)
+    for step in range(1, 5):
+        if step in state["completed_steps"]:
+            continue
+        try:
+            content = run_sync(agenerate_step, step, data, vector_store)
+        except Exception as e:
+            raise RuntimeError(f"{step}단계 생성 실패: {e}") from e
+        apply_step_content(step, data, content)
+        state["completed_steps"].append(step)
+        _write_json(work_path, state)
+
+    # 5단계: 차시 묶음 단위로 생성하고 묶음마다 저장
+    total_hours = data.get('total_hours', 30)
+    data.setdefault('lesson_plans', [])
+    for start in range(0, total_hours, CHUNK_SIZE):
+        if start in state["completed_chunks"]:
+            continue
+        end = min(start + CHUNK_SIZE, total_hours)
+        try:
+            data['lesson_plans'].extend(run_sync(agenerate_lesson_chunk, start, end, data))
+        except Exception as e:
+            raise RuntimeError(chunk_error_message(start, end, e)) from e
+        data['lesson_plans'].sort(key=lambda plan: int(plan['lesson_number']))
+        state["completed_chunks"].append(start)
+        _write_json(work_path, state)
+
+    # Excel 저장 후 완료 표시 (plans/<id>.json이 있으면 완료된 계획서)
+    with open(os.path.join(out_dir, "xlsx", f"{spec_id}.xlsx"), "wb") as f:
+        f.write(render_xlsx(data))
+    _write_json(plan_path, data)
+    os.remove(work_path)
+    return "done"
+
+###############################################################################
+# 3. 일괄 실행
+###############################################################################
+def open_vector_store():
+    """documents 폴더의 공유 인덱스를 엽니다 (Streamlit 앱, API 서버와 같은 인덱스). 문서가 없으면 None"""
+    file_paths = list_document_paths()
+    if not file_paths:
+        return None
+    embeddings = OpenAIEmbeddings(openai_api_key=os.environ.get("OPENAI_API_KEY"))
+    vector_store, _ = open_shared_vector_store(embeddings, file_paths, load_documents)
+    return vector_store
+
+
+def run_batch(spec_path, out_dir, concurrency=4, requests_per_minute=60):
+    """
+    명세 파일의 모든 계획서를 동시 처리 수 제한 안에서 생성합니다.
+
+    Returns:
+        dict: 완료/건너뜀/실패 집계와 소요 시간
+    """
+    for sub_dir in ("work", "plans", "xlsx"):
+        os.makedirs(os.path.join(out_dir, sub_dir), exist_ok=True)
+
+    llm_scheduler.configure(requests_per_minute=requests_per_minute, max_concurrency=concurrency)
+    vector_store = open_vector_store()
+    specs = load_specs(spec_path)
+
+    report = {"total": len(specs), "done": 0, "skipped": 0, "failed": []}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(run_plan, spec_id, spec, out_dir, vector_store): spec_id
+            for spec_id, spec in specs
+        }
+        for future in as_completed(futures):
+            spec_id = futures[future]
+            try:
+                report[future.result()] += 1
+                print(f"[완료] {spec_id}", flush=True)
+            except Exception as e:
+                report["failed"].append({"id": spec_id, "error": str(e)})
+                print(f"[실패] {spec_id}: {e}", flush=True)
+
+    report["seconds"] = round(time.perf_counter() - started, 1)
+    _write_json(os.path.join(out_dir, "batch_report.json"), report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="활동 명세(CSV/JSON)로 계획서를 일괄 생성합니다.")
+    parser.add_argument("spec_path", help="활동 명세 CSV 또는 JSON 파일")
+    parser.add_argument("out_dir", help="결과를 저장할 폴더 (다시 실행하면 이어서 진행)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 생성할 계획서 수")
+    parser.add_argument("--rpm", type=int, default=60, help="프로세스 전체 분당 API 요청 수")
+    args = parser.parse_args()
+
+    report = run_batch(args.spec_path, args.out_dir, args.concurrency, args.rpm)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
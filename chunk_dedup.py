@@ -0,0 +1,230 @@
+"""
+청크 중복 제거 모듈
+
+교육과정 문서는 같은 문단을 여러 곳에서 그대로 또는 조금만 바꿔 반복하므로,
+색인 전에 완전 중복과 유사 중복 청크를 걸러 임베딩 호출과 인덱스 크기를 줄이고,
+검색 결과에서도 겹치는 청크를 빼 프롬프트에 같은 내용이 두 번 들어가지 않게 합니다.
+- 완전 중복: 공백과 대소문자를 정규화한 본문의 해시가 같은 청크
+- 유사 중복: 글자 shingle 집합의 MinHash로 추정한 Jaccard 유사도가 기준 이상인 청크 (LSH로 후보만 비교)
+색인된 청크의 해시와 서명(DedupState)은 인덱스 버전과 함께 저장해, 문서를 추가할 때 기존 청크를 다시 읽지 않습니다.
+"""
+import os
+import re
+import zlib
+import hashlib
+
+import numpy as np
+
+###############################################################################
+# 0. 설정
+###############################################################################
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("SEOHS_NEAR_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 5        # 글자 단위 shingle 길이 (한국어는 단어보다 글자 단위가 안정적)
+NUM_PERM = 64           # MinHash 서명 길이
+LSH_BANDS = 16          # 밴드 수 (밴드당 4행: Jaccard 약 0.5 이상이면 후보가 될 확률이 높음)
+MIN_CHUNK_CHARS = 20    # 이보다 짧은 청크(제목, 쪽 번호 등)는 유사 중복 판단에서 제외
+
+# (a·x + b) mod p 형태의 해시 함수 NUM_PERM개 (x, a, b < 2^32 이므로 uint64 안에서 계산)
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+# 밴드의 행들을 64비트 키 하나로 섞는 홀수 곱셈 상수
+_BAND_MIX = _rng.integers(1, 1 << 63, size=NUM_PERM // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+
+# 중복 판단 상태 저장 파일 (인덱스 버전 디렉터리 안, 메모리 매핑으로 읽음)
+STATE_FILES = ("dedup_hashes.npy", "dedup_signatures.npy", "dedup_band_keys.npy", "dedup_band_positions.npy")
+
+###############################################################################
+# 1. 정규화 및 서명
+###############################################################################
+def normalize_text(text):
+    """공백을 하나로 합치고 소문자로 바꾼 본문"""
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def content_hash(text):
+    """완전 중복 판단용 해시"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def shingles(text):
+    """정규화한 본문의 글자 shingle 집합"""
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(shingle_set):
+    """shingle 집합의 MinHash 서명 (NUM_PERM개의 최소 해시값)"""
+    values = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set),
+        dtype=np.uint64, count=len(shingle_set)
+    )
+    hashed = (np.outer(values, _PERM_A) + _PERM_B) % _PRIME
+    return hashed.min(axis=0)
+
+
+def hash_key(text):
+    """완전 중복 판단용 해시의 앞 64비트 (저장 상태에서 정렬 배열로 찾기 위함)"""
+    return np.uint64(int(content_hash(text)[:16], 16))
+
+
+def band_keys(signature):
+    """서명을 LSH_BANDS개 밴드로 나눈 밴드별 64비트 키 (한 밴드라도 키가 같으면 유사 중복 후보)"""
+    rows = signature.reshape(LSH_BANDS, NUM_PERM // LSH_BANDS) * _BAND_MIX
+    return np.bitwise_xor.reduce(rows, axis=1)
+
+
+def jaccard(a, b):
+    """두 shingle 집합의 Jaccard 유사도"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+###############################################################################
+# 2. 색인 전 중복 제거
+###############################################################################
+class DedupState:
+    """
+    색인된 청크의 완전 중복 해시, MinHash 서명, 밴드별 LSH 키.
+    저장된 부분은 정렬된 배열(메모리 매핑 가능)에서 이진 탐색으로 찾고, 이번에 추가한 청크만 메모리에 둡니다.
+    """
+
+    def __init__(self, hashes=None, signatures=None, band_keys=None, band_positions=None):
+        self._hashes = hashes if hashes is not None else np.empty(0, dtype=np.uint64)  # 정렬됨
+        self._signatures = signatures if signatures is not None else np.empty((0, NUM_PERM), dtype=np.uint64)
+        # 밴드마다 키 순으로 정렬한 (키, 서명 위치)
+        self._band_keys = band_keys if band_keys is not None else np.empty((LSH_BANDS, 0), dtype=np.uint64)
+        self._band_positions = (
+            band_positions if band_positions is not None else np.empty((LSH_BANDS, 0), dtype=np.int64)
+        )
+        self._new_hashes = set()
+        self._new_signatures = []
+        self._new_buckets = {}
+
+    @classmethod
+    def load(cls, directory):
+        """directory에 저장된 상태를 메모리 매핑으로 엽니다. 저장된 상태가 없으면 None"""
+        paths = [os.path.join(directory, name) for name in STATE_FILES]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return cls(*(np.load(path, mmap_mode="r") for path in paths))
+
+    def save(self, directory):
+        """저장된 상태와 이번에 추가한 청크를 합쳐 directory에 기록"""
+        new_hashes = np.fromiter(self._new_hashes, dtype=np.uint64, count=len(self._new_hashes))
+        new_signatures = np.asarray(self._new_signatures, dtype=np.uint64).reshape(-1, NUM_PERM)
+        new_keys = np.asarray([band_keys(signature) for signature in new_signatures], dtype=np.uint64)
+        new_keys = new_keys.reshape(-1, LSH_BANDS).T
+        new_positions = np.arange(len(self._signatures), len(self._signatures) + len(new_signatures))
+
+        keys = np.concatenate([self._band_keys, new_keys], axis=1)
+        positions = np.concatenate([self._band_positions, np.broadcast_to(new_positions, new_keys.shape)], axis=1)
+        order = np.argsort(keys, axis=1, kind="stable")
+        arrays = (
+            np.union1d(self._hashes, new_hashes),
+            np.concatenate([self._signatures, new_signatures]),
+            np.take_along_axis(keys, order, axis=1),
+            np.take_along_axis(positions, order, axis=1),
+        )
+        for name, array in zip(STATE_FILES, arrays):
+            np.save(os.path.join(directory, name), array)
+
+    def _has_hash(self, key):
+        if key in self._new_hashes:
+            return True
+        index = np.searchsorted(self._hashes, key)
+        return index < len(self._hashes) and self._hashes[index] == key
+
+    def _candidates(self, keys):
+        candidates = set()
+        for band, key in enumerate(keys):
+            row = self._band_keys[band]
+            low, high = np.searchsorted(row, key, "left"), np.searchsorted(row, key, "right")
+            candidates.update(int(position) for position in self._band_positions[band, low:high])
+            candidates.update(self._new_buckets.get((band, int(key)), ()))
+        return candidates
+
+    def _signature(self, position):
+        if position < len(self._signatures):
+            return self._signatures[position]
+        return self._new_signatures[position - len(self._signatures)]
+
+    def check_and_add(self, text, threshold=NEAR_DUPLICATE_THRESHOLD, keep_new=True):
+        """
+        중복이면 종류('exact'/'near')를, 아니면 None을 반환하고 상태에 추가합니다.
+        keep_new=False면 유사 중복 비교 없이 추가합니다 (이미 색인된 청크를 등록할 때).
+        """
+        key = hash_key(text)
+        if self._has_hash(key):
+            return "exact"
+        self._new_hashes.add(key)
+
+        if len(normalize_text(text)) < MIN_CHUNK_CHARS:
+            return None
+
+        signature = minhash_signature(shingles(text))
+        keys = band_keys(signature)
+        if keep_new:
+            for position in self._candidates(keys):
+                if np.mean(self._signature(position) == signature) >= threshold:
+                    return "near"
+
+        position = len(self._signatures) + len(self._new_signatures)
+        self._new_signatures.append(signature)
+        for band, band_key in enumerate(keys):
+            self._new_buckets.setdefault((band, int(band_key)), []).append(position)
+        return None
+
+
+def deduplicate_documents(docs, existing=(), threshold=NEAR_DUPLICATE_THRESHOLD, state=None):
+    """
+    Document 리스트에서 완전 중복과 유사 중복을 제거합니다. 먼저 나온 청크를 남깁니다.
+
+    Args:
+        docs (list): 새로 색인할 Document 리스트
+        existing (iterable, optional): 이미 색인된 Document (이것들과 겹치는 새 청크도 제거)
+        threshold (float, optional): 유사 중복으로 볼 추정 Jaccard 유사도
+        state (DedupState, optional): 이미 색인된 청크의 중복 판단 상태.
+            남은 청크가 이 상태에 추가되므로, 저장해 두면 다음 추가 때 existing 없이 사용할 수 있습니다.
+
+    Returns:
+        tuple: (남은 Document 리스트, {"input", "exact", "near", "kept"} 집계)
+    """
+    if state is None:
+        state = DedupState()
+    for doc in existing:
+        state.check_and_add(doc.page_content, keep_new=False)
+
+    kept = []
+    report = {"input": len(docs), "exact": 0, "near": 0}
+    for doc in docs:
+        duplicate = state.check_and_add(doc.page_content, threshold)
+        if duplicate:
+            report[duplicate] += 1
+        else:
+            kept.append(doc)
+    report["kept"] = len(kept)
+    return kept, report
+
+###############################################################################
+# 3. 검색 결과 중복 제거
+###############################################################################
+def deduplicate_results(docs, limit=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    유사도 순 검색 결과에서 앞선 결과와 겹치는 청크를 빼고 최대 limit개를 반환합니다.
+    결과 수가 적으므로 MinHash 없이 shingle 집합을 직접 비교합니다.
+    """
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        doc_shingles = shingles(doc.page_content)
+        if any(jaccard(doc_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(doc_shingles)
+        if limit and len(kept) >= limit:
+            break
+    return kept
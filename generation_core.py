@@ -0,0 +1,965 @@
+"""
+계획서 생성 엔진 모듈
+
+프롬프트 작성, 모델 호출, 응답 파싱과 검증을 Streamlit 없이 비동기(async)로 수행합니다.
+- 생성 함수는 모두 코루틴이며 실패하면 예외를 올립니다. 기본값 사용이나 오류 표시는 호출한 쪽이 정합니다.
+- 진행 상황은 on_event 콜백에 dict 이벤트로 알립니다.
+    {"type": "waiting", "position": 대기 순서}
+    {"type": "chunk_started" | "chunk_done" | "chunk_failed", "start", "end", ...}
+- 모든 호출은 프로세스에 하나뿐인 엔진 이벤트 루프에서 실행되어 같은 HTTP 연결 풀을 공유하고,
+  llm_scheduler의 예산·공정 순서와 동일 요청 합치기, usage_budget의 비용 예산을 그대로 따릅니다.
+- 동기 코드(Streamlit 실행, 백그라운드 스레드, 일괄 스크립트)는 run_sync로 실행합니다.
+  이벤트는 run_sync를 호출한 스레드에서 전달되므로 콜백에서 화면을 바로 갱신할 수 있습니다.
+- 다른 이벤트 루프(API 서버 등)에서는 run_async로 기다리며, 이벤트는 그 루프에서 전달됩니다.
+호출한 쪽의 세션 ID와 우선순위는 llm_scheduler의 session_id_var, priority_var로 전달합니다.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import functools
+import threading
+from concurrent.futures import wait
+
+from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage, SystemMessage
+
+from plan_model import json_default, plan_fingerprint
+from chunk_dedup import deduplicate_results
+from llm_scheduler import PRIORITY_BULK, asingle_flight, get_scheduler, priority_var, request_key, session_id_var
+from usage_budget import check_budget, combine_estimates, estimate_call, record_response
+
+###############################################################################
+# 0. 설정
+###############################################################################
+SYSTEM_PROMPT = """한국의 초등학교 2022 개정 교육과정 전문가입니다.
+학교자율시간 계획서를 다음 원칙에 따라 작성합니다:
+
+1. 지도계획에 모든 차시에 학습내용과 학습 주제가 빈틈없이 내용이 꼭 들어가야 합니다.
+2. 학습자 중심의 교육과정 구성
+3. 실생활 연계 및 체험 중심 활동
+4. 교과 간 연계 및 통합적 접근
+5. 과정 중심 평가와 피드백 강조
+6. 유의미한 학습경험 제공
+7. 요구사항을 반영한 맞춤형 교육과정 구성
+8. 교수학습 방법의 다양화
+9. 객관적이고 공정한 평가계획 수립
+"""
+# 작업별 모델 라우팅: 분량이 많은 차시 묶음과 짧은 초안은 작은 모델, 성취기준은 큰 모델
+# (SEOHS_MODEL_ROUTES 환경 변수에 JSON으로 일부 또는 전체를 덮어쓸 수 있음)
+MODEL_ROUTES = {
+    "step_1": "gpt-4o-mini",
+    "step_2": "gpt-4o-mini",
+    "step_3": "gpt-4o",
+    "step_4": "gpt-4o-mini",
+    # 나누어 생성하는 단계의 부분 호출 (출력 분량이 달라 추정 기록을 따로 남김)
+    "step_3_outline": "gpt-4o",
+    "step_3_levels": "gpt-4o",
+    "step_4_methods": "gpt-4o-mini",
+    "step_4_assessment": "gpt-4o-mini",
+    "express": "gpt-4o",
+    "express_fewshot": "gpt-4o-mini",
+    "lesson_chunk": "gpt-4o-mini"
+}
+MODEL_ROUTES.update(json.loads(os.environ.get("SEOHS_MODEL_ROUTES", "{}")))
+
+# 작은 모델의 결과가 스키마 검증에 실패하면 다시 생성할 모델
+ESCALATION_MODEL = os.environ.get("SEOHS_ESCALATION_MODEL", "gpt-4o")
+# 서로 독립적인 부분을 나누어 동시에 생성하는 단계
+# (3단계: 성취기준 목록 → 성취기준별 수준, 4단계: 교수학습 방법 / 평가계획)
+FANOUT_STEPS = {int(step) for step in os.environ.get("SEOHS_FANOUT_STEPS", "3,4").split(",") if step.strip()}
+
+# 검색 결과 수 (중복을 빼기 위해 RETRIEVAL_FETCH_K개를 가져와 겹치지 않는 RETRIEVAL_K개를 사용)
+RETRIEVAL_K = 4
+RETRIEVAL_FETCH_K = 8
+
+# 단계별 검색 질의
+STEP_QUERIES = {
+    2: "목표와 내용 요소",
+    3: "성취기준",
+    4: "교수학습 방법과 평가계획"
+}
+EXPRESS_QUERY = "목표와 내용 요소, 성취기준, 교수학습 방법과 평가계획"
+
+STEP_MAX_TOKENS = 2048
+EXPRESS_MAX_TOKENS = 4096
+LESSON_CHUNK_MAX_TOKENS = 2000
+CHUNK_PAUSE_SECONDS = 1  # 차시 묶음 사이 대기 (API 호출 제한 방지)
+
+# 단계별 생성 결과가 채우는 계획서 항목
+STEP_OUTPUT_FIELDS = {
+    1: ['necessity', 'overview', 'characteristics'],
+    2: ['goals', 'domain', 'key_ideas'],
+    3: ['standards'],
+    4: ['teaching_methods', 'assessment_plan'],
+    5: ['lesson_plans']
+}
+
+# 단계별 생성 프롬프트에 들어가는 계획서 항목 (값이 같으면 저장된 생성 결과를 재사용)
+STEP_INPUT_FIELDS = {
+    1: ['activity_name', 'requirements', 'school_type', 'grades', 'subjects', 'total_hours', 'weekly_hours', 'semester'],
+    2: ['activity_name', 'requirements'],
+    3: ['activity_name', 'domain'],
+    4: ['activity_name', 'requirements'],
+    5: ['activity_name', 'necessity', 'overview', 'characteristics', 'goals', 'key_ideas',
+        'standards', 'teaching_methods', 'assessment_plan', 'total_hours']
+}
+
+# 단계 의존 관계: 각 단계의 입력 항목을 만들어 내는 선행 단계 (예: 3단계 ← 2단계의 domain)
+STEP_DEPENDENCIES = {
+    step: sorted(
+        producer for producer, outputs in STEP_OUTPUT_FIELDS.items()
+        if producer != step and set(outputs) & set(fields)
+    )
+    for step, fields in STEP_INPUT_FIELDS.items()
+}
+
+# 빠른 초안 응답의 구역과 단계 대응
+EXPRESS_SECTIONS = {1: "basic_info", 2: "goals_content", 3: "standards", 4: "teaching_assessment"}
+
+_api_key = os.environ.get("OPENAI_API_KEY")
+
+
+def configure_client(api_key):
+    """모델 호출에 사용할 API 키를 설정 (Streamlit secrets처럼 환경 변수 밖에서 읽은 키)"""
+    global _api_key
+    _api_key = api_key
+    chat_model.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def chat_model(model, temperature, max_tokens):
+    """모델·설정별로 하나만 만들어 재사용하는 ChatOpenAI (HTTP 연결 풀을 함께 사용)"""
+    return ChatOpenAI(openai_api_key=_api_key, model=model, temperature=temperature, max_tokens=max_tokens)
+
+###############################################################################
+# 1. 엔진 이벤트 루프
+###############################################################################
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def engine_loop():
+    """생성 호출을 실행하는 프로세스 전역 이벤트 루프 (처음 사용할 때 전용 스레드에서 시작)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="generation-engine", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """
+    코루틴을 엔진 루프에서 실행하고 concurrent.futures.Future를 반환합니다.
+    호출한 스레드의 contextvars(세션 ID, 우선순위)를 그대로 이어받습니다.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, engine_loop())
+
+
+def run_sync(coro_fn, *args, on_event=None, poll_seconds=0.2, **kwargs):
+    """
+    coro_fn(*args, on_event=..., **kwargs)를 엔진 루프에서 실행하고 끝날 때까지 기다려 결과를 반환합니다.
+    기다리는 동안 받은 이벤트는 이 함수를 호출한 스레드에서 on_event로 전달합니다.
+    """
+    events = queue.Queue()
+    future = submit(coro_fn(*args, on_event=events.put if on_event else None, **kwargs))
+
+    def drain():
+        while on_event:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                return
+            on_event(event)
+
+    while not wait([future], timeout=poll_seconds).done:
+        drain()
+    drain()
+    return future.result()
+
+
+async def run_async(coro_fn, *args, on_event=None, **kwargs):
+    """
+    다른 이벤트 루프(예: API 서버)에서 coro_fn(*args, on_event=..., **kwargs)를 엔진 루프로 보내 결과를 기다립니다.
+    이벤트는 호출한 루프에서 on_event로 전달하고, 기다리던 작업이 취소되면 엔진 쪽 호출도 취소합니다.
+    """
+    loop = asyncio.get_running_loop()
+    forward = (lambda event: loop.call_soon_threadsafe(on_event, event)) if on_event else None
+    return await asyncio.wrap_future(submit(coro_fn(*args, on_event=forward, **kwargs)))
+
+
+def _emit(on_event, event):
+    if on_event:
+        on_event(event)
+
+
+def _waiting(on_event):
+    """스케줄러의 대기 순서 콜백을 waiting 이벤트로 바꿈"""
+    if not on_event:
+        return None
+    return lambda position: on_event({"type": "waiting", "position": position})
+
+###############################################################################
+# 2. 프롬프트
+###############################################################################
+def chat_messages(prompt):
+    """시스템 프롬프트와 사용자 프롬프트로 된 메시지 리스트"""
+    return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=prompt)]
+
+
+def build_step_prompt(step, data, context=""):
+    """1~4단계 생성 프롬프트 (context: 검색한 문서 문맥). 해당 단계가 없으면 빈 문자열"""
+    step_prompts = {
+        1: f"""학교자율시간 활동의 기본 정보를 작성해주세요.
+아래 사항을 고려하여 JSON 형식으로 기술합니다.
+1) 학교 교육목표 및 비전과 어떻게 연계되는지 강조
+2) 학교 및 학생의 요구(학습자 특성, 지역사회 자원 등)를 반영한 활동 필요성 구체적으로
+3) 활동 개요에 대상 학년, 총 시수, 주간 운영 시수, 활동 형식(프로젝트, 탐구학습, 토론 등) 간단히 포함
+4) 교육적 의의, 운영 방향(지향 교수학습방법, 학생 참여방식 등) 명시
+
+활동명: {data.get('activity_name')}
+요구사항: {data.get('requirements')}
+학교급: {data.get('school_type')}
+대상 학년: {', '.join(data.get('grades', []))}
+연계 교과: {', '.join(data.get('subjects', []))}
+총 차시: {data.get('total_hours')}차시
+주당 차시: {data.get('weekly_hours')}차시
+운영 학기: {', '.join(data.get('semester', []))}
+
+다음 JSON 형식으로 작성:
+{{
+    "necessity": "(학교 비전, 학습자 요구, 지역사회 연계 가능성 등을 포함)",
+    "overview": "(대상 학년, 총 시수, 활동 형식 등을 포함)",
+    "characteristics": "(교육적 의의, 운영 방향, 교수학습 전략 등)"
+}}""",
+
+        2: f"""{context}
+
+위 정보를 바탕으로 학교자율시간 활동의 목표와 주요 내용 요소를 정리해주세요.
+1) 지식, 기능, 태도 영역으로 구분된 목표 작성
+2) 활동이 다루는 영역(단일/통합 교과 등) 기술
+3) 핵심 개념 또는 원리 2~3개 이상 제시, 간단 설명 가능
+
+활동명: {data.get('activity_name')}
+요구사항: {data.get('requirements')}
+
+다음 JSON 형식으로 작성:
+{{
+    "goals": [
+        "(지식 영역 목표)",
+        "(기능 영역 목표)",
+        "(태도 영역 목표)"
+    ],
+    "domain": "(단일 또는 통합 영역 명시)",
+    "key_ideas": [
+        "(핵심 개념/원리1)",
+        "(핵심 개념/원리2)",
+        "(핵심 개념/원리3)"
+    ]
+}}""",
+
+        3: f"""{context}
+
+위 정보를 종합하여 학교자율시간 활동의 성취기준을 작성해주세요.
+1) 성취기준 코드는 고유하게 (예: '3사코딩_01')
+2) 성취기준 설명은 학생들이 달성해야 할 학습 결과를 구체적으로
+3) A/B/C 수준 구분, 각 수준의 구체적 성취 모습을 간단히
+
+활동명: {data.get('activity_name')}
+영역: {data.get('domain')}
+
+다음 JSON 형식으로 작성:
+[
+    {{
+        "code": "(성취기준 코드)",
+        "description": "(성취기준 설명)",
+        "levels": [
+            {{"level": "A", "description": "(A수준 성취기준)"}},
+            {{"level": "B", "description": "(B수준 성취기준)"}},
+            {{"level": "C", "description": "(C수준 성취기준)"}}
+        ]
+    }}
+]""",
+
+        4: f"""{context}
+
+위 정보를 바탕으로 학교자율시간 활동의 교수학습 방법과 평가계획을 작성해주세요.
+1) 교수학습 방법: 학생 중심의 다양한 교수학습 방법을 구체적으로
+2) 평가계획: 과정 중심 평가 및 구체적인 평가 방법 상세 기술
+
+활동명: {data.get('activity_name')}
+요구사항: {data.get('requirements')}
+
+다음 JSON 형식으로 작성:
+{{
+    "teaching_methods": [
+        {{"method": "프로젝트 기반 학습", "description": "학생들이 직접 프로젝트를 기획하고 실행함으로써 문제 해결 능력을 기릅니다."}},
+        {{"method": "토론 활동", "description": "학생들이 다양한 주제에 대해 토론함으로써 의사소통 능력을 향상시킵니다."}}
+    ],
+    "assessment_plan": [
+        {{"focus": "과정 중심 평가", "description": "학생들의 학습 과정과 참여도를 평가합니다."}},
+        {{"focus": "형성 평가", "description": "수업 중간에 학생들의 이해도를 점검하고 피드백을 제공합니다."}}
+    ]
+}}"""
+    }
+    return step_prompts.get(step, "")
+
+
+def _activity(data):
+    return f"""활동명: {data.get('activity_name')}
+요구사항: {data.get('requirements')}"""
+
+
+def build_teaching_methods_prompt(data, context):
+    """4단계를 나누어 생성할 때의 교수학습 방법 프롬프트"""
+    return f"""{context}
+
+위 정보를 바탕으로 학교자율시간 활동의 교수학습 방법을 작성해주세요.
+학생 중심의 다양한 교수학습 방법을 구체적으로 작성합니다.
+
+{_activity(data)}
+
+다음 JSON 형식으로 작성:
+{{
+    "teaching_methods": [
+        {{"method": "(교수학습 방법)", "description": "(구체적인 운영 방법)"}}
+    ]
+}}"""
+
+
+def build_assessment_plan_prompt(data, context):
+    """4단계를 나누어 생성할 때의 평가계획 프롬프트"""
+    return f"""{context}
+
+위 정보를 바탕으로 학교자율시간 활동의 평가계획을 작성해주세요.
+과정 중심 평가 및 구체적인 평가 방법을 상세히 기술합니다.
+
+{_activity(data)}
+
+다음 JSON 형식으로 작성:
+{{
+    "assessment_plan": [
+        {{"focus": "(평가 중점)", "description": "(평가 방법)"}}
+    ]
+}}"""
+
+
+def build_standards_outline_prompt(data, context):
+    """3단계를 나누어 생성할 때 성취기준 코드와 설명만 요청하는 프롬프트"""
+    return f"""{context}
+
+위 정보를 종합하여 학교자율시간 활동의 성취기준 코드와 설명을 작성해주세요.
+1) 성취기준 코드는 고유하게 (예: '3사코딩_01')
+2) 성취기준 설명은 학생들이 달성해야 할 학습 결과를 구체적으로
+
+활동명: {data.get('activity_name')}
+영역: {data.get('domain')}
+
+다음 JSON 형식으로 작성:
+{{
+    "standards": [
+        {{"code": "(성취기준 코드)", "description": "(성취기준 설명)"}}
+    ]
+}}"""
+
+
+def build_levels_prompt(data, standard):
+    """성취기준 하나의 A/B/C 수준을 요청하는 프롬프트"""
+    return f"""다음 학교자율시간 성취기준의 A/B/C 수준별 구체적 성취 모습을 간단히 작성해주세요.
+
+활동명: {data.get('activity_name')}
+성취기준 코드: {standard['code']}
+성취기준 설명: {standard['description']}
+
+다음 JSON 형식으로 작성:
+{{
+    "levels": [
+        {{"level": "A", "description": "(A수준 성취기준)"}},
+        {{"level": "B", "description": "(B수준 성취기준)"}},
+        {{"level": "C", "description": "(C수준 성취기준)"}}
+    ]
+}}"""
+
+
+def express_example(plan):
+    """이전 계획서의 1~4단계 내용을 빠른 초안 응답 형식으로 정리 (참고 예시용)"""
+    example = {}
+    for step, section in EXPRESS_SECTIONS.items():
+        fields = STEP_OUTPUT_FIELDS[step]
+        example[section] = plan.get(fields[0]) if step == 3 else {field: plan.get(field) for field in fields}
+    return json.dumps(example, ensure_ascii=False, default=json_default)
+
+
+def build_express_prompt(data, context, example=None):
+    """1~4단계 내용을 한 번에 작성하도록 요청하는 프롬프트 (example: 참고할 비슷한 이전 계획서)"""
+    if example:
+        context = f"""다음은 비슷한 활동의 이전 계획서입니다. 형식과 수준을 참고하되, 이번 활동의 입력에 맞게 새로 작성하세요.
+{express_example(example)}"""
+
+    return f"""{context}
+
+위 정보를 바탕으로 학교자율시간 활동 계획서의 1~4단계 내용을 한 번에 작성해주세요.
+1) 기본 정보: 학교 교육목표와의 연계, 학습자 요구를 반영한 필요성, 대상 학년·총 시수·활동 형식을 포함한 개요, 교육적 의의와 운영 방향
+2) 목표와 내용 요소: 지식, 기능, 태도 영역 목표, 활동 영역(단일/통합 교과), 핵심 개념 또는 원리 2~3개 이상
+3) 성취기준: 고유한 코드(예: '3사코딩_01'), 구체적인 학습 결과, A/B/C 수준별 성취 모습 (2)의 영역과 일관되게)
+4) 교수학습 방법과 평가계획: 학생 중심의 다양한 교수학습 방법, 과정 중심 평가 방법
+
+활동명: {data.get('activity_name')}
+요구사항: {data.get('requirements')}
+학교급: {data.get('school_type')}
+대상 학년: {', '.join(data.get('grades', []))}
+연계 교과: {', '.join(data.get('subjects', []))}
+총 차시: {data.get('total_hours')}차시
+주당 차시: {data.get('weekly_hours')}차시
+운영 학기: {', '.join(data.get('semester', []))}
+
+다음 JSON 형식으로 작성:
+{{
+    "basic_info": {{
+        "necessity": "(학교 비전, 학습자 요구, 지역사회 연계 가능성 등을 포함)",
+        "overview": "(대상 학년, 총 시수, 활동 형식 등을 포함)",
+        "characteristics": "(교육적 의의, 운영 방향, 교수학습 전략 등)"
+    }},
+    "goals_content": {{
+        "goals": ["(지식 영역 목표)", "(기능 영역 목표)", "(태도 영역 목표)"],
+        "domain": "(단일 또는 통합 영역 명시)",
+        "key_ideas": ["(핵심 개념/원리1)", "(핵심 개념/원리2)", "(핵심 개념/원리3)"]
+    }},
+    "standards": [
+        {{
+            "code": "(성취기준 코드)",
+            "description": "(성취기준 설명)",
+            "levels": [
+                {{"level": "A", "description": "(A수준 성취기준)"}},
+                {{"level": "B", "description": "(B수준 성취기준)"}},
+                {{"level": "C", "description": "(C수준 성취기준)"}}
+            ]
+        }}
+    ],
+    "teaching_assessment": {{
+        "teaching_methods": [{{"method": "(교수학습 방법)", "description": "(설명)"}}],
+        "assessment_plan": [{{"focus": "(평가 중점)", "description": "(평가 방법)"}}]
+    }}
+}}"""
+
+
+def prompt_json(value):
+    """
+    계획서 항목(리스트, 레코드)을 프롬프트에 넣을 JSON 문자열로 변환합니다.
+    세션의 Plan 레코드와 API·일괄 처리의 dict가 같은 프롬프트(같은 요청 키)가 되도록 합니다.
+    """
+    return json.dumps(value, ensure_ascii=False, default=json_default)
+
+
+def format_neighbor_lessons(neighbors):
+    """앞뒤 차시를 프롬프트에 넣을 수 있도록 정리"""
+    before, after = neighbors
+    lines = ["\n이미 작성된 앞뒤 차시 (흐름이 자연스럽게 이어지고 내용이 중복되지 않도록 작성):"]
+    for label, plans in (("앞 차시", before), ("뒤 차시", after)):
+        for plan in plans:
+            lines.append(f"- [{label}] {plan.get('lesson_number')}차시: {plan.get('topic')} / {plan.get('content')}")
+    return "\n".join(lines) if len(lines) > 1 else ""
+
+
+def build_lesson_chunk_prompt(start, end, data, neighbors=None):
+    """start+1 ~ end 차시 지도계획 생성을 위한 프롬프트 (neighbors: 맥락으로 넣을 (앞 차시, 뒤 차시))"""
+    neighbor_text = format_neighbor_lessons(neighbors) if neighbors else ""
+    return f"""
+다음 정보를 바탕으로 {start+1}차시부터 {end}차시까지의 지도계획을 JSON으로 작성해주세요.
+
+활동명: {data.get('activity_name')}
+필요성: {data.get('necessity')}
+개요: {data.get('overview')}
+성격: {data.get('characteristics')}
+목표: {prompt_json(data.get('goals'))}
+핵심 아이디어: {prompt_json(data.get('key_ideas'))}
+성취기준: {prompt_json(data.get('standards'))}
+교수학습 방법: {prompt_json(data.get('teaching_methods'))}
+평가계획: {prompt_json(data.get('assessment_plan'))}
+{neighbor_text}
+각 차시는 다음 사항을 고려하여 작성해주세요:
+1. 차시별로 명확한 학습주제 설정
+2. 구체적이고 실천 가능한 학습내용 기술
+3. 실제 수업에 필요한 교수학습자료 명시
+4. 이전 차시와의 연계성 고려
+5. 학습목표 달성을 위한 단계적 구성
+
+다음 JSON 형식으로 작성:
+{{
+  "lesson_plans": [
+    {{
+      "lesson_number": "차시번호",
+      "topic": "학습주제",
+      "content": "학습내용",
+      "materials": "교수학습자료"
+    }}
+  ]
+}}
+"""
+
+###############################################################################
+# 3. 응답 파싱 및 검증
+###############################################################################
+def parse_json_content(text):
+    """응답에서 코드 블록 표시를 제거하고 JSON으로 파싱"""
+    content = text.strip()
+    content = content.replace('```json', '').replace('```', '').strip()
+    return json.loads(content)
+
+
+def _require(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+def validate_step_content(step, parsed):
+    """단계별 생성 결과의 구조를 검증 (맞지 않으면 ValueError)"""
+    if step == 1:
+        _require(isinstance(parsed, dict), "Expected an object")
+        for key in ('necessity', 'overview', 'characteristics'):
+            _require(isinstance(parsed.get(key), str), f"Missing {key}")
+    elif step == 2:
+        _require(isinstance(parsed, dict), "Expected an object")
+        _require(isinstance(parsed.get('goals'), list) and parsed['goals'], "Missing goals")
+        _require(isinstance(parsed.get('domain'), str), "Missing domain")
+        _require(isinstance(parsed.get('key_ideas'), list) and parsed['key_ideas'], "Missing key_ideas")
+    elif step == 3:
+        _require(isinstance(parsed, list) and parsed, "Expected a list of standards")
+        for standard in parsed:
+            _require(isinstance(standard, dict) and 'code' in standard and 'description' in standard,
+                     "Invalid structure in standards")
+            _require(isinstance(standard.get('levels'), list), "Missing levels")
+            for level in standard['levels']:
+                _require(isinstance(level, dict) and 'level' in level and 'description' in level,
+                         "Invalid structure in levels")
+    elif step == 4:
+        _require(isinstance(parsed, dict), "Expected an object")
+        _require('teaching_methods' in parsed and 'assessment_plan' in parsed, "Missing teaching_methods or assessment_plan")
+        for method in parsed['teaching_methods']:
+            if not isinstance(method, dict) or 'method' not in method or 'description' not in method:
+                raise ValueError("Invalid structure in teaching_methods")
+        for assessment in parsed['assessment_plan']:
+            if not isinstance(assessment, dict) or 'focus' not in assessment or 'description' not in assessment:
+                raise ValueError("Invalid structure in assessment_plan")
+    return parsed
+
+
+def validate_lesson_chunk(parsed, expected=None):
+    """차시 묶음 생성 결과의 구조를 검증하고 lesson_plans 리스트를 반환 (expected: 있어야 할 차시 수)"""
+    _require(isinstance(parsed, dict), "Expected an object")
+    lesson_plans = parsed.get("lesson_plans")
+    _require(isinstance(lesson_plans, list) and lesson_plans, "Missing lesson_plans")
+    _require(expected is None or len(lesson_plans) == expected,
+             f"Expected {expected} lesson_plans, got {len(lesson_plans)}")
+    for plan in lesson_plans:
+        _require(isinstance(plan, dict) and 'topic' in plan and 'content' in plan, "Invalid structure in lesson_plans")
+    return lesson_plans
+
+
+def validate_record_list(parsed, key, fields):
+    """{key: [레코드, ...]} 응답에서 필요한 필드를 가진 레코드 리스트를 꺼냄"""
+    _require(isinstance(parsed, dict), "Expected an object")
+    records = parsed.get(key)
+    _require(isinstance(records, list) and records, f"Missing {key}")
+    for record in records:
+        _require(isinstance(record, dict) and all(field in record for field in fields), f"Invalid structure in {key}")
+    return records
+
+
+def parse_express_content(text):
+    """빠른 초안 응답을 {단계: 내용}으로 나누고 단계별로 검증"""
+    parsed = parse_json_content(text)
+    _require(isinstance(parsed, dict), "Expected an object")
+    return {
+        step: validate_step_content(step, parsed.get(section))
+        for step, section in EXPRESS_SECTIONS.items()
+    }
+
+
+def get_default_content(step):
+    """단계별 기본 내용을 반환하는 함수"""
+    defaults = {
+        1: {
+            "necessity": "예시: 2022개정교육과정, 학생/학부모 요구, 지역 여건 부합 등",
+            "overview": "예시: 대상 학년, 총 시수, 운영 형태 등",
+            "characteristics": "예시: 교육적 의의, 학생 참여 중심 운영 방식 등"
+        },
+        2: {
+            "goals": [
+                "지식 영역 목표 예시",
+                "기능 영역 목표 예시",
+                "태도 영역 목표 예시"
+            ],
+            "domain": "예: 통합 교과(사회+과학 등)",
+            "key_ideas": [
+                "예: 프로젝트 학습을 통한 문제 해결 능력 신장",
+                "예: 토론 활동을 통한 의사소통 역량 강화"
+            ]
+        },
+        3: [{
+            "code": "SD_01",
+            "description": "학생이 자료를 수집, 분석하여 문제 정의와 해결 방안을 제시할 수 있다.",
+            "levels": [
+                {"level": "A", "description": "다양한 자료를 능동적으로 활용해 창의적인 해결 방안을 설계한다."},
+                {"level": "B", "description": "제시된 자료를 활용해 해결 방안을 세운다."},
+                {"level": "C", "description": "주어진 자료를 활용해 해결 방안 초안을 구성한다."}
+            ]
+        }],
+        4: {
+            "teaching_methods": [
+                {"method": "프로젝트 기반 학습", "description": "학생들이 직접 프로젝트를 기획하고 실행함으로써 문제 해결 능력을 기릅니다."},
+                {"method": "토론 활동", "description": "학생들이 다양한 주제에 대해 토론함으로써 의사소통 능력을 향상시킵니다."}
+            ],
+            "assessment_plan": [
+                {"focus": "과정 중심 평가", "description": "학생들의 학습 과정과 참여도를 평가합니다."},
+                {"focus": "형성 평가", "description": "수업 중간에 학생들의 이해도를 점검하고 피드백을 제공합니다."}
+            ]
+        }
+    }
+    return defaults.get(step, {})
+
+
+def apply_step_content(step, data, content):
+    """generate_content 결과를 단계에 맞게 계획서 데이터에 반영"""
+    if step == 3:
+        data['standards'] = content
+    elif step == 4:
+        data.update({
+            'teaching_methods': content.get('teaching_methods', []),
+            'assessment_plan': content.get('assessment_plan', [])
+        })
+    else:
+        data.update(content)
+
+
+def chunk_error_message(start, end, error):
+    """청크 생성 실패 시 표시할 메시지"""
+    if isinstance(error, json.JSONDecodeError):
+        return f"{start+1}~{end}차시 생성 중 JSON 파싱 오류 발생: {error}"
+    return f"{start+1}~{end}차시 생성 중 오류 발생: {error}"
+
+###############################################################################
+# 4. 모델 호출
+###############################################################################
+def retrieve_context(vector_store, query):
+    """질의와 관련된 문서 청크를 중복 없이 모아 프롬프트에 넣을 문맥으로 반환"""
+    docs = vector_store.similarity_search(query, k=RETRIEVAL_FETCH_K)
+    return "\n\n".join(doc.page_content for doc in deduplicate_results(docs, limit=RETRIEVAL_K))
+
+
+async def aretrieve_context(vector_store, query):
+    """retrieve_context를 작업 스레드에서 실행 (벡터 스토어가 없으면 빈 문맥)"""
+    if not vector_store:
+        return ""
+    return await asyncio.to_thread(retrieve_context, vector_store, query)
+
+
+async def acall_chat(messages, temperature, max_tokens, priority=None, on_wait=None, model=ESCALATION_MODEL,
+                     task=None, units=1):
+    """
+    ChatOpenAI 호출 공통 함수.
+    모든 호출은 프로세스 전역 스케줄러를 거쳐 요청/토큰 예산과 세션별 공정 순서에 따라 실행됩니다.
+    여러 세션이 같은 요청을 동시에 보내면 한 번만 호출하고 결과를 함께 받습니다.
+    (먼저 보낸 호출의 대기 순서만 표시됩니다)
+    호출 전에 세션/일일 비용 예산을 확인하고, 실제로 보낸 호출의 토큰 수와 응답 시간을 기록합니다.
+
+    Args:
+        priority (int, optional): PRIORITY_INTERACTIVE 또는 PRIORITY_BULK. 기본값은 호출 맥락의 우선순위
+        on_wait (callable, optional): 대기 중 대기 순서를 받는 콜백
+        model (str, optional): 사용할 모델. 기본값은 gpt-4o
+        task (str, optional): 추정 기록에 사용할 작업 이름 (예: "step_2", "lesson_chunk")
+        units (int, optional): 출력 분량의 단위 수 (차시 묶음이면 차시 수)
+    """
+    chat = chat_model(model, temperature, max_tokens)
+    session_id = session_id_var.get() or "default"
+    # 예산은 예상 비용으로 확인하고, 스케줄러 토큰 예산에는 최대 출력 토큰을 더한 값을 사용
+    # (추정·예산 확인·기록은 파일과 DB를 다루므로 엔진 루프를 막지 않도록 스레드에서 실행)
+    estimate = await asyncio.to_thread(estimate_call, task, model, messages, max_tokens, units)
+    await asyncio.to_thread(check_budget, session_id, estimate["cost"])
+
+    async def invoke():
+        started = time.perf_counter()
+        response = await chat.ainvoke(messages)
+        await asyncio.to_thread(
+            record_response, session_id, task, model, messages, response, time.perf_counter() - started, units
+        )
+        return response
+
+    return await asingle_flight(
+        request_key(model, temperature, max_tokens, messages),
+        lambda: get_scheduler().arun(
+            invoke,
+            session_id=session_id,
+            priority=priority_var.get() if priority is None else priority,
+            tokens=estimate["prompt_tokens"] + max_tokens,
+            on_wait=on_wait
+        )
+    )
+
+
+async def agenerate_with_routing(task, messages, temperature, max_tokens, parse, priority=None, on_wait=None,
+                                 units=1):
+    """
+    MODEL_ROUTES에 지정된 모델로 생성하고, parse(응답 문자열)가 JSON 또는 구조 오류(ValueError)를
+    내면 ESCALATION_MODEL로 한 번 더 생성합니다. 마지막 모델도 실패하면 오류를 그대로 전달합니다.
+    (units: 출력 분량의 단위 수. 호출 기록과 추정에 사용)
+    """
+    models = [MODEL_ROUTES.get(task, ESCALATION_MODEL)]
+    if models[0] != ESCALATION_MODEL:
+        models.append(ESCALATION_MODEL)
+
+    for attempt, model in enumerate(models, start=1):
+        response = await acall_chat(
+            messages, temperature, max_tokens, priority=priority, on_wait=on_wait, model=model, task=task, units=units
+        )
+        try:
+            return parse(response.content)
+        except ValueError:
+            if attempt == len(models):
+                raise
+
+###############################################################################
+# 5. 1~4단계 생성
+###############################################################################
+async def agenerate_fanout_content(step, data, context, on_event=None):
+    """
+    단계를 독립적인 짧은 요청으로 나누어 동시에 생성하고 합친 뒤 검증합니다.
+    응답 시간은 출력 토큰 수에 거의 비례하므로, 긴 응답 하나보다 짧은 응답 여러 개가 빨리 끝납니다.
+    """
+    def request(task, prompt, max_tokens, parse):
+        return agenerate_with_routing(
+            task, chat_messages(prompt), temperature=0.7, max_tokens=max_tokens,
+            parse=lambda text: parse(parse_json_content(text)), on_wait=_waiting(on_event)
+        )
+
+    if step == 4:
+        teaching_methods, assessment_plan = await asyncio.gather(
+            request("step_4_methods", build_teaching_methods_prompt(data, context), 1024,
+                    lambda parsed: validate_record_list(parsed, "teaching_methods", ("method", "description"))),
+            request("step_4_assessment", build_assessment_plan_prompt(data, context), 1024,
+                    lambda parsed: validate_record_list(parsed, "assessment_plan", ("focus", "description")))
+        )
+        return validate_step_content(4, {"teaching_methods": teaching_methods, "assessment_plan": assessment_plan})
+
+    if step == 3:
+        # 성취기준 코드와 설명만 먼저 짧게 생성한 뒤, 성취기준별 A/B/C 수준을 동시에 생성
+        standards = await request(
+            "step_3_outline", build_standards_outline_prompt(data, context), 1024,
+            lambda parsed: validate_record_list(parsed, "standards", ("code", "description"))
+        )
+        levels = await asyncio.gather(*[
+            request("step_3_levels", build_levels_prompt(data, standard), 512,
+                    lambda parsed: validate_record_list(parsed, "levels", ("level", "description")))
+            for standard in standards
+        ])
+        return validate_step_content(3, [
+            {"code": standard['code'], "description": standard['description'], "levels": standard_levels}
+            for standard, standard_levels in zip(standards, levels)
+        ])
+
+    raise ValueError(f"{step}단계는 나누어 생성할 수 없습니다.")
+
+
+async def agenerate_step(step, data, vector_store=None, on_event=None):
+    """
+    1~4단계 내용을 생성합니다. 2~4단계는 관련 문서를 검색해 문맥으로 넣습니다.
+    라우팅된 모델로 생성 후 구조를 검증하고, 실패하면 상위 모델로 다시 생성합니다.
+
+    Raises:
+        json.JSONDecodeError: 응답이 JSON이 아님
+        ValueError: 응답 구조가 맞지 않거나 생성할 수 없는 단계
+    """
+    context = await aretrieve_context(vector_store, STEP_QUERIES[step]) if step in STEP_QUERIES else ""
+    if step in FANOUT_STEPS:
+        return await agenerate_fanout_content(step, data, context, on_event)
+
+    prompt = build_step_prompt(step, data, context)
+    if not prompt:
+        raise ValueError(f"{step}단계는 생성할 수 없습니다.")
+    return await agenerate_with_routing(
+        f"step_{step}",
+        chat_messages(prompt),
+        temperature=0.7,
+        max_tokens=STEP_MAX_TOKENS,
+        parse=lambda text: validate_step_content(step, parse_json_content(text)),
+        on_wait=_waiting(on_event)
+    )
+
+
+async def agenerate_express(data, vector_store=None, example=None, on_event=None):
+    """
+    빠른 초안: 1~4단계 내용을 검색 한 번, 호출 한 번으로 생성합니다.
+    비슷한 이전 계획서(example)가 있으면 검색 대신 예시로 넣고 작은 모델로 생성합니다.
+
+    Returns:
+        dict: {단계: 내용}
+    """
+    context = "" if example else await aretrieve_context(vector_store, EXPRESS_QUERY)
+    return await agenerate_with_routing(
+        "express_fewshot" if example else "express",
+        chat_messages(build_express_prompt(data, context, example)),
+        temperature=0.7,
+        max_tokens=EXPRESS_MAX_TOKENS,
+        parse=parse_express_content,
+        on_wait=_waiting(on_event)
+    )
+
+###############################################################################
+# 6. 차시별 지도계획 생성
+###############################################################################
+async def agenerate_lesson_chunk(start, end, data, neighbors=None, on_event=None):
+    """
+    start+1 ~ end 차시의 지도계획을 한 번의 API 호출로 생성합니다.
+    neighbors로 (앞 차시 리스트, 뒤 차시 리스트)를 주면 연계성을 위한 맥락으로 프롬프트에 넣습니다.
+    차시 묶음 호출은 일괄 우선순위로 실행되어 대화형 단계 호출보다 뒤에 처리됩니다.
+
+    Returns:
+        list: 차시 번호가 보정된 차시별 계획 리스트
+    """
+    # 구조적 답변 위해 temperature 약간 낮춤
+    lesson_plans = await agenerate_with_routing(
+        "lesson_chunk",
+        chat_messages(build_lesson_chunk_prompt(start, end, data, neighbors)),
+        temperature=0.5,
+        max_tokens=LESSON_CHUNK_MAX_TOKENS,
+        # 차시 수가 맞지 않으면 구조 오류로 보고 상위 모델로 다시 생성 (번호가 겹치거나 빠지지 않도록)
+        parse=lambda text: validate_lesson_chunk(parse_json_content(text), expected=end - start),
+        priority=PRIORITY_BULK,
+        on_wait=_waiting(on_event),
+        units=end - start
+    )
+
+    # 차시 번호 검증 및 수정
+    for i, plan in enumerate(lesson_plans, start=start+1):
+        plan["lesson_number"] = str(i)
+
+    return lesson_plans
+
+
+async def agenerate_lessons(total_hours, data, chunk_size=10, on_event=None):
+    """
+    chunk_size 단위로 차시 묶음을 차례로 생성합니다. 실패한 묶음은 chunk_failed 이벤트를 보내고 건너뜁니다.
+    묶음마다 chunk_started, chunk_done(lesson_plans 포함) 이벤트를 보냅니다.
+
+    Returns:
+        list: 생성된 차시별 계획 리스트
+    """
+    all_lesson_plans = []
+    for start in range(0, total_hours, chunk_size):
+        end = min(start + chunk_size, total_hours)
+        _emit(on_event, {"type": "chunk_started", "start": start, "end": end, "total": total_hours})
+        try:
+            lesson_plans = await agenerate_lesson_chunk(start, end, data, on_event=on_event)
+        except Exception as e:
+            _emit(on_event, {"type": "chunk_failed", "start": start, "end": end,
+                             "message": chunk_error_message(start, end, e)})
+            continue
+
+        all_lesson_plans.extend(lesson_plans)
+        _emit(on_event, {"type": "chunk_done", "start": start, "end": end, "lesson_plans": lesson_plans})
+        await asyncio.sleep(CHUNK_PAUSE_SECONDS)
+    return all_lesson_plans
+
+
+async def aregenerate_lesson_range(first, last, data, lesson_plans, chunk_size=10, context_size=2, on_event=None):
+    """
+    first ~ last 차시만 다시 생성해 lesson_plans에 끼워 넣습니다.
+    구간 앞뒤의 차시를 context_size개씩 맥락으로 넣어 이어지는 흐름을 유지하고,
+    구간이 chunk_size보다 길면 나누어 생성하며 앞 묶음의 결과를 다음 묶음의 맥락으로 사용합니다.
+
+    Returns:
+        list: 수정된 lesson_plans (제자리에서 수정)
+    """
+    for start in range(first - 1, last, chunk_size):
+        end = min(start + chunk_size, last)
+        by_number = {int(plan['lesson_number']): plan for plan in lesson_plans}
+        before = [by_number[n] for n in range(start - context_size + 1, start + 1) if n in by_number]
+        after = [by_number[n] for n in range(last + 1, last + context_size + 1) if n in by_number]
+
+        new_plans = await agenerate_lesson_chunk(start, end, data, neighbors=(before, after), on_event=on_event)
+
+        # 구간의 기존 차시를 새 차시로 교체하고 차시 순서 유지
+        lesson_plans[:] = [plan for plan in lesson_plans if not start < int(plan['lesson_number']) <= end]
+        lesson_plans.extend(new_plans)
+        lesson_plans.sort(key=lambda plan: int(plan['lesson_number']))
+    return lesson_plans
+
+###############################################################################
+# 7. 호출 추정
+###############################################################################
+# 검색 문맥의 예상 토큰 수 (청크 RETRIEVAL_K개)
+CONTEXT_TOKENS_ESTIMATE = RETRIEVAL_K * 300
+
+# 나누어 생성하는 단계의 호출 모양: 차례로 실행하는 [[동시에 보내는 (작업 이름, 최대 토큰), ...], ...]
+# (3단계 수준별 호출 수는 생성되는 성취기준 수에 따르므로 보통 개수인 3개로 추정)
+FANOUT_SHAPES = {
+    3: [[("step_3_outline", 1024)], [("step_3_levels", 512)] * 3],
+    4: [[("step_4_methods", 1024), ("step_4_assessment", 1024)]]
+}
+
+
+def estimate_step_generation(step, data):
+    """
+    1~4단계 생성의 호출 수, 토큰, 비용, 시간 추정.
+    검색 문맥은 예상 토큰 수로 대신하고, 나누어 생성하는 단계의 프롬프트는 한 번에 생성하는 프롬프트로 근사합니다.
+    부분 호출은 실제 생성과 같은 작업 이름으로 모델과 출력 토큰 기록을 찾습니다.
+    """
+    messages = chat_messages(build_step_prompt(step, data))
+    context_tokens = CONTEXT_TOKENS_ESTIMATE if step > 1 else 0
+    if step in FANOUT_STEPS and step in FANOUT_SHAPES:
+        shapes = FANOUT_SHAPES[step]
+    else:
+        shapes = [[(f"step_{step}", STEP_MAX_TOKENS)]]
+    return combine_estimates([
+        [
+            estimate_call(task, MODEL_ROUTES.get(task, ESCALATION_MODEL), messages, max_tokens,
+                          extra_prompt_tokens=context_tokens)
+            for task, max_tokens in calls
+        ]
+        for calls in shapes
+    ])
+
+
+def estimate_lesson_generation(total_hours, data, chunk_size=10):
+    """
+    차시 묶음마다 실제로 보낼 프롬프트로 호출을 추정해 합칩니다.
+    묶음은 차례로 생성되고 묶음 사이에 CHUNK_PAUSE_SECONDS씩 기다립니다.
+    """
+    model = MODEL_ROUTES.get("lesson_chunk", ESCALATION_MODEL)
+    stages = []
+    for start in range(0, total_hours, chunk_size):
+        end = min(start + chunk_size, total_hours)
+        messages = chat_messages(build_lesson_chunk_prompt(start, end, data))
+        stages.append([estimate_call("lesson_chunk", model, messages, LESSON_CHUNK_MAX_TOKENS, units=end - start)])
+    return combine_estimates(stages, pause_seconds=CHUNK_PAUSE_SECONDS)
+
+###############################################################################
+# 8. 변경된 단계 찾기
+###############################################################################
+def step_input_hash(step, data):
+    """단계 생성에 쓰이는 입력 항목만으로 만든 해시"""
+    return plan_fingerprint({field: data.get(field) for field in STEP_INPUT_FIELDS.get(step, [])})
+
+
+def record_step_inputs(step, data, input_hash=None):
+    """단계를 생성할 때 사용한 입력 해시를 계획서 데이터에 기록 (이후 변경 여부 판단용)"""
+    data.setdefault('_step_inputs', {})[str(step)] = input_hash or step_input_hash(step, data)
+
+
+def find_stale_steps(data):
+    """
+    생성 이후 입력이 바뀐 단계와, 그런 단계에 의존하는 후속 단계를 순서대로 반환합니다.
+    한 번도 생성 기록이 없는 단계는 판단하지 않습니다.
+    """
+    recorded = data.get('_step_inputs', {})
+    stale = []
+    for step in sorted(STEP_INPUT_FIELDS):
+        if str(step) not in recorded:
+            continue
+        changed = recorded[str(step)] != step_input_hash(step, data)
+        upstream_stale = any(dependency in stale for dependency in STEP_DEPENDENCIES[step])
+        if changed or upstream_stale:
+            stale.append(step)
+    return stale
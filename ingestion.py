@@ -0,0 +1,194 @@
+"""
+문서 수집 모듈
+
+업로드된 PDF/TXT/DOCX 문서를 백그라운드 작업자 하나가 차례로 읽고 임베딩해 벡터 인덱스에 추가합니다.
+- 업로드 파일은 documents/.incoming/에 먼저 저장하고, 색인이 끝난 뒤 documents/로 옮깁니다.
+- 새 인덱스 버전은 CURRENT 포인터 교체로 원자적으로 반영되므로, 진행 중인 세션은 기존 인덱스를
+  계속 사용하고 다음 실행부터 새 인덱스를 엽니다. 프로세스를 다시 시작할 필요가 없습니다.
+Streamlit에 의존하지 않으므로 명령줄에서도 사용할 수 있습니다.
+
+사용 예:
+    OPENAI_API_KEY=... python ingestion.py 새문서1.pdf 새문서2.docx
+"""
+import os
+import re
+import time
+import queue
+import shutil
+import argparse
+import threading
+
+from langchain_unstructured import UnstructuredLoader
+
+from vector_index import INDEX_DIR, add_documents, current_index_version, documents_fingerprint, open_shared_vector_store
+
+###############################################################################
+# 0. 설정
+###############################################################################
+DOCUMENTS_DIR = "./documents/"
+STAGING_DIR_NAME = ".incoming"
+SUPPORTED_EXTENSIONS = ["pdf", "txt", "docx"]
+
+
+def list_document_paths(documents_dir=DOCUMENTS_DIR):
+    """documents 폴더에서 색인 대상 문서 경로 목록"""
+    return [
+        os.path.join(documents_dir, filename)
+        for filename in os.listdir(documents_dir)
+        if any(filename.lower().endswith(ext) for ext in SUPPORTED_EXTENSIONS)
+    ]
+
+
+def load_documents(file_paths):
+    """문서 파일들을 UnstructuredLoader로 읽어 Document 리스트로 반환"""
+    all_docs = []
+    for file_path in file_paths:
+        loader = UnstructuredLoader(file_path)
+        documents = loader.load()
+        all_docs.extend(documents)
+    return all_docs
+
+###############################################################################
+# 1. 업로드 저장
+###############################################################################
+def stage_upload(filename, content, documents_dir=DOCUMENTS_DIR):
+    """
+    업로드 파일을 대기 폴더에 저장합니다. 같은 이름의 문서가 있으면 이름 뒤에 번호를 붙입니다.
+
+    Returns:
+        str: 저장된 파일 경로
+    """
+    name, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower().lstrip(".") not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"지원하지 않는 파일 형식입니다: {filename}")
+    name = re.sub(r"[^\w가-힣.-]+", "_", name) or "document"
+
+    staging_dir = os.path.join(documents_dir, STAGING_DIR_NAME)
+    os.makedirs(staging_dir, exist_ok=True)
+    candidate = f"{name}{ext}"
+    number = 1
+    while os.path.exists(os.path.join(documents_dir, candidate)) or os.path.exists(os.path.join(staging_dir, candidate)):
+        number += 1
+        candidate = f"{name}_{number}{ext}"
+
+    path = os.path.join(staging_dir, candidate)
+    with open(f"{path}.part", "wb") as f:
+        f.write(content)
+    os.replace(f"{path}.part", path)
+    return path
+
+###############################################################################
+# 2. 색인 작업
+###############################################################################
+def ingest_files(staged_paths, embeddings, load_documents, documents_dir=DOCUMENTS_DIR, index_dir=INDEX_DIR):
+    """
+    대기 폴더의 파일을 색인에 추가하고 documents 폴더로 옮깁니다.
+
+    Returns:
+        int: 추가된 청크 수
+    """
+    final_paths = [os.path.join(documents_dir, os.path.basename(path)) for path in staged_paths]
+
+    def move_into_documents():
+        # 파일 이름·크기·수정 시각이 그대로 유지되므로 지문은 옮기기 전후가 같음
+        for staged_path, final_path in zip(staged_paths, final_paths):
+            os.replace(staged_path, final_path)
+
+    if current_index_version(index_dir) is None:
+        # 인덱스가 아직 없으면 기존 문서와 함께 처음부터 구축
+        move_into_documents()
+        vector_store, _ = open_shared_vector_store(
+            embeddings, list_document_paths(documents_dir), load_documents, index_dir
+        )
+        return vector_store.index.ntotal if vector_store else 0
+
+    docs = load_documents(staged_paths)
+    # 옮긴 뒤의 문서 폴더 전체와 같은 지문 (기존 문서 + 새 문서)
+    fingerprint = documents_fingerprint(list_document_paths(documents_dir) + staged_paths)
+    _, added = add_documents(docs, embeddings, fingerprint, index_dir, before_swap=move_into_documents)
+    return added
+
+
+class IngestionJob:
+    """업로드 한 번에 해당하는 색인 작업의 상태"""
+
+    def __init__(self, staged_paths):
+        self.files = [os.path.basename(path) for path in staged_paths]
+        self.staged_paths = staged_paths
+        self.status = "queued"  # queued, running, done, failed
+        self.added_chunks = 0
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+
+class IngestionWorker:
+    """작업을 대기열에 넣으면 백그라운드 스레드 하나가 차례로 색인합니다."""
+
+    def __init__(self, embeddings, load_documents, documents_dir=DOCUMENTS_DIR, index_dir=INDEX_DIR, history=20):
+        self.embeddings = embeddings
+        self.load_documents = load_documents
+        self.documents_dir = documents_dir
+        self.index_dir = index_dir
+        self.history = history
+        self.jobs = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="ingestion", daemon=True).start()
+
+    def submit(self, staged_paths):
+        """대기 폴더에 저장한 파일들을 색인 대기열에 넣고 작업을 반환"""
+        job = IngestionJob(list(staged_paths))
+        with self._lock:
+            self.jobs.append(job)
+            del self.jobs[:-self.history]
+        self._queue.put(job)
+        return job
+
+    def recent_jobs(self):
+        with self._lock:
+            return list(reversed(self.jobs))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            try:
+                job.added_chunks = ingest_files(
+                    job.staged_paths, self.embeddings, self.load_documents, self.documents_dir, self.index_dir
+                )
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                # 실패한 파일은 다음 업로드와 섞이지 않도록 대기 폴더에서 치움
+                for path in job.staged_paths:
+                    if os.path.exists(path):
+                        failed_dir = os.path.join(self.documents_dir, STAGING_DIR_NAME, "failed")
+                        os.makedirs(failed_dir, exist_ok=True)
+                        shutil.move(path, os.path.join(failed_dir, os.path.basename(path)))
+            finally:
+                job.finished_at = time.time()
+
+###############################################################################
+# 3. 명령줄 실행
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description="문서를 벡터 인덱스에 추가합니다 (실행 중인 앱은 다음 실행부터 반영).")
+    parser.add_argument("files", nargs="+", help="추가할 PDF/TXT/DOCX 파일")
+    args = parser.parse_args()
+
+    from langchain_openai import OpenAIEmbeddings
+
+    staged_paths = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            staged_paths.append(stage_upload(path, f.read()))
+
+    embeddings = OpenAIEmbeddings(openai_api_key=os.environ.get("OPENAI_API_KEY"))
+    added = ingest_files(staged_paths, embeddings, load_documents)
+    print(f"{len(staged_paths)}개 파일, {added}개 청크를 추가했습니다.")
+
+
+if __name__ == "__main__":
+    main()
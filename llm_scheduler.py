@@ -0,0 +1,348 @@
+"""
+LLM 호출 스케줄러 모듈
+
+프로세스 안의 모든 ChatOpenAI 호출을 하나의 스케줄러로 모아 실행합니다.
+- 분당 요청 수와 분당 토큰 수 예산 (토큰 버킷)
+- 동시 실행 수 제한
+- 우선순위: 대화형 단계(1~4단계) 호출이 차시 묶음 같은 일괄 호출보다 먼저 실행
+- 같은 우선순위 안에서는 세션별 라운드 로빈으로 공정하게 실행
+요청이 몰리면 한꺼번에 실패하는 대신 대기열에서 순서를 기다리며, 대기 순서를 조회할 수 있습니다.
+또한 모델·설정·메시지가 같은 호출이 동시에 들어오면 한 번만 실행하고 결과를 함께 받습니다 (single-flight).
+호출(arun)은 스케줄러에서 실행 순서만 받아 호출한 이벤트 루프에서 그대로 실행하므로
+동시 호출마다 스레드를 쓰지 않습니다.
+"""
+import os
+import json
+import asyncio
+import time
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+###############################################################################
+# 0. 설정
+###############################################################################
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("SEOHS_LLM_RPM", "300"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("SEOHS_LLM_TPM", "300000"))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("SEOHS_LLM_CONCURRENCY", "8"))
+
+# 호출한 쪽의 세션 ID와 기본 우선순위 (백그라운드 스레드나 일괄 실행에서 설정)
+session_id_var = contextvars.ContextVar("llm_session_id", default=None)
+priority_var = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+###############################################################################
+# 1. 예산 (토큰 버킷)
+###############################################################################
+class _TokenBucket:
+    """분당 허용량을 초당 속도로 채우는 버킷. 분당 허용량이 0이면 제한 없음"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """amount만큼 쓰려면 기다려야 하는 초"""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+###############################################################################
+# 2. 스케줄러
+###############################################################################
+class _Ticket:
+    __slots__ = ("fn", "session_id", "priority", "tokens", "future")
+
+    def __init__(self, fn, session_id, priority, tokens):
+        self.fn = fn
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.future = Future()
+
+
+class LLMScheduler:
+    """
+    우선순위별·세션별 대기열을 두고 예산과 동시 실행 수가 허락할 때 하나씩 꺼내 실행합니다.
+    같은 우선순위에서는 세션 순서대로 한 건씩 돌아가며 실행하므로,
+    한 세션이 요청을 많이 넣어도 다른 세션의 요청이 뒤로 밀리지 않습니다.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._condition = threading.Condition()
+        self._queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_BULK: OrderedDict()}
+        self._running = 0
+        self._closed = False
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="llm-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, fn, session_id="default", priority=PRIORITY_BULK, tokens=0):
+        """
+        호출을 대기열에 넣고 티켓을 반환 (ticket.future로 결과 확인).
+        fn이 None이면 실행 순서만 받는 티켓으로, 차례가 되면 future 결과로 release 함수를 받습니다.
+        (release를 부를 때까지 실행 중인 호출로 셈)
+        """
+        ticket = _Ticket(fn, session_id, priority, tokens)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("닫힌 스케줄러에는 요청을 넣을 수 없습니다.")
+            self._queues[priority].setdefault(session_id, deque()).append(ticket)
+            self._condition.notify_all()
+        return ticket
+
+    def position(self, ticket):
+        """티켓의 대기 순서 (1이면 다음 실행). 이미 실행 중이거나 끝났으면 0"""
+        with self._condition:
+            sessions = self._queues[ticket.priority]
+            queue = sessions.get(ticket.session_id)
+            if not queue or ticket not in queue:
+                return 0
+            index = queue.index(ticket)
+
+            ahead = sum(
+                len(q) for priority, other in self._queues.items() if priority < ticket.priority
+                for q in other.values()
+            )
+            # 라운드 로빈 순서: 앞선 세션은 index+1건, 뒤 세션은 index건이 먼저 실행됨
+            before_me = True
+            for session_id, other_queue in sessions.items():
+                if session_id == ticket.session_id:
+                    before_me = False
+                    continue
+                ahead += min(len(other_queue), index + 1 if before_me else index)
+            return ahead + index + 1
+
+    async def arun(self, coro_fn, session_id="default", priority=PRIORITY_BULK, tokens=0, on_wait=None,
+                   poll_seconds=0.5):
+        """
+        차례가 될 때까지 기다린 뒤 await coro_fn()의 결과를 반환합니다.
+        기다리는 동안 poll_seconds마다 on_wait(대기 순서)를 호출합니다.
+        """
+        ticket = self.submit(None, session_id, priority, tokens)
+        waiter = asyncio.wrap_future(ticket.future)
+        try:
+            while True:
+                try:
+                    release = await asyncio.wait_for(asyncio.shield(waiter), poll_seconds)
+                    break
+                except asyncio.TimeoutError:
+                    if on_wait:
+                        position = self.position(ticket)
+                        if position:
+                            on_wait(position)
+        except asyncio.CancelledError:
+            # 취소되었는데 이미 차례를 받았다면 자리를 돌려줌
+            if not ticket.future.cancel():
+                ticket.future.add_done_callback(lambda future: future.result()())
+            raise
+
+        try:
+            return await coro_fn()
+        finally:
+            release()
+
+    def close(self):
+        """
+        새 요청을 더 받지 않습니다. 이미 대기 중인 요청은 모두 실행한 뒤
+        디스패처 스레드를 끝내고 실행 스레드 풀을 정리합니다 (실행 중인 호출은 끝까지 실행).
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        """현재 실행 중인 호출 수와 우선순위별 대기 건수"""
+        with self._condition:
+            return {
+                "running": self._running,
+                "interactive_waiting": sum(len(q) for q in self._queues[PRIORITY_INTERACTIVE].values()),
+                "bulk_waiting": sum(len(q) for q in self._queues[PRIORITY_BULK].values()),
+            }
+
+    def _head(self):
+        """다음에 실행할 (우선순위, 세션 ID, 티켓). 대기열이 비었으면 None"""
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            if sessions:
+                session_id, queue = next(iter(sessions.items()))
+                return priority, session_id, queue[0]
+        return None
+
+    def _pop(self, priority, session_id):
+        """세션의 첫 티켓을 꺼내고, 남은 요청이 있으면 세션을 맨 뒤로 보냄 (라운드 로빈)"""
+        sessions = self._queues[priority]
+        queue = sessions.pop(session_id)
+        queue.popleft()
+        if queue:
+            sessions[session_id] = queue
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while True:
+                    head = self._head()
+                    if head is None and self._closed:
+                        self._executor.shutdown(wait=False)
+                        return
+                    if head is None or self._running >= self.max_concurrency:
+                        self._condition.wait()
+                        continue
+                    ticket = head[2]
+                    wait = max(self._requests.wait_time(1), self._tokens.wait_time(ticket.tokens))
+                    if wait <= 0:
+                        break
+                    self._condition.wait(timeout=wait)
+
+                self._requests.consume(1)
+                self._tokens.consume(ticket.tokens)
+                self._pop(head[0], head[1])
+                self._running += 1
+
+            if ticket.fn is None:
+                self._grant(ticket)
+            else:
+                self._executor.submit(self._execute, ticket)
+
+    def _release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _grant(self, ticket):
+        """실행 순서만 받는 티켓에 release 함수를 넘김 (이미 취소된 티켓이면 바로 반납)"""
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self._release()
+
+        if ticket.future.set_running_or_notify_cancel():
+            ticket.future.set_result(release)
+        else:
+            release()
+
+    def _execute(self, ticket):
+        try:
+            if ticket.future.set_running_or_notify_cancel():
+                try:
+                    ticket.future.set_result(ticket.fn())
+                except BaseException as e:
+                    ticket.future.set_exception(e)
+        finally:
+            self._release()
+
+###############################################################################
+# 3. 프로세스 전역 스케줄러
+###############################################################################
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """프로세스에 하나뿐인 스케줄러 (처음 호출 시 환경 변수 설정으로 생성)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def configure(**kwargs):
+    """
+    전역 스케줄러를 주어진 설정으로 새로 만듭니다. 일괄 실행처럼 호출을 시작하기 전에 사용합니다.
+    (requests_per_minute, tokens_per_minute, max_concurrency)
+    이전 스케줄러는 닫아서, 대기 중이던 요청을 마저 실행한 뒤 스레드를 정리하도록 합니다.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        previous, _scheduler = _scheduler, LLMScheduler(**kwargs)
+    if previous:
+        previous.close()
+    return _scheduler
+
+###############################################################################
+# 4. 동일 요청 합치기 (single-flight)
+###############################################################################
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_stats = {"calls": 0, "coalesced": 0}
+
+
+def request_key(model, temperature, max_tokens, messages):
+    """모델, 설정, 메시지(역할과 내용)로 만든 요청 키"""
+    payload = json.dumps(
+        [model, temperature, max_tokens, [(message.type, message.content) for message in messages]],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_detached_tasks = set()  # 처음 호출한 쪽이 취소되어도 계속 실행되는 공유 호출 (참조 유지용)
+
+
+def _publish(key, future, task):
+    """공유 호출 task의 결과를 기다리던 모든 호출이 받도록 future에 옮김"""
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    _detached_tasks.discard(task)
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+async def asingle_flight(key, coro_fn):
+    """
+    같은 키의 호출이 이미 실행 중이면 그 결과를 기다려 함께 받고, 없으면 await coro_fn()을 실행합니다.
+    실행 중인 호출이 끝나면 키를 지우므로 결과를 보관하지는 않습니다 (지속 캐시는 별도).
+    coro_fn에서 난 예외는 기다리던 모든 호출에 그대로 전달됩니다.
+    호출은 처음 호출한 쪽과 분리된 task로 실행하므로, 기다리던 호출 하나가 취소되어도
+    (처음 호출한 쪽 포함) 공유 호출과 다른 호출은 영향을 받지 않습니다.
+    """
+    with _inflight_lock:
+        _inflight_stats["calls"] += 1
+        future = _inflight.get(key)
+        if future is not None:
+            _inflight_stats["coalesced"] += 1
+        else:
+            future = _inflight[key] = Future()
+            task = asyncio.ensure_future(coro_fn())
+            _detached_tasks.add(task)
+            task.add_done_callback(lambda task: _publish(key, future, task))
+
+    # shield: 이 호출이 취소되어도 공유 future는 취소하지 않음
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def single_flight_stats():
+    """지금까지의 호출 수와 실행 중인 호출에 합쳐진 수"""
+    with _inflight_lock:
+        return dict(_inflight_stats, inflight=len(_inflight))
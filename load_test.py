@@ -0,0 +1,356 @@
+"""
+부하 테스트 스크립트
+
+Streamlit AppTest로 가상 세션 N개를 동시에 띄워 1~6단계를 실제 화면 조작 순서대로 진행하고,
+단계별 지연시간(p50/p95/p99), 처리량, CPU 시간, 메모리(RSS)를 측정합니다.
+OpenAI 호출은 응답 길이에 비례해 지연되는 모의 모델로 대체하므로 API 키와 비용 없이 실행됩니다.
+(스케줄러, 동일 요청 합치기, 세션 메모리 관리 등 앱의 나머지 코드는 그대로 실행)
+
+사용 예:
+    python load_test.py --sessions 20 --total-hours 17 --latency-scale 0.2
+    python load_test.py --sessions 50 --max-p95 30   # 어느 단계든 p95가 30초를 넘으면 종료 코드 1
+
+출력:
+    load_test_report.json  단계별 지연시간 분포, 처리량, CPU/RSS 집계
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import resource
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+###############################################################################
+# 0. 모의 OpenAI 모델
+###############################################################################
+FIRST_TOKEN_SECONDS = 0.6     # 첫 토큰까지의 지연
+SECONDS_PER_TOKEN = 0.015     # 출력 토큰당 지연 (gpt-4o 기준 대략 초당 60~70토큰)
+EMBEDDING_DIM = 64
+
+
+def _lessons(start, end):
+    return [
+        {"lesson_number": str(number), "topic": f"{number}차시 학습주제",
+         "content": f"{number}차시에는 인공지능의 원리를 놀이와 실습으로 체험합니다.", "materials": "교육용 도구, 활동지"}
+        for number in range(start, end + 1)
+    ]
+
+
+def _standards(with_levels):
+    standards = [
+        {"code": f"3인공_0{number}", "description": f"인공지능의 기본 원리 {number}을(를) 체험하고 설명할 수 있다."}
+        for number in range(1, 4)
+    ]
+    if with_levels:
+        for standard in standards:
+            standard["levels"] = _levels()
+    return standards
+
+
+def _levels():
+    return [{"level": level, "description": f"{level}수준 성취 모습"} for level in "ABC"]
+
+
+def _methods():
+    return [{"method": "프로젝트 기반 학습", "description": "학생이 직접 프로젝트를 기획하고 실행합니다."},
+            {"method": "놀이 중심 학습", "description": "교육용 도구로 인공지능 원리를 체험합니다."}]
+
+
+def _assessments():
+    return [{"focus": "과정 중심 평가", "description": "활동 과정과 참여도를 관찰 평가합니다."},
+            {"focus": "포트폴리오 평가", "description": "활동 결과물을 모아 성장 과정을 평가합니다."}]
+
+
+def mock_response(prompt):
+    """프롬프트에 요청된 JSON 형식을 보고 그에 맞는 모의 응답을 만듦"""
+    basic_info = {"necessity": "인공지능 소양 교육이 필요합니다.", "overview": "3학년 대상 체험 중심 활동입니다.",
+                  "characteristics": "놀이와 실습 중심으로 운영합니다."}
+    goals_content = {"goals": ["지식 목표", "기능 목표", "태도 목표"], "domain": "통합 교과",
+                     "key_ideas": ["인공지능의 원리", "데이터의 역할", "윤리적 활용"]}
+
+    if '"basic_info"' in prompt:
+        payload = {"basic_info": basic_info, "goals_content": goals_content, "standards": _standards(True),
+                   "teaching_assessment": {"teaching_methods": _methods(), "assessment_plan": _assessments()}}
+    elif '"lesson_plans"' in prompt:
+        match = re.search(r"(\d+)차시부터 (\d+)차시까지", prompt)
+        start, end = (int(match.group(1)), int(match.group(2))) if match else (1, 10)
+        payload = {"lesson_plans": _lessons(start, end)}
+    elif '"standards"' in prompt:
+        payload = {"standards": _standards(False)}
+    elif '"levels"' in prompt and '"code"' not in prompt:
+        payload = {"levels": _levels()}
+    elif '"code"' in prompt:
+        payload = _standards(True)
+    elif '"teaching_methods"' in prompt and '"assessment_plan"' in prompt:
+        payload = {"teaching_methods": _methods(), "assessment_plan": _assessments()}
+    elif '"teaching_methods"' in prompt:
+        payload = {"teaching_methods": _methods()}
+    elif '"assessment_plan"' in prompt:
+        payload = {"assessment_plan": _assessments()}
+    elif '"goals"' in prompt:
+        payload = goals_content
+    else:
+        payload = basic_info
+    return json.dumps(payload, ensure_ascii=False)
+
+
+class MockChatOpenAI:
+    """ChatOpenAI 대신 사용하는 모의 모델. 출력 길이에 비례한 시간만큼 기다린 뒤 응답"""
+    latency_scale = 1.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def _respond(self, messages):
+        """(응답 내용, 응답까지 걸릴 시간)"""
+        content = mock_response(messages[-1].content)
+        completion_tokens = len(content) // 2
+        with MockChatOpenAI._lock:
+            MockChatOpenAI.calls += 1
+        return content, self.latency_scale * (FIRST_TOKEN_SECONDS + completion_tokens * SECONDS_PER_TOKEN)
+
+    def invoke(self, messages):
+        from langchain.schema import AIMessage
+
+        content, seconds = self._respond(messages)
+        time.sleep(seconds)
+        return AIMessage(content=content)
+
+    __call__ = invoke
+
+    async def ainvoke(self, messages):
+        """생성 엔진이 사용하는 비동기 호출 (엔진 루프를 막지 않고 기다림)"""
+        import asyncio
+        from langchain.schema import AIMessage
+
+        content, seconds = self._respond(messages)
+        await asyncio.sleep(seconds)
+        return AIMessage(content=content)
+
+
+class MockEmbeddings:
+    """문장 해시로 만든 고정 벡터를 돌려주는 모의 임베딩"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def _vector(self, text):
+        import numpy as np
+        return np.random.default_rng(zlib.crc32(text.encode("utf-8"))).normal(size=EMBEDDING_DIM).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def __call__(self, text):
+        return self._vector(text)
+
+
+def install_mocks(latency_scale):
+    """앱이 import하기 전에 OpenAI 클래스를 모의 객체로 교체"""
+    import langchain_openai
+
+    MockChatOpenAI.latency_scale = latency_scale
+    langchain_openai.ChatOpenAI = MockChatOpenAI
+    langchain_openai.OpenAIEmbeddings = MockEmbeddings
+
+###############################################################################
+# 1. 세션 시나리오
+###############################################################################
+def _click(at, label):
+    """라벨이 같은 활성 버튼(폼 제출 버튼 포함)을 눌러 다시 실행"""
+    button = next(b for b in at.button if b.label == label and not b.disabled)
+    button.click().run()
+
+
+def _has_button(at, label):
+    return any(b.label == label for b in at.button)
+
+
+def run_session(number, args):
+    """
+    가상 교사 한 명이 1단계 입력부터 Excel 내보내기까지 진행합니다.
+
+    Returns:
+        dict: {"steps": {단계: 초}, "error": 오류 메시지 또는 None}
+    """
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+
+    def timed(step, action):
+        started = time.perf_counter()
+        action()
+        timings[step] = timings.get(step, 0.0) + time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(f"{step}단계: {at.exception[0].message}")
+
+    try:
+        timed("load", at.run)
+
+        # 1단계: 기본 정보 입력 후 생성, 수정 없이 저장
+        activity = "인공지능 놀이터" if args.identical else f"인공지능 놀이터 {number}"
+        next(w for w in at.text_input if w.label == "활동명").input(activity)
+        next(w for w in at.text_area if w.label == "요구사항").input("학생들의 디지털 리터러시 역량 강화가 필요함")
+        next(w for w in at.number_input if w.label == "총 차시").set_value(args.total_hours)
+        at.multiselect(key="grades_multiselect_elem").select("3학년")
+        at.multiselect(key="subjects_multiselect_elem").select("과학")
+        timed(1, lambda: _click(at, "정보 생성 및 다음 단계로"))
+        if _has_button(at, "참고하지 않고 새로 생성"):
+            timed(1, lambda: _click(at, "참고하지 않고 새로 생성"))
+        timed(1, lambda: _click(at, "수정사항 저장 및 다음 단계로"))
+
+        # 2~4단계: 생성 후 저장
+        for step, label in [(2, "목표/내용 생성 및 다음 단계로"), (3, "성취기준 생성 및 다음 단계로"),
+                            (4, "교수학습/평가계획 생성 및 다음 단계로")]:
+            timed(step, lambda: _click(at, label))
+            timed(step, lambda: _click(at, "수정사항 저장 및 다음 단계로"))
+
+        # 5단계: 백그라운드 생성이 끝날 때까지 fragment 폴링처럼 다시 실행한 뒤 저장
+        def generate_lessons():
+            _click(at, f"{args.total_hours}차시 계획 생성 및 다음 단계로")
+            deadline = time.monotonic() + args.timeout * 10
+            while "lesson_job" in at.session_state and time.monotonic() < deadline:
+                time.sleep(args.poll_seconds)
+                at.run()
+            _click(at, "수정사항 저장 및 다음 단계로")
+        timed(5, generate_lessons)
+
+        # 6단계: 최종 검토와 Excel 만들기
+        timed(6, lambda: _click(at, "📄 Excel 파일 만들기"))
+        return {"steps": timings, "error": None}
+    except Exception as e:
+        return {"steps": timings, "error": str(e)}
+
+###############################################################################
+# 2. 측정 및 보고
+###############################################################################
+def current_rss_mb():
+    """현재 프로세스 RSS (MB). /proc가 없으면 최대 RSS로 대신함"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q):
+    """정렬된 값의 nearest-rank 백분위수"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, int(round(q / 100 * len(values) + 0.5)))
+    return round(values[min(rank, len(values)) - 1], 3)
+
+
+def run_load_test(args):
+    import llm_scheduler
+
+    llm_scheduler.configure(
+        requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_concurrency=args.llm_concurrency
+    )
+
+    # 인덱스 구축 등 첫 실행 비용은 측정에서 제외
+    warmup = run_session(0, args)
+    if warmup["error"]:
+        raise RuntimeError(f"준비 실행 실패: {warmup['error']}")
+
+    calls_before = MockChatOpenAI.calls
+    rss_before = current_rss_mb()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        futures = []
+        for number in range(1, args.sessions + 1):
+            futures.append(pool.submit(run_session, number, args))
+            time.sleep(args.ramp_seconds / max(1, args.sessions))
+        results = [future.result() for future in futures]
+
+    elapsed = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_before
+    rss_after = current_rss_mb()
+
+    completed = [result for result in results if not result["error"]]
+    steps = {}
+    for result in completed:
+        for step, seconds in result["steps"].items():
+            steps.setdefault(str(step), []).append(seconds)
+
+    return {
+        "sessions": args.sessions,
+        "completed": len(completed),
+        "errors": [result["error"] for result in results if result["error"]],
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_sessions_per_minute": round(len(completed) / elapsed * 60, 2) if elapsed else None,
+        "llm_calls": MockChatOpenAI.calls - calls_before,
+        "step_latency_seconds": {
+            step: {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+                   "max": round(max(values), 3)}
+            for step, values in steps.items()
+        },
+        "cpu_seconds": round(cpu_seconds, 2),
+        "cpu_seconds_per_session": round(cpu_seconds / args.sessions, 3),
+        "rss_mb": {"before": round(rss_before, 1), "after": round(rss_after, 1),
+                   "peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)},
+        "rss_mb_per_session": round((rss_after - rss_before) / args.sessions, 2),
+        "settings": {"total_hours": args.total_hours, "latency_scale": args.latency_scale,
+                     "identical": args.identical, "rpm": args.rpm, "llm_concurrency": args.llm_concurrency}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="가상 세션으로 1~6단계를 동시에 진행하며 용량을 측정합니다.")
+    parser.add_argument("--sessions", type=int, default=10, help="동시 세션 수")
+    parser.add_argument("--ramp-seconds", type=float, default=5, help="세션을 모두 시작하는 데 걸리는 시간")
+    parser.add_argument("--total-hours", type=int, default=17, help="세션마다 생성할 총 차시")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="모의 모델 지연 배율 (0이면 지연 없음)")
+    parser.add_argument("--identical", action="store_true", help="모든 세션이 같은 활동을 입력 (동일 요청 합치기 확인)")
+    parser.add_argument("--rpm", type=int, default=0, help="스케줄러 분당 요청 수 (0이면 제한 없음)")
+    parser.add_argument("--tpm", type=int, default=0, help="스케줄러 분당 토큰 수 (0이면 제한 없음)")
+    parser.add_argument("--llm-concurrency", type=int, default=32, help="스케줄러 동시 호출 수")
+    parser.add_argument("--timeout", type=float, default=60, help="화면 실행 한 번의 제한 시간(초)")
+    parser.add_argument("--poll-seconds", type=float, default=1, help="5단계 진행 상황 확인 주기")
+    parser.add_argument("--max-p95", type=float, help="어느 단계든 p95가 이 값(초)을 넘으면 종료 코드 1")
+    parser.add_argument("--out", default="load_test_report.json", help="보고서 저장 경로")
+    args = parser.parse_args()
+
+    # 저장소와 인덱스는 임시 폴더를 사용하고, 모의 모델은 앱을 불러오기 전에 설치
+    work_dir = tempfile.mkdtemp(prefix="seohs_load_")
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ["SEOHS_DB_PATH"] = os.path.join(work_dir, "plans.db")
+    os.environ["SEOHS_INDEX_DIR"] = os.path.join(work_dir, "vector_index")
+    install_mocks(args.latency_scale)
+
+    report = run_load_test(args)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if report["errors"]:
+        sys.exit(1)
+    if args.max_p95 is not None:
+        slow = {step: stats["p95"] for step, stats in report["step_latency_seconds"].items() if stats["p95"] > args.max_p95}
+        if slow:
+            print(f"p95 기준({args.max_p95}초) 초과: {slow}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
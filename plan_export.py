@@ -0,0 +1,339 @@
+"""
+계획서 내보내기 모듈
+
+계획서 데이터(dict)를 Excel(xlsx), Word(docx), PDF로 렌더링하고,
+저장된 계획서(JSON) 폴더를 프로세스 풀에서 한 번에 변환해 zip으로 내보냅니다.
+Streamlit 없이 실행되므로 명령줄에서 바로 사용할 수 있습니다.
+
+사용 예:
+    python plan_export.py ./saved_plans ./export.zip --formats xlsx,docx,pdf --workers 4
+"""
+import os
+import re
+import json
+import time
+import zipfile
+import argparse
+from io import BytesIO
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import xlsxwriter
+
+###############################################################################
+# 0. 공통 설정
+###############################################################################
+LESSON_COLUMNS = ["lesson_number", "topic", "content", "materials"]
+
+# docx/PDF 본문에 사용할 한글 글꼴
+DOCX_FONT = "맑은 고딕"
+PDF_FONT = "HYSMyeongJo-Medium"  # reportlab 내장 한국어 CID 글꼴
+
+###############################################################################
+# 1. 계획서 내용 구성
+###############################################################################
+def plan_sections(data):
+    """
+    계획서를 (제목, 헤더, 행 리스트) 구역으로 정리합니다.
+    Excel 시트, docx 표, PDF 표가 모두 같은 구성을 사용합니다.
+    """
+    basic_info = [
+        ('학교급', data.get('school_type', '')),
+        ('대상학년', ', '.join(data.get('grades', []))),
+        ('총차시', data.get('total_hours', '')),
+        ('주당차시', data.get('weekly_hours', '')),
+        ('운영학기', ', '.join(data.get('semester', []))),
+        ('연계교과', ', '.join(data.get('subjects', []))),
+        ('활동명', data.get('activity_name', '')),
+        ('요구사항', data.get('requirements', '')),
+        ('필요성', data.get('necessity', '')),
+        ('개요', data.get('overview', '')),
+        ('성격', data.get('characteristics', ''))
+    ]
+
+    goals_data = [('목표', goal) for goal in data.get('goals', [])]
+    goals_data += [('핵심아이디어', idea) for idea in data.get('key_ideas', [])]
+
+    standards_data = [
+        (std['code'], std['description'], level['level'], level['description'])
+        for std in data.get('standards', [])
+        for level in std['levels']
+    ]
+
+    methods_data = [
+        ('교수학습방법', method.get('method', ''), method.get('description', ''))
+        for method in data.get('teaching_methods', [])
+    ]
+    methods_data += [
+        ('평가계획', plan.get('focus', ''), plan.get('description', ''))
+        for plan in data.get('assessment_plan', [])
+    ]
+
+    lesson_data = [
+        tuple(plan.get(column, '') for column in LESSON_COLUMNS)
+        for plan in data.get('lesson_plans', [])
+    ]
+
+    return [
+        ('기본정보', ['', '내용'], basic_info),
+        ('목표및내용', ['구분', '내용'], goals_data),
+        ('성취기준', ['성취기준', '설명', '수준', '수준별설명'], standards_data),
+        ('교수학습및평가', ['구분', '항목', '설명'], methods_data),
+        ('차시별계획', ['차시', '학습주제', '학습내용', '교수학습자료'], lesson_data),
+    ]
+
+###############################################################################
+# 2. Excel
+###############################################################################
+def render_xlsx(data):
+    """
+    계획서를 Excel 문서로 렌더링합니다.
+    중간 DataFrame 없이 xlsxwriter의 constant_memory 모드로 행을 바로 기록합니다.
+
+    Returns:
+        bytes: xlsx 파일 내용
+    """
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+
+    # 셀 스타일 설정
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#E2E8F0',
+        'border': 1,
+        'text_wrap': True,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+
+    content_format = workbook.add_format({
+        'text_wrap': True,
+        'valign': 'top',
+        'border': 1
+    })
+
+    for sheet_name, headers, rows in plan_sections(data):
+        worksheet = workbook.add_worksheet(sheet_name)
+
+        # 열 너비 및 행 높이 설정 (constant_memory 모드는 행을 위에서부터 순서대로만 기록)
+        worksheet.set_column('A:A', 15)  # 첫 번째 열
+        worksheet.set_column('B:B', 40)  # 두 번째 열
+        worksheet.set_column('C:D', 20)  # 세 번째, 네 번째 열
+        worksheet.set_default_row(30)
+        worksheet.set_row(0, 40)  # 헤더 행 높이
+
+        worksheet.write_row(0, 0, headers, header_format)
+        for row_idx, row in enumerate(rows, start=1):
+            worksheet.write_row(row_idx, 0, row, content_format)
+
+    workbook.close()
+    return output.getvalue()
+
+###############################################################################
+# 3. Word (docx)
+###############################################################################
+def render_docx(data):
+    """
+    계획서를 Word 문서로 렌더링합니다. 한글(hwp)에서 불러와 편집하기 쉽도록
+    구역마다 제목과 표 하나로만 구성합니다.
+
+    Returns:
+        bytes: docx 파일 내용
+    """
+    try:
+        from docx import Document
+        from docx.oxml.ns import qn
+    except ImportError as e:
+        raise RuntimeError("docx 내보내기에는 python-docx 패키지가 필요합니다.") from e
+
+    document = Document()
+    style = document.styles['Normal']
+    style.font.name = DOCX_FONT
+    style.element.rPr.rFonts.set(qn('w:eastAsia'), DOCX_FONT)
+
+    document.add_heading(data.get('activity_name') or '학교자율시간 계획서', level=0)
+
+    for title, headers, rows in plan_sections(data):
+        document.add_heading(title, level=1)
+        table = document.add_table(rows=1, cols=len(headers))
+        table.style = 'Table Grid'
+        for cell, header in zip(table.rows[0].cells, headers):
+            cell.text = header
+        for row in rows:
+            for cell, value in zip(table.add_row().cells, row):
+                cell.text = str(value)
+
+    output = BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+###############################################################################
+# 4. PDF
+###############################################################################
+def render_pdf(data):
+    """
+    계획서를 PDF로 렌더링합니다. reportlab 내장 한국어 CID 글꼴을 사용하므로
+    별도 글꼴 파일이 필요하지 않습니다.
+
+    Returns:
+        bytes: pdf 파일 내용
+    """
+    try:
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    except ImportError as e:
+        raise RuntimeError("PDF 내보내기에는 reportlab 패키지가 필요합니다.") from e
+
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(PDF_FONT))
+
+    styles = getSampleStyleSheet()
+    body = ParagraphStyle('body', parent=styles['BodyText'], fontName=PDF_FONT, fontSize=9, leading=12, wordWrap='CJK')
+    heading = ParagraphStyle('heading', parent=styles['Heading2'], fontName=PDF_FONT)
+    title = ParagraphStyle('title', parent=styles['Title'], fontName=PDF_FONT)
+
+    def cell(value):
+        text = str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        return Paragraph(text.replace('\n', '<br/>'), body)
+
+    output = BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    story = [Paragraph(data.get('activity_name') or '학교자율시간 계획서', title)]
+
+    for section_title, headers, rows in plan_sections(data):
+        story.append(Paragraph(section_title, heading))
+        col_width = doc.width / len(headers)
+        table = Table(
+            [[cell(h) for h in headers]] + [[cell(v) for v in row] for row in rows],
+            colWidths=[col_width] * len(headers),
+            repeatRows=1
+        )
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#E2E8F0')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story.extend([table, Spacer(1, 12)])
+
+    doc.build(story)
+    return output.getvalue()
+
+
+RENDERERS = {
+    "xlsx": render_xlsx,
+    "docx": render_docx,
+    "pdf": render_pdf,
+}
+
+###############################################################################
+# 5. 일괄 내보내기
+###############################################################################
+def export_filename(data, fallback):
+    """zip 안에서 사용할 안전한 파일 이름 (활동명이 없으면 fallback)"""
+    name = data.get('activity_name') or fallback
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name).strip('_') or fallback
+
+
+def _render_plan_file(plan_path, formats):
+    """저장된 계획서 하나를 요청한 형식들로 렌더링 (프로세스 풀 작업 단위)"""
+    with open(plan_path, encoding="utf-8") as f:
+        data = json.load(f)
+    stem = os.path.splitext(os.path.basename(plan_path))[0]
+    name = f"{stem}_{export_filename(data, stem)}"
+    return [(f"{name}.{fmt}", RENDERERS[fmt](data)) for fmt in formats]
+
+
+def bulk_export(plan_dir, zip_path, formats=("xlsx",), workers=None, progress=None):
+    """
+    plan_dir의 계획서 JSON 파일을 모두 변환해 zip_path 하나로 묶습니다.
+
+    렌더링은 프로세스 풀에서 병렬로 수행하고, 완료된 결과는 곧바로 zip에 기록한 뒤 버립니다.
+    동시에 처리 중인 계획서 수를 작업자 수의 두 배로 제한해 메모리 사용량이 계획서 수와 무관합니다.
+
+    Args:
+        plan_dir (str): 저장된 계획서(JSON) 폴더
+        zip_path (str): 생성할 zip 파일 경로
+        formats (tuple, optional): 내보낼 형식 (xlsx, docx, pdf)
+        workers (int, optional): 프로세스 수. 기본값은 CPU 수
+        progress (callable, optional): (완료 수, 전체 수)를 받는 진행 콜백
+
+    Returns:
+        dict: 처리량 보고서 (계획서 수, 파일 수, 바이트 수, 소요 시간, 초당 처리량, 실패 목록)
+    """
+    unknown = [fmt for fmt in formats if fmt not in RENDERERS]
+    if unknown:
+        raise ValueError(f"지원하지 않는 형식입니다: {', '.join(unknown)}")
+
+    plan_paths = sorted(
+        os.path.join(plan_dir, name)
+        for name in os.listdir(plan_dir)
+        if name.lower().endswith(".json")
+    )
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+
+    report = {"plans": len(plan_paths), "exported": 0, "files": 0, "bytes": 0, "failed": []}
+    started = time.perf_counter()
+
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        queue = iter(plan_paths)
+        done_count = 0
+
+        while True:
+            # 처리 중인 작업이 상한에 닿을 때까지 새 작업 제출
+            for plan_path in queue:
+                pending[pool.submit(_render_plan_file, plan_path, tuple(formats))] = plan_path
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                plan_path = pending.pop(future)
+                done_count += 1
+                try:
+                    for filename, content in future.result():
+                        archive.writestr(filename, content)
+                        report["files"] += 1
+                        report["bytes"] += len(content)
+                    report["exported"] += 1
+                except Exception as e:
+                    report["failed"].append({"plan": os.path.basename(plan_path), "error": str(e)})
+                if progress:
+                    progress(done_count, len(plan_paths))
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 3)
+    report["plans_per_second"] = round(report["exported"] / elapsed, 2) if elapsed else 0.0
+    report["mb_per_second"] = round(report["bytes"] / 1_000_000 / elapsed, 2) if elapsed else 0.0
+    return report
+
+###############################################################################
+# 6. 명령줄 실행
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description="저장된 계획서를 여러 형식으로 일괄 내보냅니다.")
+    parser.add_argument("plan_dir", help="계획서 JSON 파일이 있는 폴더")
+    parser.add_argument("zip_path", help="생성할 zip 파일 경로")
+    parser.add_argument("--formats", default="xlsx", help="쉼표로 구분한 형식 (xlsx,docx,pdf)")
+    parser.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본값: CPU 수)")
+    args = parser.parse_args()
+
+    formats = [fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()]
+
+    def show_progress(done, total):
+        print(f"\r{done}/{total} 계획서 처리", end="", flush=True)
+
+    report = bulk_export(args.plan_dir, args.zip_path, formats, args.workers, show_progress)
+    print()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+계획서 데이터 모델 모듈
+
+세션에 보관하는 계획서를 중첩 dict 대신 __slots__ 데이터 클래스로 표현합니다.
+- 항목마다 dict를 두지 않으므로 차시가 많아도 객체 하나당 메모리가 작고 일정합니다.
+- 모든 클래스가 dict와 같은 방식(data.get('goals'), plan['topic'] = ...)으로 읽고 쓸 수 있어
+  생성, 검증, 내보내기 코드는 dict와 계획서 객체를 구분하지 않고 사용할 수 있습니다.
+- 값이 None인 항목은 없는 키로 취급하므로 'lesson_plans' in data 같은 검사도 dict와 같게 동작합니다.
+Streamlit에 의존하지 않으므로 일괄 처리 스크립트에서도 사용할 수 있습니다.
+"""
+import sys
+import json
+import hashlib
+import functools
+import dataclasses
+from typing import ClassVar
+from collections.abc import Mapping, MutableMapping
+from dataclasses import dataclass
+
+###############################################################################
+# 0. 공통 기반 클래스
+###############################################################################
+@functools.lru_cache(maxsize=None)
+def _field_names(cls):
+    return tuple(field.name for field in dataclasses.fields(cls) if field.name != "_extra")
+
+
+class _Record(MutableMapping):
+    """
+    dict처럼 읽고 쓸 수 있는 __slots__ 데이터 클래스의 기반 클래스.
+    정의되지 않은 키는 _extra에 보관하여 불러온 데이터를 잃지 않습니다.
+    """
+    __slots__ = ()
+
+    # 하위 레코드 리스트로 변환할 항목 (항목 이름 -> 레코드 클래스)
+    NESTED: ClassVar[dict] = {}
+
+    @classmethod
+    def from_dict(cls, mapping):
+        record = cls()
+        for key, value in mapping.items():
+            record[key] = value
+        return record
+
+    def _coerce(self, key, value):
+        """하위 레코드 항목의 dict를 레코드로 변환 (리스트는 같은 객체를 유지한 채 내용만 바꿈)"""
+        record_cls = self.NESTED.get(key)
+        if record_cls is not None and isinstance(value, list):
+            value[:] = [
+                record_cls.from_dict(item) if isinstance(item, Mapping) and not isinstance(item, record_cls) else item
+                for item in value
+            ]
+        return value
+
+    def compact(self):
+        """다른 코드가 리스트에 직접 넣은 dict까지 레코드로 변환"""
+        for key in self.NESTED:
+            value = getattr(self, key)
+            if value is not None:
+                self._coerce(key, value)
+                for item in value:
+                    if isinstance(item, _Record):
+                        item.compact()
+        return self
+
+    def __getitem__(self, key):
+        if key in _field_names(type(self)):
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _field_names(type(self)):
+            setattr(self, key, self._coerce(key, value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _field_names(type(self)):
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in _field_names(type(self)):
+            if getattr(self, name) is not None:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def setdefault(self, key, default=None):
+        # 저장 시 변환된 값을 돌려주도록 다시 읽음 (MutableMapping 기본 구현은 default를 그대로 반환)
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def to_dict(self):
+        """JSON으로 저장할 수 있는 중첩 dict로 변환"""
+        return {
+            key: [item.to_dict() if isinstance(item, _Record) else item for item in value]
+            if isinstance(value, list) else value
+            for key, value in self.items()
+        }
+
+###############################################################################
+# 1. 계획서 구성 요소
+###############################################################################
+@dataclass(slots=True, eq=False)
+class Level(_Record):
+    level: str = None
+    description: str = None
+    _extra: dict = None
+
+
+@dataclass(slots=True, eq=False)
+class Standard(_Record):
+    NESTED: ClassVar[dict] = {"levels": Level}
+
+    code: str = None
+    description: str = None
+    levels: list = None
+    _extra: dict = None
+
+
+@dataclass(slots=True, eq=False)
+class TeachingMethod(_Record):
+    method: str = None
+    description: str = None
+    _extra: dict = None
+
+
+@dataclass(slots=True, eq=False)
+class Assessment(_Record):
+    focus: str = None
+    description: str = None
+    _extra: dict = None
+
+
+@dataclass(slots=True, eq=False)
+class LessonPlan(_Record):
+    lesson_number: str = None
+    topic: str = None
+    content: str = None
+    materials: str = None
+    _extra: dict = None
+
+
+@dataclass(slots=True, eq=False)
+class Plan(_Record):
+    """계획서 전체 (세션에 보관하는 유일한 원본)"""
+    NESTED: ClassVar[dict] = {
+        "standards": Standard,
+        "teaching_methods": TeachingMethod,
+        "assessment_plan": Assessment,
+        "lesson_plans": LessonPlan
+    }
+
+    # 1단계 입력 및 생성 결과
+    school_type: str = None
+    grades: list = None
+    subjects: list = None
+    activity_name: str = None
+    requirements: str = None
+    total_hours: int = None
+    weekly_hours: int = None
+    semester: list = None
+    necessity: str = None
+    overview: str = None
+    characteristics: str = None
+    # 2~5단계 생성 결과
+    goals: list = None
+    domain: str = None
+    key_ideas: list = None
+    standards: list = None
+    teaching_methods: list = None
+    assessment_plan: list = None
+    lesson_plans: list = None
+    # 단계별 생성 당시 입력 해시
+    _step_inputs: dict = None
+    _extra: dict = None
+
+
+def as_plan(data):
+    """dict 또는 Plan을 하위 항목까지 레코드로 정리된 Plan으로 반환"""
+    if isinstance(data, Plan):
+        return data.compact()
+    return Plan.from_dict(data or {}).compact()
+
+###############################################################################
+# 2. 직렬화 및 메모리 측정
+###############################################################################
+def json_default(value):
+    """json.dumps의 default 인자: 레코드는 dict로, 그 밖의 값은 문자열로 변환"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+def plan_fingerprint(data):
+    """계획서 데이터의 해시. 내용이 같으면 생성·내보내기 결과를 재사용하는 데 사용"""
+    serialized = json.dumps(data, sort_keys=True, ensure_ascii=False, default=json_default)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def deep_sizeof(value, seen=None):
+    """객체와 그 안의 dict/리스트/레코드/문자열이 차지하는 대략적인 바이트 수"""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(deep_sizeof(item, seen) for item in value)
+    if isinstance(value, _Record):
+        return size + sum(deep_sizeof(getattr(value, name), seen) for name in value.__slots__)
+    return size
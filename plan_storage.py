@@ -0,0 +1,122 @@
+"""
+계획서 저장소 모듈
+
+계획서 데이터와 단계별 생성 결과를 로컬 SQLite 파일에 저장합니다.
+- plans: 계획서 ID별 현재 단계와 데이터 (기본 키 조회 한 번으로 불러옴)
+  API로 만든 계획서는 만든 클라이언트(owner)를 함께 기록해 다른 클라이언트가 읽지 못하게 합니다.
+- step_results: 계획서·단계별 생성 결과와 그때의 입력 해시 (입력이 같으면 재사용)
+Streamlit에 의존하지 않으므로 일괄 처리 스크립트에서도 사용할 수 있습니다.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from plan_model import json_default
+
+###############################################################################
+# 0. 설정 및 연결
+###############################################################################
+DB_PATH = os.environ.get("SEOHS_DB_PATH", "./plans.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    step INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT
+);
+CREATE TABLE IF NOT EXISTS step_results (
+    plan_id TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    input_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (plan_id, step)
+);
+"""
+
+_local = threading.local()
+
+
+def get_connection(db_path=None):
+    """스레드별 SQLite 연결 (WAL 모드로 여러 세션이 동시에 읽고 쓸 수 있음)"""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    if db_path not in connections:
+        connection = sqlite3.connect(db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        # owner 열이 없던 이전 파일에 열 추가
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(plans)")}
+        if "owner" not in columns:
+            connection.execute("ALTER TABLE plans ADD COLUMN owner TEXT")
+        connections[db_path] = connection
+    return connections[db_path]
+
+###############################################################################
+# 1. 계획서 저장 및 불러오기
+###############################################################################
+def new_plan_id():
+    """URL에 넣기 좋은 짧은 계획서 ID"""
+    return uuid.uuid4().hex[:12]
+
+
+def save_plan(plan_id, step, data, db_path=None, owner=None):
+    """계획서의 현재 단계와 데이터를 저장 (있으면 덮어씀. owner는 처음 저장할 때의 값을 유지)"""
+    connection = get_connection(db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO plans (id, step, data, updated_at, owner) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET step=excluded.step, data=excluded.data, updated_at=excluded.updated_at, "
+            "owner=COALESCE(plans.owner, excluded.owner)",
+            (plan_id, step, json.dumps(data, ensure_ascii=False, default=json_default), time.time(), owner)
+        )
+
+
+def load_plan(plan_id, db_path=None, owner=None):
+    """
+    저장된 계획서를 불러옵니다. owner를 주면 그 클라이언트가 만든 계획서만 불러옵니다.
+
+    Returns:
+        tuple: (단계, 계획서 데이터 dict). 없으면 (None, None)
+    """
+    query = "SELECT step, data FROM plans WHERE id = ?"
+    params = (plan_id,)
+    if owner is not None:
+        query += " AND owner = ?"
+        params += (owner,)
+    row = get_connection(db_path).execute(query, params).fetchone()
+    if row is None:
+        return None, None
+    return row[0], json.loads(row[1])
+
+###############################################################################
+# 2. 단계별 생성 결과
+###############################################################################
+def save_step_result(plan_id, step, input_hash, result, db_path=None):
+    """단계 생성 결과를 입력 해시와 함께 저장 (단계마다 최신 결과 하나만 유지)"""
+    connection = get_connection(db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO step_results (plan_id, step, input_hash, result, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(plan_id, step) DO UPDATE SET input_hash=excluded.input_hash, "
+            "result=excluded.result, created_at=excluded.created_at",
+            (plan_id, step, input_hash, json.dumps(result, ensure_ascii=False, default=json_default), time.time())
+        )
+
+
+def load_step_result(plan_id, step, input_hash, db_path=None):
+    """입력 해시가 같을 때만 저장된 단계 생성 결과를 반환. 없으면 None"""
+    row = get_connection(db_path).execute(
+        "SELECT result FROM step_results WHERE plan_id = ? AND step = ? AND input_hash = ?",
+        (plan_id, step, input_hash)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
@@ -0,0 +1,224 @@
+"""
+실행 프로파일링 모듈
+
+SEOHS_PROFILE=1일 때만 동작하는 선택적 프로파일러입니다.
+스크립트 실행 전체와 각 단계 함수(fragment 단독 재실행 포함)를 구간으로 감싸
+실행 시간, 새로 그린 위젯 수, 남은 메모리 증가량을 기록하고,
+가장 바깥 구간은 cProfile과 tracemalloc으로 시간/메모리를 많이 쓴 함수와 코드 줄을 모읍니다.
+- SEOHS_PROFILE_SAMPLE_RATE: 프로파일링할 실행의 비율 (기본 1.0 = 모든 실행)
+- SEOHS_PROFILE_DIR: 지정하면 실행마다 .prof 파일을 저장 (python -m pstats, snakeviz 등으로 열람)
+cProfile과 tracemalloc은 프로세스 전역이므로 한 번에 한 실행만 프로파일링하고
+(다른 세션이 프로파일링 중인 실행은 건너뜀), 가장 바깥 구간이 끝나면 tracemalloc 추적을 끕니다.
+추적하는 동안 동시에 실행 중인 다른 세션의 할당도 함께 잡힐 수 있습니다.
+Streamlit에 의존하지 않으며 위젯 수는 호출하는 쪽이 넘긴 함수로 셉니다.
+"""
+import os
+import time
+import random
+import pstats
+import cProfile
+import functools
+import threading
+import contextlib
+import tracemalloc
+from collections import deque
+
+###############################################################################
+# 0. 설정
+###############################################################################
+PROFILE_ENABLED = os.environ.get("SEOHS_PROFILE", "").lower() not in ("", "0", "false")
+PROFILE_SAMPLE_RATE = float(os.environ.get("SEOHS_PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_DIR = os.environ.get("SEOHS_PROFILE_DIR", "")
+HOTSPOT_LIMIT = 15
+HISTORY_SIZE = 200
+TRACEMALLOC_FRAMES = 5
+
+###############################################################################
+# 1. 구간 기록
+###############################################################################
+class ProfileRecord:
+    """구간 한 번의 측정 결과"""
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.widgets = None
+        self.allocated_bytes = 0
+        self.hotspots = {}        # {"cumulative": [...], "tottime": [...]} (가장 바깥 구간만)
+        self.memory_hotspots = []  # 메모리가 늘어난 코드 줄 (가장 바깥 구간만)
+        self.profile_path = None
+        self.error = None
+
+
+_records = deque(maxlen=HISTORY_SIZE)
+_records_lock = threading.Lock()
+_profile_lock = threading.Lock()  # 프로파일링 중인 가장 바깥 구간 (프로세스에서 하나)
+_local = threading.local()
+
+
+def _function_label(key):
+    filename, line, function = key
+    if filename == "~":
+        return function
+    return f"{os.path.basename(filename)}:{line}({function})"
+
+
+def _hotspots(profiler, sort):
+    stats = pstats.Stats(profiler)
+    rows = [
+        {"function": _function_label(key), "calls": calls, "tottime": round(tottime, 4), "cumtime": round(cumtime, 4)}
+        for key, (_, calls, tottime, cumtime, _) in stats.stats.items()
+    ]
+    rows.sort(key=lambda row: row["cumtime" if sort == "cumulative" else "tottime"], reverse=True)
+    return rows[:HOTSPOT_LIMIT]
+
+
+def _memory_hotspots(before, after):
+    return [
+        {"line": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+         "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+        for stat in after.compare_to(before, "lineno")[:HOTSPOT_LIMIT]
+        if stat.size_diff > 0
+    ]
+
+
+def _dump(profiler, record):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(record.started_at))
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{record.name}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+@contextlib.contextmanager
+def profile_section(name, count_widgets=None):
+    """
+    구간을 측정합니다. 프로파일링이 꺼져 있거나 이번 실행이 표본에서 빠지면 아무것도 하지 않습니다.
+    같은 스레드에서 구간이 중첩되면 가장 바깥 구간만 cProfile과 메모리 스냅샷을 사용합니다.
+    다른 스레드에서 프로파일링 중이면 이번 실행은 표본에서 빠진 것처럼 건너뜁니다.
+
+    Args:
+        name (str): 구간 이름 (예: "rerun", "step_3")
+        count_widgets (callable, optional): 지금까지 그린 위젯 수를 반환하는 함수
+    """
+    if not PROFILE_ENABLED:
+        yield None
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    outermost = not stack
+    if outermost:
+        skip = random.random() >= PROFILE_SAMPLE_RATE or not _profile_lock.acquire(blocking=False)
+    else:
+        skip = stack[-1] is None
+    if skip:
+        stack.append(None)
+        try:
+            yield None
+        finally:
+            stack.pop()
+        return
+
+    # 이미 다른 용도로 추적 중이면 그대로 두고, 여기서 시작한 추적만 끝에서 끔
+    started_tracing = outermost and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        with _measure(name, outermost, stack, count_widgets) as record:
+            yield record
+    finally:
+        if outermost:
+            if started_tracing:
+                tracemalloc.stop()
+            _profile_lock.release()
+
+
+@contextlib.contextmanager
+def _measure(name, outermost, stack, count_widgets):
+    """구간 하나를 측정해 기록 (가장 바깥 구간이면 cProfile과 메모리 스냅샷도 사용)"""
+    record = ProfileRecord(name, parent=None if outermost else stack[-1].name)
+    widgets_before = count_widgets() if count_widgets else 0
+    snapshot_before = tracemalloc.take_snapshot() if outermost else None
+    memory_before = tracemalloc.get_traced_memory()[0]
+    profiler = cProfile.Profile() if outermost else None
+
+    stack.append(record)
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as e:
+        # Streamlit의 다시 실행/중단 요청도 예외로 전달되므로 이름만 남기고 그대로 올려 보냄
+        record.error = type(e).__name__
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        record.duration = time.perf_counter() - started
+        stack.pop()
+        record.allocated_bytes = tracemalloc.get_traced_memory()[0] - memory_before
+        if count_widgets:
+            record.widgets = count_widgets() - widgets_before
+        if profiler:
+            record.hotspots = {sort: _hotspots(profiler, sort) for sort in ("cumulative", "tottime")}
+            record.memory_hotspots = _memory_hotspots(snapshot_before, tracemalloc.take_snapshot())
+            if PROFILE_DIR:
+                record.profile_path = _dump(profiler, record)
+        with _records_lock:
+            _records.append(record)
+
+
+def profiled(name, count_widgets=None):
+    """함수 호출 전체를 profile_section으로 감싸는 데코레이터"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile_section(name, count_widgets):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+###############################################################################
+# 2. 보고
+###############################################################################
+def recent_records(limit=None):
+    """최근 구간 기록 (최신순)"""
+    with _records_lock:
+        records = list(reversed(_records))
+    return records[:limit] if limit else records
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def profile_summary():
+    """
+    구간 이름별 집계를 느린 순서대로 반환합니다.
+
+    Returns:
+        list: [{"name", "count", "p50_ms", "p95_ms", "max_ms", "widgets", "allocated_kb"}, ...]
+    """
+    groups = {}
+    for record in recent_records():
+        groups.setdefault(record.name, []).append(record)
+
+    summary = []
+    for name, records in groups.items():
+        durations = [record.duration * 1000 for record in records]
+        widgets = [record.widgets for record in records if record.widgets is not None]
+        summary.append({
+            "name": name,
+            "count": len(records),
+            "p50_ms": round(_percentile(durations, 50), 1),
+            "p95_ms": round(_percentile(durations, 95), 1),
+            "max_ms": round(max(durations), 1),
+            "widgets": round(sum(widgets) / len(widgets), 1) if widgets else None,
+            "allocated_kb": round(sum(record.allocated_bytes for record in records) / len(records) / 1024, 1)
+        })
+    summary.sort(key=lambda row: row["p95_ms"], reverse=True)
+    return summary
@@ -0,0 +1,185 @@
+"""
+유사 계획서 캐시 모듈
+
+완성된 계획서의 1단계 입력(학교급, 학년, 교과, 활동명, 요구사항)을 임베딩해 저장해 두고,
+새 계획서의 입력과 코사인 유사도가 기준 이상인 이전 계획서를 찾습니다.
+찾은 계획서는 바로 시작할 초안으로 쓰거나, 참고 예시로 넣어 더 짧고 저렴하게 생성하는 데 사용합니다.
+조회/적중/사용 기록을 남겨 적중률과 절약한 생성 시간을 보고합니다.
+Streamlit에 의존하지 않으므로 일괄 처리 스크립트에서도 사용할 수 있습니다.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+import faiss
+
+from plan_storage import get_connection
+
+###############################################################################
+# 0. 설정
+###############################################################################
+SIMILARITY_THRESHOLD = float(os.environ.get("SEOHS_SEMANTIC_CACHE_THRESHOLD", "0.9"))
+MAX_SUGGESTIONS = 3
+
+# 유사도 비교에 사용하는 1단계 입력 항목
+QUERY_FIELDS = ['school_type', 'grades', 'subjects', 'activity_name', 'requirements']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS semantic_cache (
+    plan_id TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    generation_seconds REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS semantic_cache_events (
+    created_at REAL NOT NULL,
+    event TEXT NOT NULL,
+    seconds_saved REAL NOT NULL DEFAULT 0
+);
+"""
+
+###############################################################################
+# 1. 조회 문장
+###############################################################################
+def cache_query(data):
+    """1단계 입력을 임베딩할 한 문장으로 정리"""
+    parts = []
+    for field in QUERY_FIELDS:
+        value = data.get(field)
+        if isinstance(value, list):
+            value = ", ".join(value)
+        if value:
+            parts.append(f"{field}: {value}")
+    return "\n".join(parts)
+
+
+_schema_ready = set()
+
+
+def _connection(db_path=None):
+    """계획서 저장소와 같은 SQLite 파일에 캐시 테이블을 두고 연결을 반환"""
+    connection = get_connection(db_path)
+    if db_path not in _schema_ready:
+        connection.executescript(SCHEMA)
+        _schema_ready.add(db_path)
+    return connection
+
+###############################################################################
+# 2. 캐시
+###############################################################################
+class SemanticPlanCache:
+    """
+    저장된 계획서 임베딩을 정규화해 FAISS 내적 인덱스(= 코사인 유사도)로 검색합니다.
+    다른 프로세스가 추가한 계획서도 보이도록, 저장된 건수나 마지막 저장 시각이 바뀌면 인덱스를 다시 읽습니다.
+    (같은 ID를 덮어쓰면 건수는 그대로이므로 마지막 저장 시각으로 변경을 감지)
+    """
+
+    def __init__(self, embeddings, db_path=None, threshold=SIMILARITY_THRESHOLD):
+        self.embeddings = embeddings
+        self.db_path = db_path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index = None
+        self._plan_ids = []
+        self._version = None
+
+    def _embed(self, data):
+        vector = np.asarray([self.embeddings.embed_query(cache_query(data))], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _load_index(self):
+        connection = _connection(self.db_path)
+        version = connection.execute("SELECT COUNT(*), MAX(created_at) FROM semantic_cache").fetchone()
+        with self._lock:
+            if self._version == version:
+                return self._index, self._plan_ids
+
+            rows = connection.execute("SELECT plan_id, embedding FROM semantic_cache ORDER BY created_at").fetchall()
+            plan_ids = [row[0] for row in rows]
+            index = None
+            if rows:
+                vectors = np.vstack([np.frombuffer(row[1], dtype="float32") for row in rows])
+                index = faiss.IndexFlatIP(vectors.shape[1])
+                index.add(vectors)
+            self._index, self._plan_ids, self._version = index, plan_ids, version
+            return index, plan_ids
+
+    def add(self, plan_id, data, generation_seconds=0.0):
+        """완성된 계획서를 캐시에 추가 (같은 ID면 덮어씀)"""
+        vector = self._embed(data)
+        connection = _connection(self.db_path)
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO semantic_cache (plan_id, query, embedding, generation_seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (plan_id, cache_query(data), vector.tobytes(), float(generation_seconds), time.time())
+            )
+
+    def lookup(self, data, exclude_plan_id=None, k=MAX_SUGGESTIONS):
+        """
+        유사도가 기준 이상인 이전 계획서를 찾습니다. 조회와 적중 여부를 기록합니다.
+
+        Returns:
+            list: [(계획서 ID, 유사도, 생성에 걸린 초), ...] 유사도 높은 순
+        """
+        index, plan_ids = self._load_index()
+        hits = []
+        if index is not None:
+            scores, positions = index.search(self._embed(data), min(k + 1, index.ntotal))
+            for score, position in zip(scores[0], positions[0]):
+                if position < 0 or score < self.threshold or plan_ids[position] == exclude_plan_id:
+                    continue
+                hits.append((plan_ids[position], float(score)))
+            hits = hits[:k]
+
+        connection = _connection(self.db_path)
+        seconds = {
+            plan_id: generation_seconds
+            for plan_id, generation_seconds in connection.execute(
+                f"SELECT plan_id, generation_seconds FROM semantic_cache WHERE plan_id IN ({','.join('?' * len(hits))})",
+                [plan_id for plan_id, _ in hits]
+            )
+        } if hits else {}
+        record_event("hit" if hits else "miss", db_path=self.db_path)
+        return [(plan_id, score, seconds.get(plan_id, 0.0)) for plan_id, score in hits]
+
+###############################################################################
+# 3. 사용 기록 및 보고
+###############################################################################
+def record_event(event, seconds_saved=0.0, db_path=None):
+    """
+    캐시 이벤트를 기록합니다.
+    hit/miss: 조회 결과, used: 이전 계획서로 바로 시작, assisted: 참고 예시로 생성
+    """
+    connection = _connection(db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO semantic_cache_events (created_at, event, seconds_saved) VALUES (?, ?, ?)",
+            (time.time(), event, max(0.0, float(seconds_saved)))
+        )
+
+
+def cache_report(db_path=None):
+    """적중률, 사용 횟수, 절약한 생성 시간 집계"""
+    connection = _connection(db_path)
+    counts = dict(connection.execute(
+        "SELECT event, COUNT(*) FROM semantic_cache_events GROUP BY event"
+    ).fetchall())
+    seconds_saved = connection.execute(
+        "SELECT COALESCE(SUM(seconds_saved), 0) FROM semantic_cache_events"
+    ).fetchone()[0]
+    entries = connection.execute("SELECT COUNT(*) FROM semantic_cache").fetchone()[0]
+
+    lookups = counts.get("hit", 0) + counts.get("miss", 0)
+    return {
+        "entries": entries,
+        "lookups": lookups,
+        "hits": counts.get("hit", 0),
+        "hit_rate": counts.get("hit", 0) / lookups if lookups else 0.0,
+        "used": counts.get("used", 0),
+        "assisted": counts.get("assisted", 0),
+        "seconds_saved": round(seconds_saved, 1)
+    }
@@ -0,0 +1,211 @@
+"""
+세션 메모리 관리 모듈
+
+서버 한 대에서 많은 세션이 동시에 열려 있을 때 세션별 메모리를 측정하고 제한합니다.
+- 세션 메모리 보고: 세션 상태 항목별 대략적인 바이트 수
+- 유휴 세션 내리기: 일정 시간 동안 실행이 없던 세션의 계획서를 SQLite에 저장하고 메모리에서 비움
+  (해당 세션이 다시 실행되면 저장소에서 불러와 이어서 사용)
+세션 상태 자체는 Streamlit 실행 스레드 밖에서 바꿀 수 없으므로, 계획서 객체의 내용만 비웁니다.
+세션이 실행되는 동안에는 세션별 잠금을 잡아, 사용 중인 계획서를 다른 스레드가 비우지 않도록 합니다.
+런타임에서 사라진 세션의 잠금과 내려 둔 기록은 주기적으로 정리합니다.
+"""
+import os
+import time
+import functools
+import threading
+
+from plan_model import deep_sizeof
+from plan_storage import load_plan, new_plan_id, save_plan
+
+###############################################################################
+# 0. 설정
+###############################################################################
+IDLE_OFFLOAD_SECONDS = int(os.environ.get("SEOHS_IDLE_OFFLOAD_SECONDS", "1800"))
+SESSION_MEMORY_LIMIT_BYTES = int(os.environ.get("SEOHS_SESSION_MEMORY_LIMIT", str(8 * 1024 * 1024)))
+OFFLOADED_TTL_SECONDS = int(os.environ.get("SEOHS_OFFLOADED_TTL_SECONDS", str(24 * 3600)))
+OFFLOAD_CHECK_SECONDS = 60
+
+# 여러 세션이 함께 쓰는 객체라 세션 메모리에 포함하지 않는 항목
+SHARED_STATE_KEYS = {"vector_store", "lesson_job"}
+
+###############################################################################
+# 1. 세션 메모리 보고
+###############################################################################
+def session_memory_report(session_state):
+    """
+    세션 상태 항목별 메모리 사용량을 큰 순서대로 반환합니다.
+
+    Returns:
+        dict: {"total": 전체 바이트 수, "items": [(키, 바이트 수), ...], "limit": 제한}
+    """
+    seen = set()
+    items = [
+        (str(key), deep_sizeof(value, seen))
+        for key, value in session_state.items()
+        if key not in SHARED_STATE_KEYS
+    ]
+    items.sort(key=lambda item: item[1], reverse=True)
+    return {"total": sum(size for _, size in items), "items": items, "limit": SESSION_MEMORY_LIMIT_BYTES}
+
+###############################################################################
+# 2. 유휴 세션 내리기
+###############################################################################
+class _SessionEntry:
+    __slots__ = ("plan", "plan_id", "step", "last_seen")
+
+    def __init__(self, plan, plan_id, step):
+        self.plan = plan
+        self.plan_id = plan_id
+        self.step = step
+        self.last_seen = time.monotonic()
+
+
+_sessions = {}
+_offloaded = {}  # {세션 ID: (계획서 ID, 내린 시각)}
+_session_locks = {}
+_sessions_lock = threading.Lock()
+_worker_started = False
+
+
+def session_lock(session_id):
+    """세션 실행과 유휴 세션 내리기가 겹치지 않도록 하는 세션별 재진입 잠금"""
+    with _sessions_lock:
+        return _session_locks.setdefault(session_id, threading.RLock())
+
+
+def hold_session_lock(get_session_id):
+    """
+    함수가 실행되는 동안 get_session_id()가 돌려주는 세션의 잠금을 잡는 데코레이터
+    (Streamlit 스크립트 실행과 fragment 실행에 사용)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with session_lock(get_session_id()):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def touch_session(session_id, plan=None, plan_id=None, step=None):
+    """세션이 실행 중임을 기록 (plan을 주면 내릴 대상 계획서와 ID, 단계도 갱신)"""
+    with _sessions_lock:
+        entry = _sessions.get(session_id)
+        if plan is not None:
+            if entry is None or entry.plan is not plan:
+                entry = _sessions[session_id] = _SessionEntry(plan, plan_id, step)
+            entry.plan_id = plan_id or entry.plan_id
+            entry.step = step or entry.step
+        if entry is not None:
+            entry.last_seen = time.monotonic()
+
+
+def offload_idle_sessions(idle_seconds=IDLE_OFFLOAD_SECONDS):
+    """
+    idle_seconds 동안 실행이 없던 세션의 계획서를 저장하고 내용을 비웁니다.
+    세션 잠금을 바로 잡을 수 없는(실행 중인) 세션은 건너뛰고 다음 확인 때 다시 살펴봅니다.
+
+    Returns:
+        int: 내린 세션 수
+    """
+    now = time.monotonic()
+    with _sessions_lock:
+        idle = [
+            (session_id, _sessions.pop(session_id))
+            for session_id, entry in list(_sessions.items())
+            if now - entry.last_seen >= idle_seconds
+        ]
+
+    offloaded = 0
+    for session_id, entry in idle:
+        lock = session_lock(session_id)
+        if not lock.acquire(blocking=False):
+            with _sessions_lock:
+                _sessions.setdefault(session_id, entry)
+            continue
+        try:
+            with _sessions_lock:
+                # 목록에서 뺀 사이 다시 실행되어 새로 기록된 세션은 내리지 않음
+                if session_id in _sessions:
+                    continue
+            plan_id = entry.plan_id or new_plan_id()
+            save_plan(plan_id, entry.step or 1, entry.plan)
+            entry.plan.clear()
+            with _sessions_lock:
+                _offloaded[session_id] = (plan_id, time.monotonic())
+            offloaded += 1
+        finally:
+            lock.release()
+    return offloaded
+
+
+def restore_offloaded_session(session_id):
+    """
+    내려 둔 세션이면 저장된 계획서를 불러옵니다.
+
+    Returns:
+        tuple: (계획서 ID, 단계, 계획서 데이터 dict). 내려 둔 세션이 아니면 (None, None, None)
+    """
+    with _sessions_lock:
+        offloaded = _offloaded.pop(session_id, None)
+    if offloaded is None:
+        return None, None, None
+    plan_id, _ = offloaded
+    step, data = load_plan(plan_id)
+    return plan_id, step, data
+
+
+def prune_sessions(session_exists=None, ttl_seconds=OFFLOADED_TTL_SECONDS):
+    """
+    런타임에서 사라진 세션의 잠금과 내려 둔 기록, ttl_seconds가 지난 내려 둔 기록을 지웁니다.
+    (기록이 지워진 세션의 계획서는 저장소에 남아 있으므로 목록에서 다시 불러올 수 있음)
+    잠금은 아무도 잡고 있지 않고 아직 내리지 않은 세션이 아닐 때만 지웁니다.
+
+    Args:
+        session_exists: 세션 ID가 아직 런타임에 남아 있는지 돌려주는 함수. None이면 기간만 확인
+
+    Returns:
+        int: 지운 항목 수
+    """
+    now = time.monotonic()
+    with _sessions_lock:
+        session_ids = set(_session_locks) | set(_offloaded)
+    # 런타임 조회는 잠금 밖에서 (세션 실행 스레드를 막지 않도록)
+    gone = {session_id for session_id in session_ids if session_exists and not session_exists(session_id)}
+
+    removed = 0
+    with _sessions_lock:
+        for session_id, (_, offloaded_at) in list(_offloaded.items()):
+            if session_id in gone or now - offloaded_at >= ttl_seconds:
+                del _offloaded[session_id]
+                removed += 1
+        for session_id in gone:
+            lock = _session_locks.get(session_id)
+            if lock is None or session_id in _sessions or not lock.acquire(blocking=False):
+                continue
+            try:
+                del _session_locks[session_id]
+                removed += 1
+            finally:
+                lock.release()
+    return removed
+
+
+def start_offload_worker(session_exists=None):
+    """
+    유휴 세션을 주기적으로 내리고 사라진 세션의 기록을 정리하는 백그라운드 스레드를 프로세스에 하나만 시작
+    (session_exists는 prune_sessions에 그대로 전달)
+    """
+    global _worker_started
+    with _sessions_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+
+    def _loop():
+        while True:
+            time.sleep(OFFLOAD_CHECK_SECONDS)
+            offload_idle_sessions()
+            prune_sessions(session_exists)
+
+    threading.Thread(target=_loop, name="session-offload", daemon=True).start()
@@ -1,18 +1,39 @@
 import os
 import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
-from io import BytesIO
 import json
 import time
-import os
+import functools
+import threading
+import contextvars
 
 # LangChain 관련 라이브러리 임포트
 from langchain.prompts import ChatPromptTemplate
-from langchain_unstructured import UnstructuredLoader
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
+from langchain_openai import OpenAIEmbeddings
 from langchain.chains import LLMChain
-from langchain.schema import AIMessage, HumanMessage, SystemMessage
+from langchain.schema import AIMessage
+
+from plan_export import LESSON_COLUMNS, render_xlsx
+from plan_model import as_plan, json_default, plan_fingerprint
+from llm_scheduler import session_id_var
+from plan_storage import load_plan, load_step_result, new_plan_id, save_plan, save_step_result
+from vector_index import current_index_version, load_index_meta, open_shared_vector_store
+from ingestion import SUPPORTED_EXTENSIONS, IngestionWorker, list_document_paths, load_documents, stage_upload
+from semantic_cache import SemanticPlanCache, cache_report, record_event
+from session_memory import (
+    SESSION_MEMORY_LIMIT_BYTES, hold_session_lock, restore_offloaded_session, session_memory_report,
+    start_offload_worker, touch_session
+)
+from usage_budget import budget_problem, usage_report
+from rerun_profiler import PROFILE_DIR, PROFILE_ENABLED, profile_summary, profiled, recent_records
+from generation_core import (
+    STEP_OUTPUT_FIELDS, agenerate_express, agenerate_lessons, agenerate_step,
+    aregenerate_lesson_range, apply_step_content, chunk_error_message, configure_client,
+    estimate_lesson_generation, estimate_step_generation, find_stale_steps, get_default_content,
+    record_step_inputs, run_sync, step_input_hash
+)
 
 
 # 폴더가 없으면 생성
@@ -21,40 +42,28 @@ if not os.path.exists(documents_path):
     os.makedirs(documents_path)
 
 ###############################################################################
-# 0. OpenAI 클라이언트 초기화 & 시스템 프롬프트
+# 0. OpenAI 클라이언트 초기화
 ###############################################################################
-# API_KEY를 환경 변수에서 가져오기
-OPENAI_API_KEY = st.secrets["openai"]["api_key"]
+# API_KEY를 Streamlit secrets 또는 환경 변수에서 가져오기
+# (일괄 실행처럼 secrets 파일이 없는 환경에서는 OPENAI_API_KEY 환경 변수를 사용)
+try:
+    OPENAI_API_KEY = st.secrets["openai"]["api_key"]
+except Exception:
+    OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 if not OPENAI_API_KEY:
     st.error("OpenAI API 키가 설정되지 않았습니다. 환경 변수를 확인하세요.")
     st.stop()
 
-SYSTEM_PROMPT = """한국의 초등학교 2022 개정 교육과정 전문가입니다.
-학교자율시간 계획서를 다음 원칙에 따라 작성합니다:
-
-1. 지도계획에 모든 차시에 학습내용과 학습 주제가 빈틈없이 내용이 꼭 들어가야 합니다.
-2. 학습자 중심의 교육과정 구성
-3. 실생활 연계 및 체험 중심 활동
-4. 교과 간 연계 및 통합적 접근
-5. 과정 중심 평가와 피드백 강조
-6. 유의미한 학습경험 제공
-7. 요구사항을 반영한 맞춤형 교육과정 구성
-8. 교수학습 방법의 다양화
-9. 객관적이고 공정한 평가계획 수립
-"""
+# 프롬프트와 모델 호출은 generation_core가 담당 (여기서는 읽은 키만 넘김)
+configure_client(OPENAI_API_KEY)
 
 ###############################################################################
 # 1. 페이지 기본 설정
 ###############################################################################
-def set_page_config():
-    """페이지 기본 설정"""
-    try:
-        st.set_page_config(page_title="학교자율시간 계획서 생성기", page_icon="📚", layout="wide")
-    except:
-        pass
-
-    st.markdown("""
+# 정적 CSS는 모듈 로드 시 한 번만 만들어 두고, 전체 재실행 때만 한 번 전송합니다.
+# (단계 본문은 fragment로 분리되어 있어 본문 상호작용 시에는 다시 전송되지 않음)
+STATIC_CSS = """
         <style>
         .main .block-container { 
             padding: 2rem; 
@@ -88,19 +97,6 @@ def set_page_config():
         .stProgress > div > div > div {
             background-color: #3b82f6;
         }
-        </style>
-    """, unsafe_allow_html=True)
-
-###############################################################################
-# 2. 진행 상황 표시
-###############################################################################
-def show_progress():
-    """진행 상황 표시"""
-    current_step = st.session_state.get('step', 1)
-    steps = ["기본정보", "목표/내용", "성취기준", "교수학습/평가", "차시별계획", "최종 검토"]
-
-    st.markdown("""
-        <style>
         .step-container {
             display: flex;
             justify-content: space-between;
@@ -175,23 +171,42 @@ def show_progress():
             padding: 10px 20px;
         }
         </style>
-    """, unsafe_allow_html=True)
+"""
+
+STEP_LABELS = ["기본정보", "목표/내용", "성취기준", "교수학습/평가", "차시별계획", "최종 검토"]
 
+def set_page_config():
+    """페이지 기본 설정"""
+    try:
+        st.set_page_config(page_title="학교자율시간 계획서 생성기", page_icon="📚", layout="wide")
+    except:
+        pass
+
+    st.markdown(STATIC_CSS, unsafe_allow_html=True)
+
+def count_widgets():
+    """이번 실행에서 지금까지 그린 위젯 수 (프로파일링용)"""
+    ctx = get_script_run_ctx()
+    return len(getattr(ctx, "widget_ids_this_run", None) or ()) if ctx else 0
+
+###############################################################################
+# 2. 진행 상황 표시
+###############################################################################
+@functools.lru_cache(maxsize=None)
+def build_progress_html(current_step):
+    """현재 단계별 진행 표시 HTML (단계마다 한 번만 생성해 재사용)"""
     html = '<div class="step-container-outer"><div class="step-container">'
 
-    for i, step in enumerate(steps, 1):
+    for i, step in enumerate(STEP_LABELS, 1):
         if i < current_step:
             circle_class = "step-completed"
             icon = "✓"
-            line_class = "step-line-completed"
         elif i == current_step:
             circle_class = "step-active"
             icon = str(i)
-            line_class = "step-line-active"
         else:
             circle_class = "step-pending"
             icon = str(i)
-            line_class = "step-line-pending"
 
         html += f'''
             <div class="step-item">
@@ -200,7 +215,7 @@ def show_progress():
             </div>
         '''
 
-        if i < len(steps):
+        if i < len(STEP_LABELS):
             if i < current_step:
                 line_style = "step-line-completed"
             elif i == current_step:
@@ -210,33 +225,39 @@ def show_progress():
             html += f'<div class="step-line {line_style}"></div>'
 
     html += '</div></div>'
-    st.markdown(html, unsafe_allow_html=True)
+    return html
+
+def show_progress():
+    """진행 상황 표시"""
+    current_step = st.session_state.get('step', 1)
+    st.markdown(build_progress_html(current_step), unsafe_allow_html=True)
 
 ###############################################################################
 # 3. 벡터 데이터베이스 설정
 ###############################################################################
-@st.cache_resource(show_spinner="문서를 임베딩하는 중...")
-def setup_vector_store():
-    """문서를 로드하고 벡터 스토어를 설정합니다."""
+@st.cache_resource(show_spinner="문서를 임베딩하는 중...", max_entries=2)
+def setup_vector_store(version=None):
+    """
+    문서를 로드하고 벡터 스토어를 설정합니다.
+    version(현재 인덱스 버전)별로 캐시하므로, 문서가 추가되어 인덱스가 교체되면
+    다음 실행에서 새 버전을 열고 이전 버전은 캐시에서 밀려납니다.
+    """
     try:
-        documents_dir = "./documents/"
-        supported_extensions = ["pdf", "txt", "docx"]
-
-        all_docs = []
-        for filename in os.listdir(documents_dir):
-            if any(filename.lower().endswith(ext) for ext in supported_extensions):
-                file_path = os.path.join(documents_dir, filename)
-                loader = UnstructuredLoader(file_path)
-                documents = loader.load()
-                all_docs.extend(documents)
-
-        if not all_docs:
+        file_paths = list_document_paths(documents_path)
+
+        if not file_paths:
             st.error("`documents/` 폴더에 문서가 없습니다.")
             return None
 
         embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        vector_store = FAISS.from_documents(all_docs, embeddings)
-        st.success("벡터 스토어가 성공적으로 생성되었습니다.")
+
+        # 같은 문서로 만든 인덱스가 디스크에 있으면 읽기 전용 메모리 매핑으로 공유
+        vector_store, built = open_shared_vector_store(embeddings, file_paths, load_documents)
+        if not vector_store:
+            st.error("`documents/` 폴더의 문서를 읽지 못했습니다.")
+            return None
+        if built:
+            st.success("벡터 스토어가 성공적으로 생성되었습니다.")
 
         return vector_store
 
@@ -244,213 +265,344 @@ def setup_vector_store():
         st.error(f"벡터 스토어 설정 중 오류가 발생했습니다: {str(e)}")
         return None
 
+@st.cache_resource
+def get_ingestion_worker():
+    """문서 추가 작업자 (프로세스 전체에서 하나를 공유)"""
+    return IngestionWorker(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY), load_documents, documents_path)
+
+def show_document_upload():
+    """사이드바에 문서 업로드와 최근 색인 작업 상태를 표시"""
+    with st.sidebar.expander("문서 추가"):
+        with st.form("document_upload_form", clear_on_submit=True):
+            uploaded_files = st.file_uploader(
+                "PDF/TXT/DOCX 문서",
+                type=SUPPORTED_EXTENSIONS,
+                accept_multiple_files=True
+            )
+            if st.form_submit_button("색인에 추가", use_container_width=True) and uploaded_files:
+                try:
+                    staged_paths = [stage_upload(file.name, file.getvalue(), documents_path) for file in uploaded_files]
+                    get_ingestion_worker().submit(staged_paths)
+                    st.success("문서를 대기열에 넣었습니다. 색인이 끝나면 다음 화면부터 반영됩니다.")
+                except Exception as e:
+                    st.error(f"문서 업로드 중 오류가 발생했습니다: {str(e)}")
+
+        status_labels = {"queued": "대기", "running": "색인 중", "done": "완료", "failed": "실패"}
+        for job in get_ingestion_worker().recent_jobs()[:5]:
+            line = f"- {', '.join(job.files)}: {status_labels[job.status]}"
+            if job.status == "done":
+                line += f" ({job.added_chunks}개 청크)"
+            elif job.status == "failed":
+                line += f" ({job.error})"
+            st.markdown(line)
+
+@st.cache_resource
+def get_semantic_cache():
+    """유사 계획서 캐시 (프로세스 전체에서 하나를 공유)"""
+    return SemanticPlanCache(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))
+
+def show_semantic_cache_report():
+    """사이드바에 유사 계획서 캐시의 적중률과 절약한 생성 시간을 표시"""
+    try:
+        report = cache_report()
+    except Exception:
+        return
+    with st.sidebar.expander("유사 계획서 캐시"):
+        st.markdown(
+            f"- 저장된 계획서: {report['entries']}개\n"
+            f"- 조회 {report['lookups']}회, 적중률 {report['hit_rate']:.0%}\n"
+            f"- 바로 시작 {report['used']}회, 참고 생성 {report['assisted']}회\n"
+            f"- 절약한 생성 시간: 약 {report['seconds_saved']:.0f}초"
+        )
+
+def show_usage_report():
+    """사이드바에 오늘의 호출 수, 토큰, 비용과 예산을 표시"""
+    try:
+        report = usage_report(current_session_id())
+    except Exception:
+        return
+    daily_budget = f" / 예산 ${report['daily_budget']:.2f}" if report['daily_budget'] else ""
+    session_budget = f" / 예산 ${report['session_budget']:.2f}" if report['session_budget'] else ""
+    with st.sidebar.expander("호출 사용량"):
+        st.markdown(
+            f"- 오늘 호출 {report['calls_today']}회, 입력 {report['prompt_tokens_today']:,} · "
+            f"출력 {report['completion_tokens_today']:,}토큰\n"
+            f"- 오늘 비용: ${report['cost_today']:.3f}{daily_budget}\n"
+            f"- 이 세션 비용: ${report['cost_session']:.3f}{session_budget}"
+        )
+
+def show_index_report():
+    """사이드바에 벡터 인덱스 종류와 재현율-지연시간 보고서를 표시"""
+    report = st.session_state.get('index_report')
+    if not report:
+        return
+
+    with st.sidebar.expander("벡터 인덱스 정보"):
+        st.markdown(f"**인덱스 종류**: {report.get('index_type')}")
+        st.markdown(f"**청크 수**: {report.get('n_vectors')}")
+        dedup = report.get("dedup")
+        if dedup:
+            st.markdown(
+                f"**중복 제거**: 입력 {dedup['input']}개 중 완전 중복 {dedup['exact']}개, "
+                f"유사 중복 {dedup['near']}개 제외"
+            )
+        selected = report.get("selected")
+        if selected:
+            st.markdown(
+                f"**검색 설정**: {selected['param']}={selected['value']} "
+                f"(재현율@{report.get('k')} {selected['recall']:.2f}, {selected['latency_ms']:.3f}ms)"
+            )
+        if report.get("rows"):
+            st.dataframe(
+                pd.DataFrame(report["rows"]),
+                column_config={
+                    "param": "파라미터",
+                    "value": "값",
+                    "recall": f"재현율@{report.get('k')}",
+                    "latency_ms": "질의당 지연(ms)"
+                },
+                hide_index=True
+            )
+
 ###############################################################################
 # 4. OpenAI 호출 함수
 ###############################################################################
+def current_session_id():
+    """공정 대기열에 사용할 세션 ID (백그라운드 작업이 설정한 값 또는 현재 Streamlit 세션)"""
+    session_id = session_id_var.get()
+    if session_id:
+        return session_id
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "default"
+
+def run_engine(coro_fn, *args, on_event=None, **kwargs):
+    """generation_core의 코루틴을 현재 세션의 공정 순서로 실행하고 결과를 기다림"""
+    ctx = contextvars.copy_context()
+    ctx.run(session_id_var.set, current_session_id())
+    return ctx.run(run_sync, coro_fn, *args, on_event=on_event, **kwargs)
+
+def show_waiting(placeholder):
+    """요청이 몰려 대기하는 동안 대기 순서를 placeholder에 표시하는 이벤트 콜백"""
+    def on_event(event):
+        if event["type"] == "waiting":
+            placeholder.info(f"요청이 많아 대기 중입니다. 대기 순서: {event['position']}번째")
+    return on_event
+
 def generate_content(step, data, vector_store):
-    """단계별 안내 메시지를 만들고 LangChain을 통해 JSON을 생성 후 파싱"""
+    """단계 내용을 생성 엔진으로 생성하고, 실패하면 오류를 표시한 뒤 None을 반환"""
+    if step == 5:
+        return {}
+
+    # 라우팅된 모델로 응답 생성 후 구조 검증, 실패 시 상위 모델로 재생성 (요청이 몰리면 대기 순서 표시)
+    waiting = st.empty()
     try:
-        context = ""
-        if step > 1 and vector_store:
-            # RAG를 통해 관련 문서 검색
-            retriever = vector_store.as_retriever()
-            query = {
-                2: "목표와 내용 요소",
-                3: "성취기준",
-                4: "교수학습 방법과 평가계획"
-            }.get(step, "")
-
-            if query:
-                retrieved_docs = retriever.get_relevant_documents(query)
-                context = "\n\n".join([doc.page_content for doc in retrieved_docs])
-
-        # 단계별 프롬프트 정의
-        step_prompts = {
-            1: f"""학교자율시간 활동의 기본 정보를 작성해주세요.
-아래 사항을 고려하여 JSON 형식으로 기술합니다.
-1) 학교 교육목표 및 비전과 어떻게 연계되는지 강조
-2) 학교 및 학생의 요구(학습자 특성, 지역사회 자원 등)를 반영한 활동 필요성 구체적으로
-3) 활동 개요에 대상 학년, 총 시수, 주간 운영 시수, 활동 형식(프로젝트, 탐구학습, 토론 등) 간단히 포함
-4) 교육적 의의, 운영 방향(지향 교수학습방법, 학생 참여방식 등) 명시
-
-활동명: {data.get('activity_name')}
-요구사항: {data.get('requirements')}
-학교급: {data.get('school_type')}
-대상 학년: {', '.join(data.get('grades', []))}
-연계 교과: {', '.join(data.get('subjects', []))}
-총 차시: {data.get('total_hours')}차시
-주당 차시: {data.get('weekly_hours')}차시
-운영 학기: {', '.join(data.get('semester', []))}
-
-다음 JSON 형식으로 작성:
-{{
-    "necessity": "(학교 비전, 학습자 요구, 지역사회 연계 가능성 등을 포함)",
-    "overview": "(대상 학년, 총 시수, 활동 형식 등을 포함)",
-    "characteristics": "(교육적 의의, 운영 방향, 교수학습 전략 등)"
-}}""",
-
-            2: f"""{context}
-
-위 정보를 바탕으로 학교자율시간 활동의 목표와 주요 내용 요소를 정리해주세요.
-1) 지식, 기능, 태도 영역으로 구분된 목표 작성
-2) 활동이 다루는 영역(단일/통합 교과 등) 기술
-3) 핵심 개념 또는 원리 2~3개 이상 제시, 간단 설명 가능
-
-활동명: {data.get('activity_name')}
-요구사항: {data.get('requirements')}
-
-다음 JSON 형식으로 작성:
-{{
-    "goals": [
-        "(지식 영역 목표)",
-        "(기능 영역 목표)",
-        "(태도 영역 목표)"
-    ],
-    "domain": "(단일 또는 통합 영역 명시)",
-    "key_ideas": [
-        "(핵심 개념/원리1)",
-        "(핵심 개념/원리2)",
-        "(핵심 개념/원리3)"
-    ]
-}}""",
-
-            3: f"""{context}
-
-위 정보를 종합하여 학교자율시간 활동의 성취기준을 작성해주세요.
-1) 성취기준 코드는 고유하게 (예: '3사코딩_01')
-2) 성취기준 설명은 학생들이 달성해야 할 학습 결과를 구체적으로
-3) A/B/C 수준 구분, 각 수준의 구체적 성취 모습을 간단히
-
-활동명: {data.get('activity_name')}
-영역: {data.get('domain')}
-
-다음 JSON 형식으로 작성:
-[
-    {{
-        "code": "(성취기준 코드)",
-        "description": "(성취기준 설명)",
-        "levels": [
-            {{"level": "A", "description": "(A수준 성취기준)"}},
-            {{"level": "B", "description": "(B수준 성취기준)"}},
-            {{"level": "C", "description": "(C수준 성취기준)"}}
-        ]
-    }}
-]""",
-
-            4: f"""{context}
-
-위 정보를 바탕으로 학교자율시간 활동의 교수학습 방법과 평가계획을 작성해주세요.
-1) 교수학습 방법: 학생 중심의 다양한 교수학습 방법을 구체적으로
-2) 평가계획: 과정 중심 평가 및 구체적인 평가 방법 상세 기술
-
-활동명: {data.get('activity_name')}
-요구사항: {data.get('requirements')}
-
-다음 JSON 형식으로 작성:
-{{
-    "teaching_methods": [
-        {{"method": "프로젝트 기반 학습", "description": "학생들이 직접 프로젝트를 기획하고 실행함으로써 문제 해결 능력을 기릅니다."}},
-        {{"method": "토론 활동", "description": "학생들이 다양한 주제에 대해 토론함으로써 의사소통 능력을 향상시킵니다."}}
-    ],
-    "assessment_plan": [
-        {{"focus": "과정 중심 평가", "description": "학생들의 학습 과정과 참여도를 평가합니다."}},
-        {{"focus": "형성 평가", "description": "수업 중간에 학생들의 이해도를 점검하고 피드백을 제공합니다."}}
-    ]
-}}"""
-        }
+        return run_engine(agenerate_step, step, data, vector_store, on_event=show_waiting(waiting))
+    except json.JSONDecodeError as e:
+        st.warning(f"JSON 파싱 오류가 발생했습니다. 오류: {str(e)}")
+        return None
+    except ValueError as ve:
+        st.warning(f"데이터 구조 오류: {str(ve)}")
+        return None
+    except Exception as e:
+        st.error(f"내용 생성 중 오류가 발생했습니다: {str(e)}")
+        return None
+    finally:
+        waiting.empty()
+
+def generate_express_plan(data, vector_store, example=None):
+    """
+    빠른 초안 모드: 1~4단계 내용을 검색 한 번, 호출 한 번으로 생성합니다.
+    단계별 호출처럼 시스템 프롬프트와 검색 결과를 네 번 보내지 않습니다.
+    비슷한 이전 계획서(example)가 있으면 검색 대신 예시로 넣고 작은 모델로 생성합니다.
 
+    Returns:
+        dict: {단계: 내용}. 실패하면 None (단계별 생성으로 진행)
+    """
+    waiting = st.empty()
+    try:
+        return run_engine(agenerate_express, data, vector_store, example, on_event=show_waiting(waiting))
+    except Exception as e:
+        st.warning(f"빠른 초안 생성에 실패하여 단계별로 생성합니다: {str(e)}")
+        return None
+    finally:
+        waiting.empty()
+
+def apply_express_plan(data, contents):
+    """빠른 초안 결과를 1~4단계에 반영하고, 단계별 생성 결과로 저장해 각 단계 편집기를 바로 채움"""
+    for step, content in contents.items():
+        apply_step_content(step, data, content)
+    # 3단계 입력(domain)이 2단계 결과이므로 모두 반영한 뒤 입력 해시를 기록
+    plan_id = ensure_plan_id()
+    for step, content in contents.items():
+        input_hash = step_input_hash(step, data)
+        save_step_result(plan_id, step, input_hash, content)
+        record_step_inputs(step, data, input_hash)
+        st.session_state[f"generated_step_{step}"] = True
+
+def regenerate_stale_steps(stale_steps, vector_store):
+    """변경된 단계만 순서대로 다시 생성하고 나머지 단계의 결과는 그대로 둠"""
+    data = st.session_state.data
+    for step in stale_steps:
         if step == 5:
-            return {}
-
-        prompt = step_prompts.get(step, "")
-        if prompt:
-            messages = [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=prompt)
-            ]
-
-            # LangChain의 ChatOpenAI를 사용하여 응답 생성
-            chat = ChatOpenAI(
-                openai_api_key=OPENAI_API_KEY,
-                model="gpt-4o",  # 모델 이름 오타 수정
-                temperature=0.7,
-                max_tokens=2048
-            )
+            input_hash = step_input_hash(5, data)
+            lesson_plans = load_step_result(ensure_plan_id(), 5, input_hash)
+            if not lesson_plans:
+                # 실패한 묶음이 있으면 None: 기존 차시를 그대로 두고 변경 표시도 유지
+                lesson_plans = generate_lesson_plans_in_chunks(
+                    data.get('total_hours', 30), data, LESSONS_PER_PAGE, vector_store
+                )
+                if lesson_plans:
+                    save_step_result(ensure_plan_id(), 5, input_hash, lesson_plans)
+            if lesson_plans:
+                data['lesson_plans'] = lesson_plans
+                record_step_inputs(5, data, input_hash)
+        else:
+            # 실패하면 None: 교사가 작성한 기존 내용을 기본 예시로 덮지 않음
+            content = generate_step_content(step, data, vector_store)
+            if content:
+                apply_step_content(step, data, content)
+    autosave_plan()
+
+def generate_step_content(step, data, vector_store, use_default=False):
+    """
+    저장된 생성 결과의 입력이 같으면 재사용하고, 아니면 generate_content로 생성해 저장합니다.
+    생성에 실패하면 None을 반환하고 입력 해시를 기록하지 않습니다.
+    (use_default: 처음 생성할 때처럼 실패하면 기본 예시 내용을 대신 반환. 이 경우도 저장·기록하지 않음)
+    """
+    plan_id = ensure_plan_id()
+    input_hash = step_input_hash(step, data)
+
+    cached = load_step_result(plan_id, step, input_hash)
+    if cached is not None:
+        record_step_inputs(step, data, input_hash)
+        return cached
+
+    started = time.perf_counter()
+    content = generate_content(step, data, vector_store)
+    if not content:
+        if use_default:
+            st.info("기본 예시 내용을 채웠습니다. 내용을 직접 수정하거나 다시 생성하세요.")
+            return get_default_content(step)
+        return None
 
-            response = chat(messages)
-            content = response.content.strip()
-            content = content.replace('```json', '').replace('```', '').strip()
-
-            try:
-                parsed = json.loads(content)
-                if step == 4:
-                    # 데이터 구조 검증
-                    if 'teaching_methods' in parsed and 'assessment_plan' in parsed:
-                        for method in parsed['teaching_methods']:
-                            if not isinstance(method, dict) or 'method' not in method or 'description' not in method:
-                                raise ValueError("Invalid structure in teaching_methods")
-                        for assessment in parsed['assessment_plan']:
-                            if not isinstance(assessment, dict) or 'focus' not in assessment or 'description' not in assessment:
-                                raise ValueError("Invalid structure in assessment_plan")
-                return parsed
-            except json.JSONDecodeError as e:
-                st.warning(f"JSON 파싱 오류가 발생했습니다. 기본값을 사용합니다. 오류: {str(e)}")
-                return get_default_content(step)
-            except ValueError as ve:
-                st.warning(f"데이터 구조 오류: {str(ve)}. 기본값을 사용합니다.")
-                return get_default_content(step)
+    save_step_result(plan_id, step, input_hash, content)
+    record_generation_time(data, step, time.perf_counter() - started)
+    record_step_inputs(step, data, input_hash)
+    return content
+
+def record_generation_time(data, step, seconds):
+    """단계 생성에 걸린 시간을 계획서에 누적 (유사 계획서를 재사용할 때 절약한 시간 계산용)"""
+    times = data.setdefault('_generation_seconds', {})
+    times[str(step)] = round(times.get(str(step), 0) + seconds, 1)
+
+def generation_seconds(plan, steps):
+    """계획서의 지정 단계 생성에 걸린 시간 합계 (빠른 초안 시간은 1~4단계로 계산)"""
+    keys = {str(step) for step in steps}
+    if keys & {"1", "2", "3", "4"}:
+        keys.add("1-4")
+    return sum(seconds for step, seconds in plan.get('_generation_seconds', {}).items() if step in keys)
+
+def generate_first_draft(data, vector_store, express_mode, example=None):
+    """1단계 생성. 빠른 초안이거나 참고할 이전 계획서가 있으면 1~4단계를 한 번에 생성"""
+    if express_mode or example:
+        started = time.perf_counter()
+        express_contents = generate_express_plan(data, vector_store, example)
+        if express_contents:
+            elapsed = time.perf_counter() - started
+            apply_express_plan(data, express_contents)
+            record_generation_time(data, "1-4", elapsed)
+            if example:
+                record_event("assisted", generation_seconds(example, range(1, 5)) - elapsed)
+            st.success("1~4단계 초안이 생성되었습니다. 단계마다 확인하고 수정하세요.")
+            return
+
+    # 기본 정보 생성
+    basic_info = generate_step_content(1, data, vector_store, use_default=True)
+    if basic_info:
+        apply_step_content(1, data, basic_info)
+        st.success("기본 정보가 생성되었습니다.")
+        st.session_state.generated_step_1 = True
+
+def find_similar_plans(data):
+    """1단계 입력이 비슷한 이전 계획서 [(ID, 유사도, 생성 시간), ...]. 캐시를 쓸 수 없으면 빈 리스트"""
+    try:
+        return get_semantic_cache().lookup(data, exclude_plan_id=st.session_state.get('plan_id'))
+    except Exception:
+        return []
 
+def start_from_similar_plan(data, plan):
+    """비슷한 이전 계획서의 1~4단계(총 차시가 같으면 5단계까지) 내용으로 각 단계 편집기를 채움"""
+    steps = [1, 2, 3, 4]
+    if plan.get('total_hours') == data.get('total_hours') and plan.get('lesson_plans'):
+        steps.append(5)
+
+    for step in steps:
+        for field in STEP_OUTPUT_FIELDS[step]:
+            data[field] = plan.get(field)
+    for step in steps:
+        record_step_inputs(step, data)
+        st.session_state[f"generated_step_{step}"] = True
+    record_event("used", generation_seconds(plan, steps))
+
+def show_similar_plans(vector_store):
+    """1단계 입력과 비슷한 이전 계획서를 보여 주고, 바로 시작/참고 생성/새로 생성 중에서 고르게 함"""
+    suggestion = st.session_state.similar_plans
+    st.info("입력한 내용과 비슷한 이전 계획서가 있습니다. 그대로 시작하거나 참고하여 더 빠르게 생성할 수 있습니다.")
+
+    for plan_id, score, seconds in suggestion["hits"]:
+        _, plan = load_plan(plan_id)
+        if not plan:
+            continue
+        with st.container(border=True):
+            st.markdown(f"**{plan.get('activity_name', '')}** (유사도 {score:.2f}, 생성 시간 약 {seconds:.0f}초)")
+            st.caption(plan.get('overview', ''))
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("이 계획서로 시작", key=f"use_similar_{plan_id}", use_container_width=True):
+                    del st.session_state.similar_plans
+                    start_from_similar_plan(st.session_state.data, plan)
+                    autosave_plan()
+                    st.rerun()
+            with col2:
+                if st.button("참고하여 생성", key=f"fewshot_similar_{plan_id}", use_container_width=True):
+                    del st.session_state.similar_plans
+                    with st.spinner("이전 계획서를 참고하여 생성하고 있습니다..."):
+                        generate_first_draft(st.session_state.data, vector_store, True, example=plan)
+                    st.rerun()
+
+    if st.button("참고하지 않고 새로 생성", use_container_width=True):
+        del st.session_state.similar_plans
+        with st.spinner("정보를 생성하고 있습니다..."):
+            generate_first_draft(st.session_state.data, vector_store, suggestion["express"])
+        st.rerun()
+
+def add_to_semantic_cache(data):
+    """완성된 계획서를 유사 계획서 캐시에 추가"""
+    try:
+        get_semantic_cache().add(ensure_plan_id(), data, generation_seconds(data, range(1, 6)))
     except Exception as e:
-        st.error(f"내용 생성 중 오류가 발생했습니다: {str(e)}")
-        return get_default_content(step)
-
-def get_default_content(step):
-    """단계별 기본 내용을 반환하는 함수"""
-    defaults = {
-        1: {
-            "necessity": "예시: 2022개정교육과정, 학생/학부모 요구, 지역 여건 부합 등",
-            "overview": "예시: 대상 학년, 총 시수, 운영 형태 등",
-            "characteristics": "예시: 교육적 의의, 학생 참여 중심 운영 방식 등"
-        },
-        2: {
-            "goals": [
-                "지식 영역 목표 예시",
-                "기능 영역 목표 예시",
-                "태도 영역 목표 예시"
-            ],
-            "domain": "예: 통합 교과(사회+과학 등)",
-            "key_ideas": [
-                "예: 프로젝트 학습을 통한 문제 해결 능력 신장",
-                "예: 토론 활동을 통한 의사소통 역량 강화"
-            ]
-        },
-        3: [{
-            "code": "SD_01",
-            "description": "학생이 자료를 수집, 분석하여 문제 정의와 해결 방안을 제시할 수 있다.",
-            "levels": [
-                {"level": "A", "description": "다양한 자료를 능동적으로 활용해 창의적인 해결 방안을 설계한다."},
-                {"level": "B", "description": "제시된 자료를 활용해 해결 방안을 세운다."},
-                {"level": "C", "description": "주어진 자료를 활용해 해결 방안 초안을 구성한다."}
-            ]
-        }],
-        4: {
-            "teaching_methods": [
-                {"method": "프로젝트 기반 학습", "description": "학생들이 직접 프로젝트를 기획하고 실행함으로써 문제 해결 능력을 기릅니다."},
-                {"method": "토론 활동", "description": "학생들이 다양한 주제에 대해 토론함으로써 의사소통 능력을 향상시킵니다."}
-            ],
-            "assessment_plan": [
-                {"focus": "과정 중심 평가", "description": "학생들의 학습 과정과 참여도를 평가합니다."},
-                {"focus": "형성 평가", "description": "수업 중간에 학생들의 이해도를 점검하고 피드백을 제공합니다."}
-            ]
-        }
-    }
-    return defaults.get(step, {})
+        st.warning(f"유사 계획서 캐시 저장 중 오류가 발생했습니다: {str(e)}")
 
 ###############################################################################
 # 5. 단계별 UI 함수
 ###############################################################################
+def show_generation_estimate(estimate):
+    """생성 전에 예상 호출 수, 토큰, 시간, 비용을 표시하고 예산을 넘으면 그 이유를 반환"""
+    st.caption(
+        f"예상: 호출 {estimate['calls']}회, 입력 약 {estimate['prompt_tokens']:,}토큰 · "
+        f"출력 약 {estimate['completion_tokens']:,}토큰, 약 {estimate['seconds']:.0f}초, ${estimate['cost']:.3f}"
+    )
+    problem = budget_problem(current_session_id(), estimate["cost"])
+    if problem:
+        st.warning(f"예산을 넘어 생성할 수 없습니다. {problem}")
+    return problem
+
+@st.fragment
+@profiled("step_1", count_widgets)
+@hold_session_lock(current_session_id)
 def show_step_1(vector_store):
     """1단계: 기본 정보 입력 및 생성"""
+    ensure_session_plan()
     st.markdown("<div class='step-header'><h3>1단계: 기본 정보</h3></div>", unsafe_allow_html=True)
 
     if 'generated_step_1' not in st.session_state:
@@ -526,6 +678,12 @@ def show_step_1(vector_store):
                     height=100
                 )
 
+            express_mode = st.checkbox(
+                "빠른 초안: 1~4단계를 한 번에 생성",
+                key="express_mode_checkbox",
+                help="한 번의 요청으로 1~4단계 초안을 모두 만들고, 각 단계에서 바로 수정할 수 있습니다."
+            )
+
             # 수정 및 다음 단계 버튼
             submit_button = st.form_submit_button("정보 생성 및 다음 단계로", use_container_width=True)
 
@@ -545,15 +703,19 @@ def show_step_1(vector_store):
                         'semester': semester
                     })
 
-                    # 기본 정보 생성
-                    basic_info = generate_content(1, st.session_state.data, vector_store)
-                    if basic_info:
-                        st.session_state.data.update(basic_info)
-                        st.success("기본 정보가 생성되었습니다.")
-                        st.session_state.generated_step_1 = True
+                    # 비슷한 이전 계획서가 있으면 먼저 보여 주고, 없으면 바로 생성
+                    # (빠른 초안이면 1~4단계를 한 번에 생성해 각 단계 편집기를 채움)
+                    similar_plans = find_similar_plans(st.session_state.data)
+                    if similar_plans:
+                        st.session_state.similar_plans = {"hits": similar_plans, "express": express_mode}
+                    else:
+                        generate_first_draft(st.session_state.data, vector_store, express_mode)
             else:
                 st.error("모든 필수 항목을 입력해주세요.")
 
+        if 'similar_plans' in st.session_state and 'generated_step_1' not in st.session_state:
+            show_similar_plans(vector_store)
+
     # 생성된 내용 수정 단계
     if 'generated_step_1' in st.session_state:
         with st.form("edit_basic_info_form"):
@@ -595,28 +757,35 @@ def show_step_1(vector_store):
 
                 st.success("수정사항이 저장되었습니다.")
                 st.session_state.step = 2
+                clear_widget_state(1)
+                autosave_plan()
                 st.rerun()
 
     return False
 
+@st.fragment
+@profiled("step_2", count_widgets)
+@hold_session_lock(current_session_id)
 def show_step_2(vector_store):
     """2단계: 목표와 내용 요소 입력 및 생성"""
+    ensure_session_plan()
     st.markdown("<div class='step-header'><h3>2단계: 목표와 내용 요소</h3></div>", unsafe_allow_html=True)
 
     if 'generated_step_2' not in st.session_state:
         # 데이터 입력 및 생성 단계
         with st.form("goals_content_form"):
             st.info("목표와 내용 요소를 생성합니다.")
+            over_budget = show_generation_estimate(estimate_step_generation(2, st.session_state.data))
 
-            submit_button = st.form_submit_button("목표/내용 생성 및 다음 단계로", use_container_width=True)
+            submit_button = st.form_submit_button("목표/내용 생성 및 다음 단계로", use_container_width=True, disabled=bool(over_budget))
 
         # 버튼 동작 처리
         if submit_button:
             with st.spinner("목표와 내용을 생성하고 있습니다..."):
                 # 목표 및 내용 생성
-                content = generate_content(2, st.session_state.data, vector_store)
+                content = generate_step_content(2, st.session_state.data, vector_store, use_default=True)
                 if content:
-                    st.session_state.data.update(content)
+                    apply_step_content(2, st.session_state.data, content)
                     st.success("목표와 내용이 생성되었습니다.")
                     st.session_state.generated_step_2 = True
     else:
@@ -674,28 +843,35 @@ def show_step_2(vector_store):
 
                 st.success("수정사항이 저장되었습니다.")
                 st.session_state.step = 3
+                clear_widget_state(2)
+                autosave_plan()
                 st.rerun()
 
     return False
 
+@st.fragment
+@profiled("step_3", count_widgets)
+@hold_session_lock(current_session_id)
 def show_step_3(vector_store):
     """3단계: 성취기준 설정 입력 및 생성"""
+    ensure_session_plan()
     st.markdown("<div class='step-header'><h3>3단계: 성취기준 설정</h3></div>", unsafe_allow_html=True)
 
     if 'generated_step_3' not in st.session_state:
         # 데이터 입력 및 생성 단계
         with st.form("standards_form"):
             st.info("성취기준을 생성합니다.")
+            over_budget = show_generation_estimate(estimate_step_generation(3, st.session_state.data))
 
-            submit_button = st.form_submit_button("성취기준 생성 및 다음 단계로", use_container_width=True)
+            submit_button = st.form_submit_button("성취기준 생성 및 다음 단계로", use_container_width=True, disabled=bool(over_budget))
 
         # 버튼 동작 처리
         if submit_button:
             with st.spinner("성취기준을 생성하고 있습니다..."):
                 # 성취기준 생성
-                standards = generate_content(3, st.session_state.data, vector_store)
+                standards = generate_step_content(3, st.session_state.data, vector_store, use_default=True)
                 if standards:
-                    st.session_state.data['standards'] = standards
+                    apply_step_content(3, st.session_state.data, standards)
                     st.success("성취기준이 생성되었습니다.")
                     st.session_state.generated_step_3 = True
     else:
@@ -774,31 +950,35 @@ def show_step_3(vector_store):
 
                 st.success("성취기준이 저장되었습니다.")
                 st.session_state.step = 4
+                clear_widget_state(3)
+                autosave_plan()
                 st.rerun()
 
     return False
 
+@st.fragment
+@profiled("step_4", count_widgets)
+@hold_session_lock(current_session_id)
 def show_step_4(vector_store):
     """4단계: 교수학습 방법 및 평가계획 입력 및 생성"""
+    ensure_session_plan()
     st.markdown("<div class='step-header'><h3>4단계: 교수학습 방법 및 평가계획</h3></div>", unsafe_allow_html=True)
 
     if 'generated_step_4' not in st.session_state:
         # 데이터 입력 및 생성 단계
         with st.form("teaching_assessment_form"):
             st.info("교수학습 방법 및 평가계획을 생성합니다.")
+            over_budget = show_generation_estimate(estimate_step_generation(4, st.session_state.data))
 
-            submit_button = st.form_submit_button("교수학습/평가계획 생성 및 다음 단계로", use_container_width=True)
+            submit_button = st.form_submit_button("교수학습/평가계획 생성 및 다음 단계로", use_container_width=True, disabled=bool(over_budget))
 
         # 버튼 동작 처리
         if submit_button:
             with st.spinner("교수학습 방법 및 평가계획을 생성하고 있습니다..."):
                 # 교수학습 방법 및 평가계획 생성
-                content = generate_content(4, st.session_state.data, vector_store)
+                content = generate_step_content(4, st.session_state.data, vector_store, use_default=True)
                 if content:
-                    st.session_state.data.update({
-                        'teaching_methods': content.get('teaching_methods', []),
-                        'assessment_plan': content.get('assessment_plan', [])
-                    })
+                    apply_step_content(4, st.session_state.data, content)
                     st.success("교수학습 방법 및 평가계획이 생성되었습니다.")
                     st.session_state.generated_step_4 = True
     else:
@@ -870,6 +1050,8 @@ def show_step_4(vector_store):
 
                 st.success("교수학습 방법 및 평가계획이 저장되었습니다.")
                 st.session_state.step = 5
+                clear_widget_state(4)
+                autosave_plan()
                 st.rerun()
 
     return False
@@ -889,182 +1071,272 @@ def generate_lesson_plans_in_chunks(total_hours, data, chunk_size=10, vector_sto
         vector_store: 벡터 스토어 객체
 
     Returns:
-        list: 생성된 차시별 계획 리스트
+        list: 생성된 차시별 계획 리스트. 실패한 묶음이 있으면 None (일부 차시만으로 기존 계획을 덮지 않도록)
     """
-    all_lesson_plans = []
     progress_bar = st.progress(0)
+    failed = []
 
-    try:
-        for start in range(0, total_hours, chunk_size):
-            end = min(start + chunk_size, total_hours)
-            progress = int((start / total_hours) * 100)
-            progress_bar.progress(progress)
-
-            st.write(f"{start+1}~{end}차시 계획 생성 중...")
-
-            # 차시별 프롬프트 생성
-            chunk_prompt = f"""
-다음 정보를 바탕으로 {start+1}차시부터 {end}차시까지의 지도계획을 JSON으로 작성해주세요.
-
-활동명: {data.get('activity_name')}
-필요성: {data.get('necessity')}
-개요: {data.get('overview')}
-성격: {data.get('characteristics')}
-목표: {data.get('goals')}
-핵심 아이디어: {data.get('key_ideas')}
-성취기준: {data.get('standards')}
-교수학습 방법: {data.get('teaching_methods')}
-평가계획: {data.get('assessment_plan')}
-
-각 차시는 다음 사항을 고려하여 작성해주세요:
-1. 차시별로 명확한 학습주제 설정
-2. 구체적이고 실천 가능한 학습내용 기술
-3. 실제 수업에 필요한 교수학습자료 명시
-4. 이전 차시와의 연계성 고려
-5. 학습목표 달성을 위한 단계적 구성
-
-다음 JSON 형식으로 작성:
-{{
-  "lesson_plans": [
-    {{
-      "lesson_number": "차시번호",
-      "topic": "학습주제",
-      "content": "학습내용",
-      "materials": "교수학습자료"
-    }}
-  ]
-}}
-"""
-
-            # LangChain API 호출
-            messages = [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=chunk_prompt)
-            ]
-
-            try:
-                chat = ChatOpenAI(
-                    openai_api_key=OPENAI_API_KEY,
-                    model="gpt-4o",  # 모델 이름 오타 수정
-                    temperature=0.5,  # 구조적 답변 위해 약간 낮춤
-                    max_tokens=2000
-                )
-
-                response = chat(messages)
-                content = response.content.strip()
-                content = content.replace('```json', '').replace('```', '').strip()
-
-                parsed = json.loads(content)
-                lesson_plans = parsed.get("lesson_plans", [])
+    def on_event(event):
+        if event["type"] == "chunk_started":
+            progress_bar.progress(int((event["start"] / event["total"]) * 100))
+            st.write(f"{event['start']+1}~{event['end']}차시 계획 생성 중...")
+        elif event["type"] == "chunk_failed":
+            failed.append(event)
+            st.error(event["message"])
 
-                # 차시 번호 검증 및 수정
-                for i, plan in enumerate(lesson_plans, start=start+1):
-                    plan["lesson_number"] = str(i)
+    try:
+        all_lesson_plans = run_engine(agenerate_lessons, total_hours, data, chunk_size, on_event=on_event)
+        progress_bar.progress(100)
+        return None if failed else all_lesson_plans
 
-                all_lesson_plans.extend(lesson_plans)
+    except Exception as e:
+        st.error(f"차시별 계획 생성 중 오류가 발생했습니다: {str(e)}")
+        return None
 
-                # API 호출 제한 방지
-                time.sleep(1)
+def regenerate_lesson_range(first, last, data, lesson_plans, chunk_size=10, context_size=2):
+    """
+    first ~ last 차시만 다시 생성해 lesson_plans에 끼워 넣습니다.
+    구간 앞뒤의 차시를 context_size개씩 맥락으로 넣어 이어지는 흐름을 유지합니다.
 
-            except json.JSONDecodeError as e:
-                st.error(f"{start+1}~{end}차시 생성 중 JSON 파싱 오류 발생: {e}")
-                continue
-            except Exception as e:
-                st.error(f"{start+1}~{end}차시 생성 중 오류 발생: {e}")
-                continue
+    Args:
+        first (int): 다시 생성할 첫 차시 번호 (1부터)
+        last (int): 다시 생성할 마지막 차시 번호
+        data (dict): 계획서 데이터
+        lesson_plans (list): 현재 차시별 계획 리스트 (제자리에서 수정)
 
-        progress_bar.progress(100)
-        return all_lesson_plans
+    Returns:
+        list: 수정된 lesson_plans
+    """
+    return run_engine(aregenerate_lesson_range, first, last, data, lesson_plans, chunk_size, context_size)
 
-    except Exception as e:
-        st.error(f"차시별 계획 생성 중 오류가 발생했습니다: {str(e)}")
-        return []
+class LessonPlanJob:
+    """
+    차시별 계획을 백그라운드 스레드에서 청크 단위로 생성하는 작업.
+    완료된 청크는 순서대로 쌓아 두고, UI가 take_completed()로 가져가 편집기에 이어 붙입니다.
+    """
 
+    def __init__(self, total_hours, data, chunk_size=10):
+        self.total_hours = total_hours
+        self.chunk_size = chunk_size
+        self.data = dict(data)  # 생성 중 편집과 분리된 입력 스냅샷
+        self.session_id = current_session_id()  # 스레드 안에서는 Streamlit 세션을 알 수 없으므로 미리 저장
+        self.errors = []
+        self.generated_plans = []
+        self.generated_hours = 0
+        self.queue_position = 0
+        self.done = False
+        self._completed = []
+        self._taken = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        session_id_var.set(self.session_id)
+        try:
+            run_sync(agenerate_lessons, self.total_hours, self.data, self.chunk_size, on_event=self._on_event)
+        except Exception as e:
+            self.errors.append(f"차시별 계획 생성 중 오류가 발생했습니다: {str(e)}")
+        finally:
+            self.done = True
+
+    def _on_event(self, event):
+        """생성 엔진의 진행 이벤트를 작업 상태에 반영"""
+        if event["type"] == "waiting":
+            self.queue_position = event["position"]
+        elif event["type"] == "chunk_done":
+            self.queue_position = 0
+            self.generated_plans.extend(event["lesson_plans"])
+            self._completed.append(event["lesson_plans"])
+            self.generated_hours = event["end"]
+        elif event["type"] == "chunk_failed":
+            self.errors.append(event["message"])
+            self.generated_hours = event["end"]
+
+    def take_completed(self):
+        """아직 가져가지 않은 완료 청크를 순서대로 반환"""
+        completed = self._completed[self._taken:]
+        self._taken += len(completed)
+        return completed
+
+LESSONS_PER_PAGE = 10
+LESSON_JOB_POLL_SECONDS = 2
+
+def sync_lesson_job():
+    """백그라운드 생성 작업에서 완료된 청크를 계획서에 이어 붙이고, 작업이 끝나면 정리"""
+    job = st.session_state.get('lesson_job')
+    if job is None:
+        return
+
+    # 완료 여부를 먼저 읽어야 마지막 청크를 놓치지 않음
+    done = job.done
+    lesson_plans = st.session_state.data.setdefault('lesson_plans', [])
+    for plans in job.take_completed():
+        lesson_plans.extend(plans)
+
+    if done:
+        del st.session_state.lesson_job
+        st.session_state.lesson_job_errors = job.errors
+        if not lesson_plans:
+            del st.session_state.generated_step_5
+        elif not job.errors:
+            # 모든 묶음이 생성된 경우에만 최신으로 기록 (실패한 묶음이 있으면 변경 표시가 남음)
+            input_hash = step_input_hash(5, job.data)
+            save_step_result(ensure_plan_id(), 5, input_hash, job.generated_plans)
+            record_step_inputs(5, st.session_state.data, input_hash)
+            record_generation_time(st.session_state.data, 5, time.perf_counter() - job.started)
+        # 전체 재실행으로 폴링을 멈추고 저장 버튼을 활성화
+        st.rerun()
+
+    status = f"{job.generated_hours}/{job.total_hours}차시 생성 중... 완료된 차시는 바로 수정할 수 있습니다."
+    if job.queue_position:
+        status += f" (요청 대기 순서: {job.queue_position}번째)"
+    st.progress(job.generated_hours / job.total_hours, text=status)
+
+def show_lesson_editor():
+    """차시별 계획 편집기. 생성 작업이 진행 중이면 주기적으로 새 청크를 반영합니다."""
+    run_every = LESSON_JOB_POLL_SECONDS if 'lesson_job' in st.session_state else None
+    st.fragment(show_lesson_plan_page, run_every=run_every)()
+
+@profiled("lesson_page", count_widgets)
+@hold_session_lock(current_session_id)
+def show_lesson_plan_page():
+    """
+    차시별 계획 편집기에서 현재 페이지만 렌더링합니다.
+    fragment로 실행되어 페이지 이동이나 셀 편집 시 이 부분만 다시 실행되며,
+    위젯 수는 총 차시와 관계없이 페이지 선택기와 표 하나로 일정합니다.
+    """
+    ensure_session_plan()
+    sync_lesson_job()
+
+    lesson_plans = st.session_state.data.get('lesson_plans', [])
+    if not lesson_plans:
+        st.info("첫 번째 차시 묶음을 생성하고 있습니다...")
+        return
+    total_pages = max(1, (len(lesson_plans) + LESSONS_PER_PAGE - 1) // LESSONS_PER_PAGE)
+
+    page = st.radio(
+        "차시 범위",
+        range(total_pages),
+        format_func=lambda p: f"{p*LESSONS_PER_PAGE+1}~{min((p+1)*LESSONS_PER_PAGE, len(lesson_plans))}차시",
+        horizontal=True,
+        key="lesson_page"
+    )
+
+    start_idx = page * LESSONS_PER_PAGE
+    end_idx = min(start_idx + LESSONS_PER_PAGE, len(lesson_plans))
+    page_df = pd.DataFrame(lesson_plans[start_idx:end_idx], columns=LESSON_COLUMNS).fillna('')
+
+    edited_df = st.data_editor(
+        page_df,
+        column_config={
+            "lesson_number": st.column_config.TextColumn("차시", width="small"),
+            "topic": st.column_config.TextColumn("학습주제", help="이 차시의 주요 학습 주제를 입력하세요."),
+            "content": st.column_config.TextColumn("학습내용", width="large", help="구체적인 학습 활동 내용을 입력하세요."),
+            "materials": st.column_config.TextColumn("교수학습자료", help="필요한 교구와 자료를 입력하세요.")
+        },
+        disabled=["lesson_number"],
+        hide_index=True,
+        num_rows="fixed",
+        use_container_width=True,
+        key=f"lesson_editor_{page}_{st.session_state.get('lesson_editor_version', 0)}"
+    )
+
+    # 현재 페이지의 편집 결과만 계획서 데이터에 반영
+    lesson_plans[start_idx:end_idx] = edited_df.to_dict('records')
+
+def show_lesson_range_regenerator(total_hours):
+    """선택한 차시 구간만 다시 생성하는 UI"""
+    with st.expander("차시 구간 다시 생성"):
+        col1, col2 = st.columns(2)
+        with col1:
+            first = st.number_input("시작 차시", min_value=1, max_value=total_hours, value=1, key="regen_first")
+        with col2:
+            last = st.number_input("끝 차시", min_value=1, max_value=total_hours, value=min(5, total_hours), key="regen_last")
+
+        if st.button(f"{first}~{last}차시 다시 생성", use_container_width=True, disabled=first > last):
+            with st.spinner(f"{first}~{last}차시를 다시 생성하고 있습니다..."):
+                try:
+                    data = st.session_state.data
+                    regenerate_lesson_range(first, last, data, data.setdefault('lesson_plans', []), LESSONS_PER_PAGE)
+                    # 편집기 위젯 상태를 새로 만들어 이전 편집 내용이 새 차시를 덮지 않도록 함
+                    st.session_state.lesson_editor_version = st.session_state.get('lesson_editor_version', 0) + 1
+                    autosave_plan()
+                except Exception as e:
+                    st.error(chunk_error_message(first - 1, last, e))
+                else:
+                    st.toast(f"{first}~{last}차시를 다시 생성했습니다.")
+                    st.rerun()
+
+@st.fragment
+@profiled("step_5", count_widgets)
+@hold_session_lock(current_session_id)
 def show_step_5(vector_store):
     """5단계: 차시별 지도계획 입력 및 생성"""
+    ensure_session_plan()
     total_hours = st.session_state.data.get('total_hours', 30)
     st.markdown(f"<div class='step-header'><h3>5단계: 차시별 지도계획 ({total_hours}차시)</h3></div>", unsafe_allow_html=True)
 
+    for error in st.session_state.pop('lesson_job_errors', []):
+        st.error(error)
+
     if 'generated_step_5' not in st.session_state:
         # 데이터 입력 및 생성 단계
         with st.form("lesson_plans_form"):
             st.info(f"{total_hours}차시 계획을 생성합니다.")
+            over_budget = show_generation_estimate(
+                estimate_lesson_generation(total_hours, st.session_state.data, LESSONS_PER_PAGE)
+            )
 
-            submit_button = st.form_submit_button(f"{total_hours}차시 계획 생성 및 다음 단계로", use_container_width=True)
+            submit_button = st.form_submit_button(
+                f"{total_hours}차시 계획 생성 및 다음 단계로", use_container_width=True, disabled=bool(over_budget)
+            )
 
         # 버튼 동작 처리
         if submit_button:
-            with st.spinner(f"{total_hours}차시 계획을 생성하고 있습니다..."):
-                chunk_size = 10
-                all_plans = generate_lesson_plans_in_chunks(total_hours, st.session_state.data, chunk_size, vector_store)
-                if all_plans:
-                    st.session_state.data['lesson_plans'] = all_plans
-                    st.success(f"{total_hours}차시 계획이 생성되었습니다.")
-                    st.session_state.generated_step_5 = True
+            input_hash = step_input_hash(5, st.session_state.data)
+            cached_plans = load_step_result(ensure_plan_id(), 5, input_hash)
+            if cached_plans:
+                # 입력이 바뀌지 않았으면 저장된 차시별 계획을 그대로 사용
+                st.session_state.data['lesson_plans'] = cached_plans
+                record_step_inputs(5, st.session_state.data, input_hash)
+            else:
+                # 청크가 완료되는 대로 편집기에 채워지도록 백그라운드에서 생성
+                st.session_state.lesson_job = LessonPlanJob(total_hours, st.session_state.data, LESSONS_PER_PAGE).start()
+                st.session_state.data['lesson_plans'] = []
+            st.session_state.generated_step_5 = True
+            st.rerun()
     else:
-        # 생성된 차시별 계획 전체 수정 단계
-        with st.form("edit_lesson_plans_form"):
-            st.markdown("#### 생성된 차시별 계획 수정")
-
-            lesson_plans = st.session_state.data.get('lesson_plans', [])
-            edited_plans = []
-
-            total_tabs = (total_hours + 9) // 10
-            tabs = st.tabs([f"{i*10+1}~{min((i+1)*10, total_hours)}차시" for i in range(total_tabs)])
-
-            for tab_idx, tab in enumerate(tabs):
-                with tab:
-                    start_idx = tab_idx * 10
-                    end_idx = min(start_idx + 10, total_hours)
-
-                    for i in range(start_idx, end_idx):
-                        st.markdown(f"##### {i+1}차시")
-
-                        col1, col2 = st.columns([1, 2])
-                        with col1:
-                            topic = st.text_input(
-                                "학습주제",
-                                value=lesson_plans[i].get('topic', ''),
-                                key=f"topic_{i}",
-                                help="이 차시의 주요 학습 주제를 입력하세요."
-                            )
-                            materials = st.text_input(
-                                "교수학습자료",
-                                value=lesson_plans[i].get('materials', ''),
-                                key=f"materials_{i}",
-                                help="필요한 교구와 자료를 입력하세요."
-                            )
-
-                        with col2:
-                            content = st.text_area(
-                                "학습내용",
-                                value=lesson_plans[i].get('content', ''),
-                                key=f"content_{i}",
-                                height=100,
-                                help="구체적인 학습 활동 내용을 입력하세요."
-                            )
-
-                        edited_plans.append({
-                            "lesson_number": f"{i+1}",
-                            "topic": topic,
-                            "content": content,
-                            "materials": materials
-                        })
-                        st.markdown("---")
+        # 생성된 차시별 계획 수정 단계 (보이는 페이지만 렌더링)
+        st.markdown("#### 생성된 차시별 계획 수정")
+        show_lesson_editor()
 
-            # 수정 및 다음 단계 버튼
-            submit_button_edit = st.form_submit_button("수정사항 저장 및 다음 단계로", use_container_width=True)
+        if 'lesson_job' not in st.session_state:
+            show_lesson_range_regenerator(total_hours)
+
+        # 수정 및 다음 단계 버튼 (생성이 끝난 뒤 활성화)
+        submit_button_edit = st.button(
+            "수정사항 저장 및 다음 단계로",
+            use_container_width=True,
+            disabled='lesson_job' in st.session_state
+        )
 
         if submit_button_edit:
             with st.spinner("수정사항을 저장하고 다음 단계로 이동 중입니다..."):
-                # 데이터 업데이트
-                st.session_state.data['lesson_plans'] = edited_plans
+                # 편집 내용은 페이지 편집기에서 이미 반영되어 있음
 
                 # 수정 완료 플래그 제거
                 del st.session_state.generated_step_5
+                st.session_state.pop('lesson_page', None)
 
                 st.success("차시별 계획이 저장되었습니다.")
                 st.session_state.step = 6
+                add_to_semantic_cache(st.session_state.data)
+                clear_widget_state(5)
+                autosave_plan()
                 st.rerun()
 
     return False
@@ -1072,108 +1344,45 @@ def show_step_5(vector_store):
 ###############################################################################
 # 7. Excel 문서 생성 함수
 ###############################################################################
-def create_excel_document():
+def create_excel_document(data=None):
     """
-    현재 세션의 데이터를 기반으로 Excel 문서를 생성합니다.
+    계획서 데이터를 기반으로 Excel 문서를 생성합니다.
+    (렌더링은 Streamlit 없이도 쓰는 plan_export 모듈이 담당)
+
+    Args:
+        data (dict, optional): 계획서 데이터. 기본값은 현재 세션의 데이터
+
+    Returns:
+        bytes: xlsx 파일 내용
     """
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        workbook = writer.book
-
-        # 셀 스타일 설정
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#E2E8F0',
-            'border': 1,
-            'text_wrap': True,
-            'align': 'center',
-            'valign': 'vcenter'
-        })
-        
-        content_format = workbook.add_format({
-            'text_wrap': True,
-            'valign': 'top',
-            'border': 1
-        })
-
-        # (1) 기본정보 시트
-        basic_info = pd.DataFrame([{
-            '학교급': st.session_state.data.get('school_type', ''),
-            '대상학년': ', '.join(st.session_state.data.get('grades', [])),
-            '총차시': st.session_state.data.get('total_hours', ''),
-            '주당차시': st.session_state.data.get('weekly_hours', ''),
-            '운영학기': ', '.join(st.session_state.data.get('semester', [])),
-            '연계교과': ', '.join(st.session_state.data.get('subjects', [])),
-            '활동명': st.session_state.data.get('activity_name', ''),
-            '요구사항': st.session_state.data.get('requirements', ''),
-            '필요성': st.session_state.data.get('necessity', ''),
-            '개요': st.session_state.data.get('overview', ''),
-            '성격': st.session_state.data.get('characteristics', '')
-        }])
-        basic_info.T.to_excel(writer, sheet_name='기본정보', header=['내용'])
-
-        # (2) 목표/내용 시트
-        goals_data = []
-        for goal in st.session_state.data.get('goals', []):
-            goals_data.append({'구분': '목표', '내용': goal})
-        for idea in st.session_state.data.get('key_ideas', []):
-            goals_data.append({'구분': '핵심아이디어', '내용': idea})
-        pd.DataFrame(goals_data).to_excel(writer, sheet_name='목표및내용', index=False)
-
-        # (3) 성취기준 시트
-        standards_data = []
-        for std in st.session_state.data.get('standards', []):
-            for level in std['levels']:
-                standards_data.append({
-                    '성취기준': std['code'],
-                    '설명': std['description'],
-                    '수준': level['level'],
-                    '수준별설명': level['description']
-                })
-        pd.DataFrame(standards_data).to_excel(writer, sheet_name='성취기준', index=False)
-
-        # (4) 교수학습 및 평가 시트
-        methods_data = []
-        for method in st.session_state.data.get('teaching_methods', []):
-            methods_data.append({
-                '구분': '교수학습방법',
-                '항목': method.get('method', ''),
-                '설명': method.get('description', '')
-            })
-        for plan in st.session_state.data.get('assessment_plan', []):
-            methods_data.append({
-                '구분': '평가계획',
-                '항목': plan.get('focus', ''),
-                '설명': plan.get('description', '')
-            })
-        pd.DataFrame(methods_data).to_excel(writer, sheet_name='교수학습및평가', index=False)
-
-        # (5) 차시별계획 시트
-        lesson_plans_df = pd.DataFrame(st.session_state.data.get('lesson_plans', []))
-        lesson_plans_df.columns = ['차시', '학습주제', '학습내용', '교수학습자료']  # 열 이름 한글화
-        lesson_plans_df.to_excel(writer, sheet_name='차시별계획', index=False)
-
-        # 모든 시트의 열 너비 조정
-        for worksheet in writer.sheets.values():
-            worksheet.set_column('A:A', 15)  # 첫 번째 열
-            worksheet.set_column('B:B', 40)  # 두 번째 열
-            worksheet.set_column('C:D', 20)  # 세 번째, 네 번째 열
-            
-            # 행 높이 자동 조정을 위한 설정
-            worksheet.set_default_row(30)
-            worksheet.set_row(0, 40)  # 헤더 행 높이
-
-    return output.getvalue()
+    if data is None:
+        data = st.session_state.data
+    return render_xlsx(data)
 
 ###############################################################################
 # 8. 최종 검토 UI
 ###############################################################################
+@profiled("step_6", count_widgets)
+@hold_session_lock(current_session_id)
 def show_final_review(vector_store):
     """최종 계획서 검토 UI"""
     st.title("최종 계획서 검토")
     
     try:
         data = st.session_state.data
+
+        # 앞 단계 수정으로 다시 생성해야 하는 단계 표시
+        stale_steps = find_stale_steps(data)
+        if stale_steps:
+            st.warning(
+                "입력이 바뀌어 다시 생성이 필요한 단계: "
+                + ", ".join(STEP_LABELS[step - 1] for step in stale_steps)
+            )
+            if st.button("변경된 단계만 다시 생성", use_container_width=True):
+                with st.spinner("변경된 단계를 다시 생성하고 있습니다..."):
+                    regenerate_stale_steps(stale_steps, vector_store)
+                st.rerun()
+
         tabs = st.tabs(["기본정보", "목표/내용", "성취기준", "교수학습/평가", "차시별계획"])
 
         with tabs[0]:
@@ -1233,7 +1442,7 @@ def show_final_review(vector_store):
 
         with tabs[4]:
             st.markdown("### 차시별 계획")
-            lesson_plans_df = pd.DataFrame(data.get('lesson_plans', []))
+            lesson_plans_df = pd.DataFrame(data.get('lesson_plans', []), columns=LESSON_COLUMNS)
             st.dataframe(
                 lesson_plans_df,
                 column_config={
@@ -1249,7 +1458,7 @@ def show_final_review(vector_store):
             st.button("차시별 계획 수정하기", key="edit_lesson_plans", on_click=lambda: set_step(5), use_container_width=True)
 
         # 하단 버튼 그룹
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
 
         with col1:
             if st.button("모든 단계 수정하기", use_container_width=True):
@@ -1257,45 +1466,258 @@ def show_final_review(vector_store):
                 st.rerun()
 
         with col2:
-            excel_data = create_excel_document()
+            # 내용이 바뀌지 않았다면 이전에 만든 파일을 그대로 사용하고, 없을 때만 요청 시 생성
+            fingerprint = plan_fingerprint(data)
+            excel_export = st.session_state.get('excel_export')
+            if not excel_export or excel_export[0] != fingerprint:
+                if st.button("📄 Excel 파일 만들기", use_container_width=True):
+                    with st.spinner("Excel 파일을 만드는 중입니다..."):
+                        excel_export = (fingerprint, create_excel_document(data))
+                        st.session_state.excel_export = excel_export
+
+            if excel_export and excel_export[0] == fingerprint:
+                st.download_button(
+                    "📥 Excel 다운로드",
+                    excel_export[1],
+                    file_name=f"{data.get('activity_name', '학교자율시간계획서')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True
+                )
+
+        with col3:
+            # 일괄 내보내기(plan_export.py)에서 다시 읽을 수 있는 계획서 원본
             st.download_button(
-                "📥 Excel 다운로드",
-                excel_data,
-                file_name=f"{data.get('activity_name', '학교자율시간계획서')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                "💾 계획서 저장(JSON)",
+                json.dumps(data, ensure_ascii=False, indent=2, default=json_default),
+                file_name=f"{data.get('activity_name', '학교자율시간계획서')}.json",
+                mime="application/json",
                 use_container_width=True
             )
 
-        with col3:
+        with col4:
             if st.button("새로 만들기", use_container_width=True):
                 st.session_state.clear()
+                st.query_params.clear()
                 st.rerun()
 
     except Exception as e:
         st.error(f"최종 검토 화면 처리 중 오류가 발생했습니다: {str(e)}")
 
 ###############################################################################
-# 9. 단계 이동 함수
+# 9. 단계 이동 및 계획서 저장 함수
 ###############################################################################
 def set_step(step_number):
     """특정 단계로 이동하는 함수"""
     st.session_state.step = step_number
     # st.rerun()을 콜백 내에서 호출하지 않음. Streamlit이 자동으로 리런함.
 
+def ensure_plan_id():
+    """현재 세션의 계획서 ID (없으면 새로 발급하고 주소창에 남겨 새로고침 후에도 이어서 작업)"""
+    if 'plan_id' not in st.session_state:
+        st.session_state.plan_id = new_plan_id()
+    st.query_params["plan"] = st.session_state.plan_id
+    return st.session_state.plan_id
+
+def autosave_plan():
+    """현재 단계와 계획서 데이터를 저장 (각 단계의 수정사항 저장 시 호출)"""
+    try:
+        save_plan(ensure_plan_id(), st.session_state.step, st.session_state.data)
+    except Exception as e:
+        st.warning(f"계획서 자동 저장 중 오류가 발생했습니다: {str(e)}")
+
+def restore_plan(plan_id):
+    """저장된 계획서를 불러와 현재 세션을 해당 계획서로 바꿈"""
+    step, data = load_plan(plan_id)
+    if data is None:
+        return False
+
+    for key in [k for k in st.session_state.keys() if str(k).startswith('generated_step_')]:
+        del st.session_state[key]
+    clear_plan_state()
+    st.session_state.plan_id = plan_id
+    st.session_state.data = as_plan(data)
+    st.session_state.step = step
+    st.query_params["plan"] = plan_id
+    return True
+
+# 단계별 편집 위젯 키 접두어 (저장 후에는 계획서가 원본이므로 위젯 상태 사본을 지움)
+STEP_WIDGET_KEYS = {
+    1: ('school_type_radio', 'grades_multiselect_', 'subjects_multiselect_', 'express_mode_checkbox',
+        'necessity_textarea', 'overview_textarea', 'characteristics_textarea'),
+    2: ('goal_', 'domain_input', 'idea_'),
+    3: ('std_',),
+    4: ('tm_', 'ap_'),
+    5: ('lesson_editor_', 'lesson_page', 'regen_')
+}
+
+# 메모리 제한을 넘으면 먼저 지우는 세션 항목 (필요할 때 다시 만들 수 있음)
+REBUILDABLE_STATE_KEYS = ('excel_export',)
+
+# 계획서를 새로 불러올 때 지우는 세션 항목 (이전 계획서의 생성 작업, 유사 계획서 제안, 내보내기 결과)
+PLAN_STATE_KEYS = ('lesson_job', 'lesson_job_errors', 'similar_plans', 'excel_export')
+
+def clear_widget_state(step):
+    """단계의 편집 위젯 상태를 세션에서 지움 (다음 렌더링 때 계획서 값으로 다시 만들어짐)"""
+    prefixes = STEP_WIDGET_KEYS.get(step, ())
+    for key in [k for k in st.session_state.keys() if str(k).startswith(prefixes)]:
+        del st.session_state[key]
+
+def clear_plan_state():
+    """
+    계획서를 불러오기 전에 이전 계획서의 위젯 상태와 작업 상태를 지움.
+    남은 위젯 값이 불러온 계획서를 덮거나, 이전 생성 작업의 차시가 불러온 계획서에 붙지 않도록 합니다.
+    """
+    for step in STEP_WIDGET_KEYS:
+        clear_widget_state(step)
+    for key in PLAN_STATE_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.lesson_editor_version = st.session_state.get('lesson_editor_version', 0) + 1
+
+def session_exists(session_id):
+    """
+    세션이 아직 Streamlit 런타임에 남아 있는지 (연결이 끊겨 재연결을 기다리는 세션 포함).
+    런타임을 조회할 수 없으면 남아 있는 것으로 봅니다.
+    """
+    if not runtime.exists():
+        return True
+    session_mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+    if session_mgr is None:
+        return True
+    return session_mgr.get_session_info(session_id) is not None
+
+def ensure_session_plan():
+    """
+    세션의 계획서를 Plan 객체로 정리하고 실행 시각을 기록합니다.
+    유휴 상태로 저장소에 내려 둔 세션이면 저장된 계획서를 다시 불러옵니다.
+    (fragment만 다시 실행되는 경우도 있으므로 main과 각 단계 fragment 시작 시 호출.
+    호출하는 함수는 모두 세션 잠금을 잡고 실행되므로 내리기 스레드가 실행 중에 계획서를 비우지 않음)
+    """
+    session_id = current_session_id()
+    plan_id, _, data = restore_offloaded_session(session_id)
+    if data is not None:
+        clear_plan_state()
+        st.session_state.plan_id = plan_id
+        st.session_state.data = data
+        st.query_params["plan"] = plan_id
+
+    st.session_state.data = as_plan(st.session_state.get('data'))
+    touch_session(session_id, st.session_state.data, st.session_state.get('plan_id'), st.session_state.get('step'))
+    return st.session_state.data
+
+def enforce_session_memory_limit():
+    """세션 메모리가 제한을 넘으면 다시 만들 수 있는 항목부터 지우고, 그래도 넘으면 경고"""
+    report = session_memory_report(st.session_state)
+    if report["total"] <= SESSION_MEMORY_LIMIT_BYTES:
+        return report
+
+    for key in REBUILDABLE_STATE_KEYS:
+        st.session_state.pop(key, None)
+    report = session_memory_report(st.session_state)
+    if report["total"] > SESSION_MEMORY_LIMIT_BYTES:
+        st.warning(
+            f"세션 메모리 사용량({report['total'] / 1024 / 1024:.1f}MB)이 "
+            f"제한({SESSION_MEMORY_LIMIT_BYTES / 1024 / 1024:.1f}MB)을 넘었습니다."
+        )
+    return report
+
+def show_session_memory(report):
+    """사이드바에 세션 메모리 사용량을 항목별로 표시"""
+    with st.sidebar.expander(f"세션 메모리: {report['total'] / 1024:.1f}KB"):
+        st.caption(f"제한: {report['limit'] / 1024 / 1024:.1f}MB (공유 객체 제외)")
+        for key, size in report["items"]:
+            st.markdown(f"- `{key}`: {size / 1024:.1f}KB")
+
+def show_profile_report():
+    """프로파일링 모드일 때 사이드바에 구간별 실행 시간과 최근 실행의 병목 함수를 표시"""
+    if not PROFILE_ENABLED:
+        return
+
+    with st.sidebar.expander("실행 프로파일"):
+        summary = profile_summary()
+        if not summary:
+            st.caption("아직 측정된 실행이 없습니다.")
+            return
+        st.dataframe(
+            pd.DataFrame(summary),
+            column_config={
+                "name": "구간",
+                "count": "횟수",
+                "p50_ms": "p50(ms)",
+                "p95_ms": "p95(ms)",
+                "max_ms": "최대(ms)",
+                "widgets": "위젯 수",
+                "allocated_kb": "메모리 증가(KB)"
+            },
+            hide_index=True
+        )
+
+        # 병목 함수는 cProfile을 적용한 가장 바깥 구간(실행 전체 또는 fragment 재실행)에만 있음
+        profiled_records = [record for record in recent_records() if record.hotspots][:20]
+        if not profiled_records:
+            return
+        labels = [
+            f"{time.strftime('%H:%M:%S', time.localtime(record.started_at))} {record.name} "
+            f"{record.duration * 1000:.0f}ms"
+            for record in profiled_records
+        ]
+        index = st.selectbox("실행 선택", range(len(labels)), format_func=lambda i: labels[i], key="profile_record_select")
+        sort = st.radio("정렬", ["cumulative", "tottime"], horizontal=True, key="profile_sort_radio",
+                        format_func=lambda value: "누적 시간" if value == "cumulative" else "자체 시간")
+        record = profiled_records[index]
+        st.dataframe(pd.DataFrame(record.hotspots[sort]), hide_index=True)
+        if record.memory_hotspots:
+            st.markdown("**메모리가 늘어난 코드 줄**")
+            st.dataframe(pd.DataFrame(record.memory_hotspots), hide_index=True)
+        if record.profile_path:
+            st.caption(f"프로파일 파일: `{record.profile_path}`")
+        elif not PROFILE_DIR:
+            st.caption("SEOHS_PROFILE_DIR을 지정하면 실행마다 .prof 파일을 저장합니다.")
+
+def show_plan_sidebar():
+    """사이드바에 현재 계획서 ID와 저장된 계획서 불러오기 표시"""
+    with st.sidebar:
+        st.markdown("### 계획서 저장")
+        if 'plan_id' in st.session_state:
+            st.markdown(f"**계획서 ID**: `{st.session_state.plan_id}`")
+            st.caption("각 단계를 저장할 때 자동으로 저장됩니다. 이 ID로 나중에 이어서 작업할 수 있습니다.")
+
+        # 완성했던 계획서를 앞 단계에서 수정 중이면 바로 최종 검토로 돌아갈 수 있음
+        if st.session_state.step < 6 and st.session_state.data.get('lesson_plans'):
+            if st.button("최종 검토로 이동", use_container_width=True):
+                set_step(6)
+                st.rerun()
+
+        with st.form("load_plan_form"):
+            plan_id = st.text_input("계획서 ID", placeholder="예: 3f9a1c2b7d4e")
+            if st.form_submit_button("불러오기", use_container_width=True):
+                if restore_plan(plan_id.strip()):
+                    st.rerun()
+                else:
+                    st.error("해당 ID의 계획서를 찾을 수 없습니다.")
+
 ###############################################################################
 # 10. 메인 함수
 ###############################################################################
+@profiled("rerun", count_widgets)
+@hold_session_lock(current_session_id)
 def main():
     """메인 함수: 애플리케이션의 전체 실행 흐름을 관리"""
     try:
         # 페이지 기본 설정
         set_page_config()
 
-        # 세션 상태 초기화
-        if 'data' not in st.session_state:
-            st.session_state.data = {}
+        # 세션 상태 초기화 (계획서는 Plan 객체 하나로 보관하고 유휴 세션 내리기 스레드 시작)
         if 'step' not in st.session_state:
             st.session_state.step = 1
+        start_offload_worker(session_exists)
+        ensure_session_plan()
+
+        # 주소창의 계획서 ID로 저장된 계획서 이어서 작업 (새로고침, 서버 재시작 후 복구)
+        if 'plan_id' not in st.session_state and st.query_params.get("plan"):
+            restore_plan(st.query_params["plan"])
+        show_plan_sidebar()
+        show_session_memory(enforce_session_memory_limit())
+        show_profile_report()
 
         # 앱 제목
         st.title("2022 개정 교육과정 학교자율시간 계획서 생성기")
@@ -1303,13 +1725,24 @@ def main():
         # 진행 상황 표시
         show_progress()
 
-        # 벡터 스토어 설정
-        vector_store = setup_vector_store()
+        # 벡터 스토어 설정 (인덱스 버전이 바뀌었을 때만 다시 조회. 문서 추가 후 교체된 인덱스를 이어서 사용)
+        index_version = current_index_version()
+        if 'vector_store' not in st.session_state or st.session_state.get('vector_store_version') != index_version:
+            st.session_state.vector_store = setup_vector_store(index_version)
+            st.session_state.vector_store_version = index_version
+            st.session_state.index_report = (load_index_meta() or {}).get("report")
+        vector_store = st.session_state.vector_store
         if not vector_store:
+            st.session_state.pop('vector_store', None)
             st.error("문서 임베딩에 실패했습니다. documents 폴더를 확인해주세요.")
             return
+        show_index_report()
+        show_semantic_cache_report()
+        show_usage_report()
+        show_document_upload()
 
         # 현재 단계에 따른 UI 표시
+        # 1~5단계 본문은 fragment라서 본문 안의 상호작용은 진행 표시와 CSS를 다시 보내지 않음
         step_functions = {
             1: show_step_1,
             2: show_step_2,
@@ -1331,6 +1764,7 @@ def main():
         st.error(f"애플리케이션 실행 중 오류가 발생했습니다: {str(e)}")
         if st.button("처음부터 다시 시작", use_container_width=True):
             st.session_state.clear()
+            st.query_params.clear()
             st.rerun()
 
 # 애플리케이션 실행
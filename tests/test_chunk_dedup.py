@@ -0,0 +1,55 @@
+"""
+chunk_dedup 테스트
+
+- 색인 전 중복 제거: 완전 중복과 유사 중복 청크를 빼고 먼저 나온 청크를 남겨야 합니다.
+- 저장된 중복 판단 상태(DedupState)로 추가 문서를 걸러도 기존 청크를 함께 넘긴 것과 결과가 같아야 합니다.
+"""
+from chunk_dedup import DedupState, deduplicate_documents
+
+
+class Doc:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+BASE = "학생들은 생활 속 문제를 찾아 자료를 모으고 해결 방법을 설계하여 실천한다. "
+OTHER = "지역의 역사와 문화를 조사하고 발표 자료를 만들어 친구들과 공유하는 활동을 한다. "
+
+
+def _contents(docs):
+    return [doc.page_content for doc in docs]
+
+
+def test_removes_exact_and_near_duplicates():
+    docs = [
+        Doc(BASE * 3),
+        Doc("  " + (BASE * 3).upper() + "  "),   # 공백·대소문자만 다른 완전 중복
+        Doc(BASE * 3 + "끝."),                    # 끝만 조금 다른 유사 중복
+        Doc(OTHER * 3),
+        Doc("제목"),                              # 짧은 청크는 완전 중복만 판단
+        Doc("제목"),
+    ]
+
+    kept, report = deduplicate_documents(docs)
+
+    assert _contents(kept) == [BASE * 3, OTHER * 3, "제목"]
+    assert report == {"input": 6, "exact": 2, "near": 1, "kept": 3}
+
+
+def test_saved_state_matches_existing_documents(tmp_path):
+    existing = [Doc(BASE * 3), Doc("제목")]
+    new = [Doc(BASE * 3 + "끝."), Doc("제목"), Doc(OTHER * 3)]
+
+    expected, expected_report = deduplicate_documents(new, existing=existing)
+
+    state = DedupState()
+    deduplicate_documents(existing, state=state)
+    state.save(tmp_path)
+    kept, report = deduplicate_documents(new, state=DedupState.load(tmp_path))
+
+    assert _contents(kept) == _contents(expected) == [OTHER * 3]
+    assert report == expected_report
+
+
+def test_load_without_saved_state_returns_none(tmp_path):
+    assert DedupState.load(tmp_path) is None
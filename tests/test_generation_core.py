@@ -0,0 +1,151 @@
+"""
+generation_core 테스트 (Streamlit 없이 실행)
+
+- 프롬프트: 세션의 Plan 레코드와 dict 계획서가 같은 프롬프트가 되어야 합니다.
+- 응답 검증: 단계별 결과와 빠른 초안 응답의 구조가 맞지 않으면 ValueError를 올려야 합니다.
+- 차시 구간 재생성: 다시 만든 차시만 교체하고 나머지 차시와 순서는 그대로 두어야 합니다.
+- 변경된 단계 찾기: 입력이 바뀐 단계와 그 단계에 의존하는 후속 단계만 찾아야 합니다.
+"""
+import json
+import copy
+import asyncio
+
+import pytest
+
+import generation_core
+from generation_core import (
+    STEP_DEPENDENCIES, aregenerate_lesson_range, build_lesson_chunk_prompt, find_stale_steps,
+    parse_express_content, record_step_inputs, validate_step_content
+)
+from plan_model import as_plan
+
+PLAN = {
+    "activity_name": "코딩 활동",
+    "goals": ["지식 목표", "기능 목표"],
+    "key_ideas": ["순차", "반복"],
+    "standards": [
+        {"code": "X1", "description": "설명", "levels": [{"level": "A", "description": "잘함"}]}
+    ],
+    "teaching_methods": [{"method": "프로젝트", "description": "모둠 활동"}],
+    "assessment_plan": [{"focus": "협력", "description": "관찰"}],
+}
+
+
+def test_lesson_chunk_prompt_same_for_records_and_dicts():
+    from_dict = build_lesson_chunk_prompt(0, 5, PLAN)
+    from_plan = build_lesson_chunk_prompt(0, 5, as_plan(copy.deepcopy(PLAN)))
+
+    assert from_dict == from_plan
+    assert "Standard(" not in from_plan
+    assert '"code": "X1"' in from_plan
+
+
+STEP_CONTENTS = {
+    1: {"necessity": "필요성", "overview": "개요", "characteristics": "성격"},
+    2: {"goals": ["목표"], "domain": "영역", "key_ideas": ["핵심 아이디어"]},
+    3: PLAN["standards"],
+    4: {"teaching_methods": PLAN["teaching_methods"], "assessment_plan": PLAN["assessment_plan"]},
+}
+
+
+@pytest.mark.parametrize("step", sorted(STEP_CONTENTS))
+def test_validate_step_content_accepts_valid_content(step):
+    assert validate_step_content(step, STEP_CONTENTS[step]) is STEP_CONTENTS[step]
+
+
+@pytest.mark.parametrize("step, content", [
+    (1, {"necessity": "필요성", "overview": "개요"}),
+    (2, {"goals": [], "domain": "영역", "key_ideas": ["핵심 아이디어"]}),
+    (3, []),
+    (3, [{"code": "X1", "description": "설명", "levels": [{"level": "A"}]}]),
+    (4, {"teaching_methods": [{"method": "프로젝트"}], "assessment_plan": []}),
+    (4, ["teaching_methods"]),
+])
+def test_validate_step_content_rejects_invalid_content(step, content):
+    with pytest.raises(ValueError):
+        validate_step_content(step, content)
+
+
+def test_parse_express_content_splits_sections_by_step():
+    response = {
+        "basic_info": STEP_CONTENTS[1],
+        "goals_content": STEP_CONTENTS[2],
+        "standards": STEP_CONTENTS[3],
+        "teaching_assessment": STEP_CONTENTS[4],
+    }
+    text = "```json\n" + json.dumps(response, ensure_ascii=False) + "\n```"
+
+    assert parse_express_content(text) == STEP_CONTENTS
+
+
+def test_parse_express_content_rejects_missing_section():
+    text = json.dumps({"basic_info": STEP_CONTENTS[1], "goals_content": STEP_CONTENTS[2]})
+
+    with pytest.raises(ValueError):
+        parse_express_content(text)
+
+
+def _lessons(first, last, topic):
+    return [{"lesson_number": str(n), "topic": f"{topic} {n}", "content": "내용"} for n in range(first, last + 1)]
+
+
+def test_regenerate_lesson_range_replaces_only_the_range(monkeypatch):
+    calls = []
+
+    async def fake_chunk(start, end, data, neighbors=None, on_event=None):
+        before, after = neighbors
+        calls.append((start, end, [p["topic"] for p in before], [p["topic"] for p in after]))
+        return _lessons(start + 1, end, "새")
+
+    monkeypatch.setattr(generation_core, "agenerate_lesson_chunk", fake_chunk)
+    lesson_plans = _lessons(1, 10, "기존")
+
+    result = asyncio.run(aregenerate_lesson_range(4, 6, PLAN, lesson_plans, chunk_size=2, context_size=2))
+
+    assert result is lesson_plans
+    assert [p["lesson_number"] for p in result] == [str(n) for n in range(1, 11)]
+    assert [p["topic"] for p in result[3:6]] == ["새 4", "새 5", "새 6"]
+    assert result[2]["topic"] == "기존 3" and result[6]["topic"] == "기존 7"
+    # 두 번째 묶음은 앞 묶음이 새로 만든 차시를 맥락으로 받음
+    assert calls == [
+        (3, 5, ["기존 2", "기존 3"], ["기존 7", "기존 8"]),
+        (5, 6, ["새 4", "새 5"], ["기존 7", "기존 8"]),
+    ]
+
+
+def test_step_dependencies_follow_step_outputs():
+    assert STEP_DEPENDENCIES == {1: [], 2: [], 3: [2], 4: [], 5: [1, 2, 3, 4]}
+
+
+def _generated_plan():
+    data = as_plan(copy.deepcopy(dict(PLAN, requirements="요구", domain="영역", total_hours=5)))
+    for step in (1, 2, 3, 4, 5):
+        record_step_inputs(step, data)
+    return data
+
+
+def test_find_stale_steps_reports_nothing_when_inputs_unchanged():
+    assert find_stale_steps(_generated_plan()) == []
+
+
+def test_find_stale_steps_includes_dependent_steps():
+    data = _generated_plan()
+    data["domain"] = "다른 영역"
+
+    # 3단계 입력(domain)이 바뀌면 성취기준을 입력으로 쓰는 5단계도 다시 생성
+    assert find_stale_steps(data) == [3, 5]
+
+
+def test_find_stale_steps_propagates_through_upstream_steps():
+    data = _generated_plan()
+    data["requirements"] = "다른 요구"
+
+    assert find_stale_steps(data) == [1, 2, 3, 4, 5]
+
+
+def test_find_stale_steps_skips_steps_never_generated():
+    data = _generated_plan()
+    del data["_step_inputs"]["3"]
+    data["domain"] = "다른 영역"
+
+    assert find_stale_steps(data) == []
@@ -0,0 +1,60 @@
+"""
+llm_scheduler 테스트
+
+- 동일 요청 합치기(asingle_flight): 같은 요청을 기다리던 호출 하나가 취소되어도
+  공유 호출과 나머지 호출은 정상적으로 결과를 받아야 합니다.
+- 전역 스케줄러 재설정(configure): 이전 스케줄러는 대기 중인 요청을 마저 실행한 뒤 스레드를 정리해야 합니다.
+"""
+import asyncio
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import asingle_flight
+
+
+async def _cancel_one(key, victim_index):
+    """같은 키로 세 호출을 합친 뒤 victim_index번째 호출(0이면 처음 호출한 쪽)을 취소"""
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    tasks = []
+    for _ in range(3):
+        tasks.append(asyncio.ensure_future(asingle_flight(key, call)))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+    victim = tasks.pop(victim_index)
+    victim.cancel()
+    results = await asyncio.gather(*tasks)
+    with pytest.raises(asyncio.CancelledError):
+        await victim
+    return results, len(calls)
+
+
+def test_follower_cancel_does_not_fail_others():
+    results, calls = asyncio.run(_cancel_one("follower-cancel", 1))
+    assert results == ["ok", "ok"]
+    assert calls == 1
+
+
+def test_leader_cancel_does_not_fail_followers():
+    results, calls = asyncio.run(_cancel_one("leader-cancel", 0))
+    assert results == ["ok", "ok"]
+    assert calls == 1
+
+
+def test_configure_closes_previous_scheduler():
+    previous = llm_scheduler.get_scheduler()
+    ticket = previous.submit(lambda: "done")
+    llm_scheduler.configure(max_concurrency=2)
+
+    assert ticket.future.result(timeout=5) == "done"
+    previous._dispatcher.join(timeout=5)
+    assert not previous._dispatcher.is_alive()
+    with pytest.raises(RuntimeError):
+        previous.submit(lambda: None)
@@ -0,0 +1,61 @@
+"""
+plan_model 테스트
+
+- dict 계획서를 Plan으로 바꾸었다가 to_dict로 되돌리면 원래 dict와 같아야 합니다 (정의되지 않은 키 포함).
+- 하위 항목은 레코드로 변환되고 dict와 같은 방식으로 읽고 쓸 수 있어야 합니다.
+"""
+import copy
+import json
+
+from plan_model import LessonPlan, Plan, Standard, as_plan, json_default
+
+PLAN = {
+    "activity_name": "코딩 활동",
+    "total_hours": 2,
+    "goals": ["지식 목표"],
+    "standards": [
+        {"code": "X1", "description": "설명", "levels": [{"level": "A", "description": "잘함"}], "note": "추가"}
+    ],
+    "teaching_methods": [{"method": "프로젝트", "description": "모둠 활동"}],
+    "assessment_plan": [{"focus": "협력", "description": "관찰"}],
+    "lesson_plans": [
+        {"lesson_number": "1", "topic": "주제 1", "content": "내용", "materials": "준비물"},
+        {"lesson_number": "2", "topic": "주제 2", "content": "내용"},
+    ],
+    "_step_inputs": {"1": "hash"},
+    "custom_field": {"kept": True},
+}
+
+
+def test_round_trip_keeps_all_fields():
+    plan = as_plan(copy.deepcopy(PLAN))
+
+    assert plan.to_dict() == PLAN
+    assert json.loads(json.dumps(plan, default=json_default)) == PLAN
+
+
+def test_nested_items_become_records():
+    plan = as_plan(copy.deepcopy(PLAN))
+
+    assert isinstance(plan, Plan)
+    assert isinstance(plan["standards"][0], Standard)
+    assert isinstance(plan["lesson_plans"][1], LessonPlan)
+    assert plan["standards"][0]["note"] == "추가"
+    assert "materials" not in plan["lesson_plans"][1]
+
+
+def test_as_plan_converts_dicts_added_later():
+    plan = as_plan(copy.deepcopy(PLAN))
+    plan["lesson_plans"].append({"lesson_number": "3", "topic": "주제 3", "content": "내용"})
+
+    assert as_plan(plan) is plan
+    assert isinstance(plan["lesson_plans"][2], LessonPlan)
+    assert plan.to_dict()["lesson_plans"][2] == {"lesson_number": "3", "topic": "주제 3", "content": "내용"}
+
+
+def test_none_values_are_missing_keys():
+    plan = as_plan({"activity_name": "활동", "domain": None})
+
+    assert "domain" not in plan
+    assert plan.get("domain", "없음") == "없음"
+    assert plan.to_dict() == {"activity_name": "활동"}
@@ -0,0 +1,271 @@
+"""
+호출 비용·지연시간 추정 및 예산 모듈
+
+생성 버튼을 누르기 전에 보낼 호출의 프롬프트 토큰과 예상 출력 토큰, 비용, 걸릴 시간을 추정하고,
+실제 호출의 토큰 수와 응답 시간을 기록해 다음 추정에 사용합니다.
+- 토큰 수: OpenAI 토크나이저(tiktoken)로 로컬에서 계산 (토크나이저를 쓸 수 없으면 글자 수로 근사)
+- 예상 출력 토큰: 작업별 최근 호출의 단위(차시 등)당 평균. 기록이 없으면 최대 토큰의 일정 비율
+- 예상 시간: 모델별 최근 호출의 (출력 토큰 수 → 응답 시간) 선형 회귀. 기록이 적으면 기본값
+- 예산: 세션별, 일별 비용 상한 (0이면 제한 없음). 넘으면 호출 전에 BudgetExceededError
+Streamlit에 의존하지 않으므로 일괄 처리 스크립트에서도 사용할 수 있습니다.
+"""
+import os
+import json
+import time
+import datetime
+import functools
+
+from plan_storage import get_connection
+
+###############################################################################
+# 0. 설정
+###############################################################################
+# 모델별 100만 토큰당 가격 (USD, 입력/출력). SEOHS_MODEL_PRICES에 JSON으로 덮어쓸 수 있음
+MODEL_PRICES = {
+    "gpt-4o": [2.50, 10.00],
+    "gpt-4o-mini": [0.15, 0.60]
+}
+MODEL_PRICES.update(json.loads(os.environ.get("SEOHS_MODEL_PRICES", "{}")))
+
+# 기록이 부족할 때 쓰는 모델별 지연시간 (첫 토큰까지 초, 출력 토큰당 초)
+DEFAULT_LATENCY = {
+    "gpt-4o": (0.8, 0.02),
+    "gpt-4o-mini": (0.5, 0.012)
+}
+DEFAULT_COMPLETION_RATIO = 0.5   # 기록이 없을 때 최대 토큰 대비 예상 출력 비율
+MESSAGE_OVERHEAD_TOKENS = 4      # 메시지마다 붙는 역할/구분 토큰
+HISTORY_SIZE = 200               # 추정에 사용할 최근 호출 수
+MIN_HISTORY_FOR_FIT = 5
+
+SESSION_BUDGET_USD = float(os.environ.get("SEOHS_SESSION_BUDGET_USD", "0"))
+DAILY_BUDGET_USD = float(os.environ.get("SEOHS_DAILY_BUDGET_USD", "0"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    created_at REAL NOT NULL,
+    session_id TEXT,
+    task TEXT,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    units INTEGER NOT NULL DEFAULT 1,
+    seconds REAL NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_calls_created_at ON llm_calls (created_at);
+CREATE INDEX IF NOT EXISTS llm_calls_session ON llm_calls (session_id);
+"""
+
+
+class BudgetExceededError(RuntimeError):
+    """세션 또는 일별 예산을 넘는 호출"""
+
+###############################################################################
+# 1. 토큰 수와 비용
+###############################################################################
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # 토크나이저 파일을 받을 수 없는 환경 등
+        return None
+
+
+def count_tokens(text, model="gpt-4o"):
+    """문자열의 토큰 수 (토크나이저를 쓸 수 없으면 한국어 기준 글자 수의 절반으로 근사)"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 2
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(messages, model="gpt-4o"):
+    """채팅 메시지 리스트의 프롬프트 토큰 수"""
+    return sum(count_tokens(message.content, model) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    """호출 한 번의 비용 (USD). 가격을 모르는 모델은 0"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+###############################################################################
+# 2. 호출 기록
+###############################################################################
+_schema_ready = set()
+
+
+def _connection(db_path=None):
+    """계획서 저장소와 같은 SQLite 파일에 호출 기록 테이블을 두고 연결을 반환"""
+    connection = get_connection(db_path)
+    if db_path not in _schema_ready:
+        connection.executescript(SCHEMA)
+        _schema_ready.add(db_path)
+    return connection
+
+
+def record_call(session_id, task, model, prompt_tokens, completion_tokens, seconds, units=1, db_path=None):
+    """실제 호출의 토큰 수와 응답 시간을 기록"""
+    connection = _connection(db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO llm_calls (created_at, session_id, task, model, prompt_tokens, completion_tokens, "
+            "units, seconds, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), session_id, task, model, int(prompt_tokens), int(completion_tokens), max(1, int(units)),
+             float(seconds), call_cost(model, prompt_tokens, completion_tokens))
+        )
+
+
+def record_response(session_id, task, model, messages, response, seconds, units=1, db_path=None):
+    """
+    응답 메타데이터의 토큰 사용량(없으면 토크나이저로 계산)으로 호출을 기록합니다.
+    기록 실패가 생성을 막지 않도록 오류는 무시합니다.
+    """
+    try:
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or message_tokens(messages, model)
+        completion_tokens = usage.get("completion_tokens") or count_tokens(response.content, model)
+        record_call(session_id, task, model, prompt_tokens, completion_tokens, seconds, units, db_path)
+    except Exception:
+        pass
+
+###############################################################################
+# 3. 추정
+###############################################################################
+def expected_completion_tokens(task, max_tokens, units=1, db_path=None):
+    """작업의 최근 호출에서 단위당 평균 출력 토큰으로 예상 출력 토큰 수 (최대 토큰 이하)"""
+    row = _connection(db_path).execute(
+        "SELECT AVG(completion_tokens * 1.0 / units), COUNT(*) FROM "
+        "(SELECT completion_tokens, units FROM llm_calls WHERE task = ? ORDER BY created_at DESC LIMIT ?)",
+        (task, HISTORY_SIZE)
+    ).fetchone()
+    if row[1]:
+        return min(max_tokens, int(row[0] * units))
+    return int(max_tokens * DEFAULT_COMPLETION_RATIO)
+
+
+def latency_model(model, db_path=None):
+    """
+    모델의 (첫 토큰까지 초, 출력 토큰당 초).
+    최근 호출에 최소제곱 직선을 맞추고, 기록이 적거나 기울기가 0 이하이면 기본값을 사용합니다.
+    """
+    rows = _connection(db_path).execute(
+        "SELECT completion_tokens, seconds FROM llm_calls WHERE model = ? ORDER BY created_at DESC LIMIT ?",
+        (model, HISTORY_SIZE)
+    ).fetchall()
+    default = DEFAULT_LATENCY.get(model, DEFAULT_LATENCY["gpt-4o"])
+    if len(rows) < MIN_HISTORY_FOR_FIT:
+        return default
+
+    mean_x = sum(x for x, _ in rows) / len(rows)
+    mean_y = sum(y for _, y in rows) / len(rows)
+    variance = sum((x - mean_x) ** 2 for x, _ in rows)
+    if not variance:
+        return default
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in rows) / variance
+    if slope <= 0:
+        return default
+    return max(0.0, mean_y - slope * mean_x), slope
+
+
+def estimate_call(task, model, messages, max_tokens, units=1, extra_prompt_tokens=0, db_path=None):
+    """
+    보낼 호출 하나의 추정치.
+
+    Args:
+        task (str): 작업 이름 (예: "step_2", "lesson_chunk")
+        units (int, optional): 출력 분량의 단위 수 (차시 묶음이면 차시 수)
+        extra_prompt_tokens (int, optional): 아직 정해지지 않은 프롬프트 부분(검색 문맥 등)의 예상 토큰
+
+    Returns:
+        dict: {"calls", "prompt_tokens", "completion_tokens", "cost", "seconds"}
+    """
+    prompt_tokens = message_tokens(messages, model) + extra_prompt_tokens
+    completion_tokens = expected_completion_tokens(task, max_tokens, units, db_path)
+    first_token, per_token = latency_model(model, db_path)
+    return {
+        "calls": 1,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": call_cost(model, prompt_tokens, completion_tokens),
+        "seconds": first_token + per_token * completion_tokens
+    }
+
+
+def combine_estimates(stages, pause_seconds=0.0):
+    """
+    순서대로 실행하는 단계들의 추정치를 합칩니다. 한 단계 안의 호출은 동시에 실행되므로
+    시간은 단계별 가장 긴 호출의 합(+ 단계 사이 대기)이고, 호출 수와 토큰, 비용은 모두 더합니다.
+
+    Args:
+        stages (list): [[estimate_call 결과, ...], ...]
+        pause_seconds (float, optional): 단계 사이에 기다리는 초
+    """
+    total = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "seconds": 0.0}
+    for stage in stages:
+        for estimate in stage:
+            for key in ("calls", "prompt_tokens", "completion_tokens", "cost"):
+                total[key] += estimate[key]
+        total["seconds"] += max((estimate["seconds"] for estimate in stage), default=0.0)
+    total["seconds"] += pause_seconds * max(0, len(stages) - 1)
+    return total
+
+###############################################################################
+# 4. 예산
+###############################################################################
+def _today_start():
+    return time.mktime(datetime.date.today().timetuple())
+
+
+def spent(session_id=None, db_path=None):
+    """세션과 오늘(로컬 자정 이후)의 사용 비용 (USD)"""
+    connection = _connection(db_path)
+    today = connection.execute(
+        "SELECT COALESCE(SUM(cost), 0) FROM llm_calls WHERE created_at >= ?", (_today_start(),)
+    ).fetchone()[0]
+    session = connection.execute(
+        "SELECT COALESCE(SUM(cost), 0) FROM llm_calls WHERE session_id = ?", (session_id,)
+    ).fetchone()[0] if session_id else 0.0
+    return {"session": session, "today": today}
+
+
+def budget_problem(session_id, estimated_cost, db_path=None):
+    """추정 비용을 더하면 예산을 넘을 때 그 이유, 넘지 않으면 None"""
+    if not SESSION_BUDGET_USD and not DAILY_BUDGET_USD:
+        return None
+    used = spent(session_id, db_path)
+    if SESSION_BUDGET_USD and used["session"] + estimated_cost > SESSION_BUDGET_USD:
+        return f"세션 예산(${SESSION_BUDGET_USD:.2f}) 초과: 사용 ${used['session']:.3f} + 예상 ${estimated_cost:.3f}"
+    if DAILY_BUDGET_USD and used["today"] + estimated_cost > DAILY_BUDGET_USD:
+        return f"일일 예산(${DAILY_BUDGET_USD:.2f}) 초과: 오늘 사용 ${used['today']:.3f} + 예상 ${estimated_cost:.3f}"
+    return None
+
+
+def check_budget(session_id, estimated_cost, db_path=None):
+    """예산을 넘는 호출이면 BudgetExceededError"""
+    problem = budget_problem(session_id, estimated_cost, db_path)
+    if problem:
+        raise BudgetExceededError(problem)
+
+
+def usage_report(session_id=None, db_path=None):
+    """오늘의 호출 수, 토큰, 비용과 세션 사용 비용, 예산"""
+    row = _connection(db_path).execute(
+        "SELECT COUNT(*), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0) "
+        "FROM llm_calls WHERE created_at >= ?", (_today_start(),)
+    ).fetchone()
+    used = spent(session_id, db_path)
+    return {
+        "calls_today": row[0],
+        "prompt_tokens_today": row[1],
+        "completion_tokens_today": row[2],
+        "cost_today": used["today"],
+        "cost_session": used["session"],
+        "session_budget": SESSION_BUDGET_USD,
+        "daily_budget": DAILY_BUDGET_USD
+    }
@@ -0,0 +1,645 @@
+"""
+벡터 인덱스 구성 모듈
+
+문서 규모에 따라 FAISS 인덱스 종류(Flat, IVF, HNSW, IVF-PQ)를 선택해 구축하고,
+디스크에 저장한 인덱스를 메모리 매핑으로 불러오며, 재현율-지연시간 보고서를 만듭니다.
+저장된 인덱스와 문서 저장소는 읽기 전용으로 매핑되므로 여러 워커 프로세스가 한 벌을 공유합니다.
+Streamlit에 의존하지 않으므로 일괄 처리 스크립트에서도 그대로 사용할 수 있습니다.
+"""
+import os
+import json
+import mmap
+import time
+import shutil
+import hashlib
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from chunk_dedup import DedupState, deduplicate_documents
+
+###############################################################################
+# 0. 인덱스 설정
+###############################################################################
+# 저장 위치와 인덱스 종류는 환경 변수로 바꿀 수 있습니다.
+INDEX_DIR = os.environ.get("SEOHS_INDEX_DIR", "./vector_index/")
+INDEX_TYPE = os.environ.get("SEOHS_INDEX_TYPE", "auto")  # auto, flat, ivf, hnsw, ivfpq
+
+# 저장 형식: INDEX_DIR/<버전>/ 아래에 인덱스와 메모리 매핑용 문서 저장소를 두고,
+# CURRENT 파일이 현재 버전 디렉터리 이름을 가리킵니다.
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docstore.bin"
+OFFSETS_FILE = "docstore_offsets.npy"
+META_FILE = "index_meta.json"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".build.lock"
+KEEP_VERSIONS = 3              # 교체 후에도 남겨 둘 최근 버전 수 (현재 버전 포함)
+VERSION_GRACE_SECONDS = 3600   # 이보다 오래된 이전 버전만 삭제 (아직 읽는 워커를 위한 유예 시간)
+
+# 문서 규모별 자동 선택 기준 (청크 수)
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 200_000
+
+EMBED_BATCH_SIZE = 1000      # 한 번에 임베딩해 인덱스에 추가할 청크 수
+TRAIN_SAMPLE_MIN = 10_000    # IVF 계열 학습 표본 크기 하한과 상한 (코퍼스 크기와 무관하게 메모리 사용을 제한)
+TRAIN_SAMPLE_MAX = 100_000
+REPORT_QUERIES = 100         # 재현율 측정에 사용할 질의 수
+REPORT_K = 4                 # 검색 결과 개수 (retriever 기본값과 동일)
+TARGET_RECALL = 0.95         # 기본 검색 파라미터를 고를 때의 목표 재현율
+
+# 인덱스 종류별로 재현율-지연시간을 비교할 검색 파라미터
+SEARCH_PARAM_SWEEP = {
+    "ivf": ("nprobe", [1, 4, 8, 16, 32, 64]),
+    "ivfpq": ("nprobe", [1, 4, 8, 16, 32, 64]),
+    "hnsw": ("efSearch", [16, 32, 64, 128, 256]),
+}
+
+###############################################################################
+# 1. 인덱스 종류 선택 및 생성
+###############################################################################
+def choose_index_type(n_vectors, index_type=None):
+    """설정값과 청크 수를 바탕으로 사용할 인덱스 종류를 결정합니다."""
+    index_type = (index_type or INDEX_TYPE).lower()
+    if index_type != "auto":
+        return index_type
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _ivf_nlist(n_vectors):
+    """IVF 클러스터 수 (대략 4·√N, 학습 데이터가 부족하지 않도록 제한)"""
+    nlist = int(4 * np.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39 or 1))
+
+
+def _pq_subquantizers(dim):
+    """차원을 나누어 떨어지게 하는 PQ 서브 양자화기 수 (최대 96개)"""
+    for m in (96, 64, 48, 32, 24, 16, 8, 4, 2, 1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def create_index(index_type, dim, n_vectors):
+    """학습 전의 빈 FAISS 인덱스를 생성합니다."""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+        return index
+    if index_type in ("ivf", "ivfpq"):
+        nlist = _ivf_nlist(n_vectors)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8)
+        index.nprobe = min(16, nlist)
+        return index
+    raise ValueError(f"지원하지 않는 인덱스 종류입니다: {index_type}")
+
+
+def train_sample_size(index_type, n_vectors):
+    """학습이 필요한 인덱스에서 학습에 사용할 표본 크기"""
+    if index_type not in ("ivf", "ivfpq"):
+        return 0
+    nlist = _ivf_nlist(n_vectors)
+    # 클러스터당 약 64개를 목표로 하되, 첫 배치에 코퍼스 전체를 임베딩하지 않도록 상한을 둠
+    # (하한은 PQ 코드북 학습분 확보용)
+    return min(n_vectors, int(np.clip(64 * nlist, TRAIN_SAMPLE_MIN, TRAIN_SAMPLE_MAX)))
+
+
+def set_search_param(index, name, value):
+    """nprobe, efSearch 등 검색 파라미터를 설정합니다."""
+    faiss.ParameterSpace().set_index_parameter(index, name, value)
+
+###############################################################################
+# 2. 정확도 기준값 누적 (배치 단위 브루트포스)
+###############################################################################
+class _ExactTopK:
+    """전체 벡터를 메모리에 두지 않고 질의별 정확한 top-k를 배치 단위로 누적합니다."""
+
+    def __init__(self, queries, k):
+        self.queries = queries
+        self.k = k
+        self.distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        self.labels = np.full((len(queries), k), -1, dtype=np.int64)
+
+    def add(self, vectors, offset):
+        """offset부터 시작하는 벡터 배치를 기준값에 반영합니다."""
+        if len(self.queries) == 0 or len(vectors) == 0:
+            return
+        k = min(self.k, len(vectors))
+        distances, labels = faiss.knn(self.queries, vectors, k)
+        labels = labels + offset
+        merged_d = np.hstack([self.distances, distances])
+        merged_l = np.hstack([self.labels, labels])
+        order = np.argsort(merged_d, axis=1)[:, :self.k]
+        self.distances = np.take_along_axis(merged_d, order, axis=1)
+        self.labels = np.take_along_axis(merged_l, order, axis=1)
+
+###############################################################################
+# 3. 벡터 스토어 구축
+###############################################################################
+def build_vector_store(docs, embeddings, index_type=None, batch_size=EMBED_BATCH_SIZE, seed=42):
+    """
+    문서를 배치 단위로 임베딩하여 규모에 맞는 FAISS 인덱스를 구축합니다.
+
+    학습이 필요한 인덱스(IVF 계열)는 무작위 표본으로 먼저 학습한 뒤 나머지를 추가하며,
+    임베딩 행렬 전체를 메모리에 올리지 않습니다.
+
+    Args:
+        docs (list): LangChain Document 리스트
+        embeddings: LangChain 임베딩 객체
+        index_type (str, optional): 인덱스 종류. 기본값은 INDEX_TYPE 설정
+        batch_size (int, optional): 임베딩 배치 크기
+        seed (int, optional): 표본 추출용 난수 시드
+
+    Returns:
+        tuple: (FAISS 벡터 스토어, 재현율-지연시간 보고서 dict)
+    """
+    if not docs:
+        raise ValueError("색인할 문서가 없습니다.")
+    n_docs = len(docs)
+    index_type = choose_index_type(n_docs, index_type)
+
+    # 학습 표본이 코퍼스 전체를 대표하도록 추가 순서를 섞음
+    order = np.random.default_rng(seed).permutation(n_docs)
+    first_size = max(batch_size, train_sample_size(index_type, n_docs))
+
+    index = None
+    exact = None
+    index_to_docstore_id = {}
+    docstore = InMemoryDocstore({})
+
+    start = 0
+    while start < n_docs:
+        size = first_size if start == 0 else batch_size
+        positions = order[start:start + size]
+        batch_docs = [docs[p] for p in positions]
+        vectors = np.asarray(
+            embeddings.embed_documents([doc.page_content for doc in batch_docs]),
+            dtype=np.float32
+        )
+
+        if index is None:
+            index = create_index(index_type, vectors.shape[1], n_docs)
+            if not index.is_trained:
+                index.train(vectors)
+            # 질의로 쓰는 벡터도 인덱스에 들어가므로 자기 자신을 뺄 수 있도록 한 개 더 구함
+            exact = _ExactTopK(vectors[:REPORT_QUERIES].copy(), REPORT_K + 1)
+
+        index.add(vectors)
+        exact.add(vectors, start)
+
+        for offset, position in enumerate(positions):
+            doc_id = str(position)
+            index_to_docstore_id[start + offset] = doc_id
+            docstore.add({doc_id: batch_docs[offset]})
+
+        start += size
+
+    vector_store = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    report = evaluate_index(index, index_type, exact)
+    return vector_store, report
+
+###############################################################################
+# 4. 재현율-지연시간 보고서
+###############################################################################
+def _neighbors(labels, self_label, k):
+    """검색 결과에서 질의 자신을 뺀 앞쪽 k개"""
+    return [label for label in labels if label >= 0 and label != self_label][:k]
+
+
+def evaluate_index(index, index_type, exact):
+    """
+    검색 파라미터별 재현율@k와 질의당 지연시간을 측정하고,
+    목표 재현율을 만족하는 가장 빠른 설정을 인덱스에 적용합니다.
+    질의 벡터(인덱스 위치 0부터)도 인덱스에 들어 있으므로, 자기 자신이 항상 맞는 결과로
+    재현율이 부풀려지지 않도록 정답과 검색 결과 모두에서 질의 자신을 빼고 나머지 이웃만 비교합니다.
+    """
+    report = {
+        "index_type": index_type,
+        "n_vectors": int(index.ntotal),
+        "k": REPORT_K,
+        "target_recall": TARGET_RECALL,
+        "rows": [],
+        "selected": None,
+    }
+    if exact is None or len(exact.queries) == 0:
+        return report
+
+    param_name, values = SEARCH_PARAM_SWEEP.get(index_type, (None, [None]))
+    if index_type in ("ivf", "ivfpq"):
+        values = [v for v in values if v <= index.nlist] or [index.nlist]
+
+    for value in values:
+        if param_name:
+            set_search_param(index, param_name, value)
+        started = time.perf_counter()
+        _, labels = index.search(exact.queries, exact.k)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(exact.queries)
+
+        hits = 0
+        total = 0
+        for query, (found, truth) in enumerate(zip(labels, exact.labels)):
+            truth = _neighbors(truth, query, REPORT_K)
+            hits += len(set(_neighbors(found, query, REPORT_K)) & set(truth))
+            total += len(truth)
+        total = total or 1
+        report["rows"].append({
+            "param": param_name or "-",
+            "value": value if value is not None else "-",
+            "recall": round(hits / total, 4),
+            "latency_ms": round(elapsed_ms, 4),
+        })
+
+    # 목표 재현율을 만족하는 첫 설정 (없으면 가장 재현율이 높은 설정)
+    rows = report["rows"]
+    selected = next((row for row in rows if row["recall"] >= TARGET_RECALL), None)
+    if selected is None:
+        selected = max(rows, key=lambda row: row["recall"])
+    if param_name:
+        set_search_param(index, param_name, selected["value"])
+    report["selected"] = selected
+    return report
+
+###############################################################################
+# 5. 메모리 매핑 문서 저장소
+###############################################################################
+class MmapDocstore(Docstore):
+    """
+    docstore.bin을 메모리 매핑해 검색된 문서만 그때그때 디코딩하는 읽기 전용 문서 저장소.
+    여러 워커 프로세스가 같은 파일을 열면 운영체제 페이지 캐시 한 벌을 함께 사용합니다.
+    문서 ID는 인덱스 위치를 문자열로 바꾼 값입니다.
+    """
+
+    def __init__(self, directory):
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, DOCS_FILE), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def search(self, search):
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._data[start:end].decode("utf-8"))
+        return Document(page_content=record["page_content"], metadata=record.get("metadata", {}))
+
+    def delete(self, ids):
+        raise NotImplementedError("읽기 전용 문서 저장소입니다.")
+
+
+class _PositionIds(Mapping):
+    """인덱스 위치 → 문서 ID 대응표. 위치를 그대로 ID로 쓰므로 별도 dict를 만들지 않습니다."""
+
+    def __init__(self, size):
+        self._size = size
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)) and 0 <= key < self._size:
+            return str(int(key))
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def __len__(self):
+        return self._size
+
+
+def _encode_document(doc):
+    return json.dumps(
+        {"page_content": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False,
+        default=str
+    ).encode("utf-8")
+
+
+def write_docstore(vector_store, directory):
+    """인덱스 위치 순서대로 문서를 docstore.bin과 오프셋 배열로 기록합니다."""
+    n_vectors = vector_store.index.ntotal
+    offsets = np.zeros(n_vectors + 1, dtype=np.int64)
+
+    with open(os.path.join(directory, DOCS_FILE), "wb") as f:
+        for position in range(n_vectors):
+            record = _encode_document(vector_store.docstore.search(vector_store.index_to_docstore_id[position]))
+            f.write(record)
+            offsets[position + 1] = offsets[position] + len(record)
+
+    np.save(os.path.join(directory, OFFSETS_FILE), offsets)
+
+
+def append_docstore(source_dir, directory, docs):
+    """
+    source_dir의 문서 저장소 파일을 그대로 복사하고 docs를 이어서 기록합니다.
+    기존 문서는 디코딩하지 않으므로 메모리 사용은 오프셋 배열과 새 문서 크기에 비례합니다.
+    """
+    shutil.copyfile(os.path.join(source_dir, DOCS_FILE), os.path.join(directory, DOCS_FILE))
+    old_offsets = np.load(os.path.join(source_dir, OFFSETS_FILE), mmap_mode="r")
+    offsets = np.empty(len(old_offsets) + len(docs), dtype=np.int64)
+    offsets[:len(old_offsets)] = old_offsets
+
+    with open(os.path.join(directory, DOCS_FILE), "ab") as f:
+        for position, doc in enumerate(docs, start=len(old_offsets)):
+            record = _encode_document(doc)
+            f.write(record)
+            offsets[position] = offsets[position - 1] + len(record)
+
+    np.save(os.path.join(directory, OFFSETS_FILE), offsets)
+
+###############################################################################
+# 6. 저장 및 공유 로드
+###############################################################################
+def documents_fingerprint(file_paths):
+    """문서 파일 목록, 크기, 수정 시각으로 인덱스 재사용 여부를 판단할 지문을 만듭니다."""
+    digest = hashlib.sha256()
+    for path in sorted(file_paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def current_version_dir(index_dir=INDEX_DIR):
+    """CURRENT 포인터가 가리키는 인덱스 버전 디렉터리. 없으면 None"""
+    current_path = os.path.join(index_dir, CURRENT_FILE)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path, encoding="utf-8") as f:
+        version_dir = os.path.join(index_dir, f.read().strip())
+    return version_dir if os.path.isdir(version_dir) else None
+
+
+def _new_version_dir(fingerprint, index_dir):
+    version_dir = os.path.join(index_dir, f"{fingerprint[:16]}-{time.time_ns()}")
+    os.makedirs(version_dir, exist_ok=True)
+    return version_dir
+
+
+def _publish_version(version_dir, fingerprint, report, index_dir):
+    """메타데이터를 기록하고 CURRENT 포인터를 version_dir로 원자적으로 교체합니다."""
+    with open(os.path.join(version_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "report": report}, f, ensure_ascii=False, indent=2)
+
+    version = os.path.basename(version_dir)
+    temp_path = os.path.join(index_dir, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(temp_path, os.path.join(index_dir, CURRENT_FILE))
+
+    _remove_stale_versions(index_dir, keep=version)
+    return version_dir
+
+
+def save_vector_store(vector_store, report, fingerprint, index_dir=INDEX_DIR, dedup_state=None):
+    """
+    인덱스, 문서 저장소, 메타데이터(와 중복 판단 상태)를 새 버전 디렉터리에 기록한 뒤
+    CURRENT 포인터를 원자적으로 교체합니다. 다른 워커가 읽는 중인 이전 버전은 건드리지 않습니다.
+
+    Returns:
+        str: 저장된 버전 디렉터리 경로
+    """
+    version_dir = _new_version_dir(fingerprint, index_dir)
+    faiss.write_index(vector_store.index, os.path.join(version_dir, INDEX_FILE))
+    write_docstore(vector_store, version_dir)
+    if dedup_state is not None:
+        dedup_state.save(version_dir)
+    return _publish_version(version_dir, fingerprint, report, index_dir)
+
+
+def _remove_stale_versions(index_dir, keep):
+    """
+    이전 버전 디렉터리를 정리합니다.
+    CURRENT를 교체하기 직전에 이전 버전을 연 워커가 있을 수 있으므로, 최근 KEEP_VERSIONS개는 남기고
+    그보다 오래된 버전도 VERSION_GRACE_SECONDS가 지난 것만 삭제합니다.
+    """
+    versions = []
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name != keep and os.path.isdir(path):
+            versions.append((os.path.getmtime(path), path))
+
+    deadline = time.time() - VERSION_GRACE_SECONDS
+    versions.sort(reverse=True)
+    for mtime, path in versions[KEEP_VERSIONS - 1:]:
+        if mtime < deadline:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def current_index_version(index_dir=INDEX_DIR):
+    """현재 인덱스 버전 이름 (CURRENT 포인터 내용). 인덱스가 없으면 None"""
+    version_dir = current_version_dir(index_dir)
+    return os.path.basename(version_dir) if version_dir else None
+
+
+def load_index_meta(index_dir=INDEX_DIR, version_dir=None):
+    """
+    인덱스 메타데이터를 읽습니다. version_dir을 주면 그 버전에서, 아니면 현재 버전에서 읽습니다.
+    없으면 None
+    """
+    if version_dir is None:
+        version_dir = current_version_dir(index_dir)
+    if version_dir is None:
+        return None
+    meta_path = os.path.join(version_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_index_mmap(path):
+    """
+    인덱스를 메모리 매핑(읽기 전용)으로 읽고, 지원하지 않는 형식이면 일반 로드합니다.
+    IVF 계열의 역색인 목록과 (faiss 1.9 이상에서) Flat 코드는 매핑되며, HNSW 그래프는 메모리에 올라갑니다.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def load_vector_store(embeddings, fingerprint=None, index_dir=INDEX_DIR):
+    """
+    저장된 벡터 스토어를 읽기 전용으로 엽니다.
+    fingerprint가 주어졌는데 저장 당시와 다르면 None을 반환해 재구축하도록 합니다.
+
+    Returns:
+        tuple: (FAISS 벡터 스토어 또는 None, 재현율-지연시간 보고서 dict 또는 None)
+    """
+    # CURRENT는 한 번만 읽고, 메타데이터와 인덱스를 같은 버전 디렉터리에서 읽음
+    version_dir = current_version_dir(index_dir)
+    meta = load_index_meta(index_dir, version_dir) if version_dir else None
+    if meta is None or (fingerprint and meta.get("fingerprint") != fingerprint):
+        return None, None
+
+    index = read_index_mmap(os.path.join(version_dir, INDEX_FILE))
+    docstore = MmapDocstore(version_dir)
+
+    report = meta.get("report") or {}
+    selected = report.get("selected")
+    if selected and selected.get("param") not in (None, "-"):
+        set_search_param(index, selected["param"], selected["value"])
+
+    return FAISS(embeddings, index, docstore, _PositionIds(index.ntotal)), report
+
+
+@contextmanager
+def _build_lock(index_dir):
+    """인덱스 구축을 한 프로세스만 하도록 잡는 파일 잠금 (fcntl이 없는 환경에서는 잠금 없음)"""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE), "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def open_shared_vector_store(embeddings, file_paths, load_documents, index_dir=INDEX_DIR):
+    """
+    여러 워커 프로세스가 디스크의 인덱스 한 벌을 공유하도록 벡터 스토어를 엽니다.
+
+    같은 문서로 만든 인덱스가 있으면 바로 읽기 전용으로 열고, 없으면 파일 잠금을 잡은
+    프로세스 하나만 임베딩·저장합니다. 나머지 워커는 잠금이 풀린 뒤 저장된 결과를 엽니다.
+    구축한 프로세스도 메모리의 사본을 버리고 디스크에서 다시 열어 같은 페이지 캐시를 씁니다.
+
+    Args:
+        embeddings: LangChain 임베딩 객체
+        file_paths (list): 색인할 문서 파일 경로
+        load_documents (callable): 파일 경로 리스트를 받아 Document 리스트를 돌려주는 함수
+        index_dir (str, optional): 인덱스 저장 위치
+
+    Returns:
+        tuple: (FAISS 벡터 스토어 또는 None, 이번 호출에서 새로 구축했는지 여부)
+    """
+    fingerprint = documents_fingerprint(file_paths)
+    vector_store, _ = load_vector_store(embeddings, fingerprint, index_dir)
+    if vector_store:
+        return vector_store, False
+
+    with _build_lock(index_dir):
+        # 잠금을 기다리는 동안 다른 워커가 이미 구축했을 수 있음
+        vector_store, _ = load_vector_store(embeddings, fingerprint, index_dir)
+        if vector_store:
+            return vector_store, False
+
+        docs = load_documents(file_paths)
+        # 반복되는 문단은 임베딩하기 전에 제거 (판단 상태는 문서를 추가할 때 쓰도록 함께 저장)
+        dedup_state = DedupState()
+        docs, dedup_report = deduplicate_documents(docs, state=dedup_state)
+        if not docs:
+            return None, False
+
+        built_store, report = build_vector_store(docs, embeddings)
+        report["dedup"] = dedup_report
+        save_vector_store(built_store, report, fingerprint, index_dir, dedup_state)
+        del built_store
+
+    vector_store, _ = load_vector_store(embeddings, fingerprint, index_dir)
+    return vector_store, True
+
+###############################################################################
+# 7. 문서 추가 (증분 색인)
+###############################################################################
+def add_documents(docs, embeddings, fingerprint, index_dir=INDEX_DIR, batch_size=EMBED_BATCH_SIZE,
+                  before_swap=None):
+    """
+    현재 인덱스에 새 문서만 임베딩해 추가한 새 버전을 저장하고 CURRENT를 교체합니다.
+    기존 문서는 다시 임베딩하지 않으며, 인덱스가 없으면 새로 구축합니다.
+    새 문서끼리 또는 기존 문서와 중복되는 청크는 추가하지 않습니다.
+    기존 문서는 메모리에 읽어 들이지 않습니다. 문서 저장소 파일은 복사한 뒤 새 문서만 이어서 기록하고,
+    중복 판단은 버전과 함께 저장한 상태(DedupState)를 메모리 매핑으로 열어 사용합니다.
+    구축 잠금을 잡고 실행하므로 다른 프로세스의 구축·추가와 겹치지 않습니다.
+
+    Args:
+        docs (list): 추가할 Document 리스트
+        embeddings: LangChain 임베딩 객체
+        fingerprint (str): 추가 후 문서 폴더 전체의 지문
+        before_swap (callable, optional): 새 버전 교체 직전에 호출 (예: 문서 파일을 documents 폴더로 이동)
+
+    Returns:
+        tuple: (저장된 버전 디렉터리, 추가된 청크 수). 인덱스가 없는데 모두 중복이면 (None, 0)
+    """
+    with _build_lock(index_dir):
+        version_dir = current_version_dir(index_dir)
+        if version_dir is None:
+            dedup_state = DedupState()
+            docs, dedup_report = deduplicate_documents(docs, state=dedup_state)
+            if not docs:
+                # 모두 중복이면 만들 인덱스가 없음
+                if before_swap:
+                    before_swap()
+                return None, 0
+            vector_store, report = build_vector_store(docs, embeddings, batch_size=batch_size)
+            report["dedup"] = dedup_report
+            if before_swap:
+                before_swap()
+            return save_vector_store(vector_store, report, fingerprint, index_dir, dedup_state), len(docs)
+
+        # 저장된 중복 판단 상태로 새 청크만 검사 (상태가 없는 이전 형식이면 기존 문서를 한 번 읽어 만듦)
+        dedup_state = DedupState.load(version_dir)
+        if dedup_state is None:
+            dedup_state = DedupState()
+            old_docstore = MmapDocstore(version_dir)
+            existing = (old_docstore.search(str(position)) for position in range(len(old_docstore)))
+            docs, dedup_report = deduplicate_documents(docs, existing=existing, state=dedup_state)
+        else:
+            docs, dedup_report = deduplicate_documents(docs, state=dedup_state)
+
+        # 검색 파라미터는 기존 측정값을 유지하고 규모와 중복 제거 집계만 갱신
+        report = dict(load_index_meta(index_dir, version_dir).get("report") or {})
+        previous = report.get("dedup") or {}
+        report["dedup"] = {key: previous.get(key, 0) + value for key, value in dedup_report.items()}
+
+        saved_dir = _new_version_dir(fingerprint, index_dir)
+        if docs:
+            # faiss는 매핑한 인덱스에 벡터를 추가할 수 없으므로 인덱스만 쓰기 가능한 사본으로 읽음
+            index = faiss.read_index(os.path.join(version_dir, INDEX_FILE))
+            for start in range(0, len(docs), batch_size):
+                batch_docs = docs[start:start + batch_size]
+                vectors = np.asarray(
+                    embeddings.embed_documents([doc.page_content for doc in batch_docs]),
+                    dtype=np.float32
+                )
+                index.add(vectors)
+            faiss.write_index(index, os.path.join(saved_dir, INDEX_FILE))
+            report["n_vectors"] = int(index.ntotal)
+            del index
+        else:
+            shutil.copyfile(os.path.join(version_dir, INDEX_FILE), os.path.join(saved_dir, INDEX_FILE))
+        # 기존 문서는 파일을 복사하고 새 문서만 이어서 기록
+        append_docstore(version_dir, saved_dir, docs)
+        dedup_state.save(saved_dir)
+
+        if before_swap:
+            before_swap()
+        _publish_version(saved_dir, fingerprint, report, index_dir)
+    return saved_dir, len(docs)